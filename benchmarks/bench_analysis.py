@@ -0,0 +1,95 @@
+"""Benchmark BPM/key analysis throughput in tracks per core-second.
+
+Runs the ingest analysis over synthetic tracks with known tempo and key
+(or over real MP3s with --files) on a process pool, the same way the
+server's ingest queue does.
+
+    python benchmarks/bench_analysis.py --tracks 32 --seconds 240 --workers 4
+    python benchmarks/bench_analysis.py --files server/songs
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "server"))
+
+from analysis import analyze, PITCH_CLASSES
+from audio import decode_mono, ANALYSIS_SAMPLE_RATE
+
+def synth_track(seed: int, seconds: float, sample_rate: int = ANALYSIS_SAMPLE_RATE):
+    """Percussive noise bursts on the beat over a sustained major triad."""
+    rng = np.random.default_rng(seed)
+    bpm = float(rng.uniform(80, 170))
+    tonic = int(rng.integers(12))
+
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    root = 261.63 * 2 ** (tonic / 12)
+    chord = sum(0.15 * np.sin(2 * np.pi * root * 2 ** (step / 12) * t) for step in (0, 4, 7))
+    envelope = np.exp(-(t % (60.0 / bpm)) * 30)
+    signal = chord * (0.5 + 0.5 * envelope) + rng.standard_normal(t.size) * 0.4 * envelope
+    return signal.astype(np.float32), bpm, f"{PITCH_CLASSES[tonic]} major"
+
+def analyze_synthetic(args):
+    seed, seconds = args
+    samples, bpm, key = synth_track(seed, seconds)
+    start = time.process_time()
+    result = analyze(samples, ANALYSIS_SAMPLE_RATE)
+    return time.process_time() - start, bpm, key, result
+
+def analyze_file(path):
+    start = time.process_time()
+    result = analyze(decode_mono(path), ANALYSIS_SAMPLE_RATE)
+    return time.process_time() - start, None, None, result
+
+def tempo_matches(expected: float, estimated: float) -> bool:
+    return estimated is not None and abs(estimated - expected) / expected < 0.02
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=16, help="synthetic tracks to analyze")
+    parser.add_argument("--seconds", type=float, default=180, help="length of each synthetic track")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--files", help="analyze the MP3s in this directory instead (includes decode)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.files:
+        jobs = [str(path) for path in sorted(Path(args.files).glob("*.mp3"))]
+        worker = analyze_file
+    else:
+        jobs = [(seed, args.seconds) for seed in range(args.tracks)]
+        worker = analyze_synthetic
+    if not jobs:
+        sys.exit("Nothing to analyze")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(worker, jobs))
+    wall = time.perf_counter() - start
+
+    cpu = sum(r[0] for r in results)
+    report = {
+        "tracks": len(results),
+        "workers": args.workers,
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "tracks_per_core_second": round(len(results) / cpu, 2) if cpu else None,
+        "tracks_per_second": round(len(results) / wall, 2),
+    }
+    if not args.files:
+        report["bpm_accuracy"] = sum(tempo_matches(r[1], r[3]["bpm"]) for r in results) / len(results)
+        report["key_accuracy"] = sum(r[2] == r[3]["key"] for r in results) / len(results)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Helpers shared by the benchmark scripts: synthetic MP3s, latency stats,
+local server processes and stored results for regression comparison."""
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SERVER_DIR = ROOT_DIR / "server"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz frame of silence: 417 bytes, 26 ms
+_SILENT_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+_FRAME_SECONDS = 1152 / 44100
+
+def synth_mp3(path: Path, seconds: float = 30, freq: float = 440, title: Optional[str] = None,
+              artist: str = "Benchmark") -> Path:
+    """Write a tagged test MP3.
+
+    Uses ffmpeg to encode a sine tone like server/generate_test_songs.py;
+    without ffmpeg it falls back to silent MPEG frames, which are still
+    valid for tag parsing, listing and transfer benchmarks.
+    """
+    path = Path(path)
+    title = title or path.stem
+    if shutil.which(os.environ.get("FFMPEG_BIN", "ffmpeg")):
+        subprocess.run([
+            os.environ.get("FFMPEG_BIN", "ffmpeg"), "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"sine=frequency={freq}:duration={seconds}",
+            "-codec:a", "libmp3lame", "-qscale:a", "2",
+            "-metadata", f"title={title}", "-metadata", f"artist={artist}",
+            str(path)
+        ], check=True)
+        return path
+
+    from mutagen.id3 import ID3, TIT2, TPE1
+
+    with open(path, "wb") as f:
+        f.write(_SILENT_FRAME * max(1, int(seconds / _FRAME_SECONDS)))
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text=title))
+    tags.add(TPE1(encoding=3, text=artist))
+    tags.save(path)
+    return path
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(50) * 1000, 3),
+        "p95_ms": round(percentile(95) * 1000, 3),
+        "p99_ms": round(percentile(99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def run_server(workdir: Path, env: Optional[Dict[str, str]] = None, port: Optional[int] = None,
+               startup_timeout: float = 60) -> Iterator[str]:
+    """Run the real FastAPI app under uvicorn in a subprocess; yields its base URL.
+
+    Songs and the SQLite database live under ``workdir``.
+    """
+    import httpx
+
+    port = port or free_port()
+    workdir = Path(workdir)
+    (workdir / "songs").mkdir(parents=True, exist_ok=True)
+    server_env = {
+        **os.environ,
+        "SONGS_DIR": str(workdir / "songs"),
+        "DATABASE_URL": f"sqlite:///{workdir / 'bench.db'}",
+        "LOG_LEVEL": "WARNING",
+        # Measure raw throughput, not the per-client download limit
+        "DOWNLOAD_RATE_LIMIT": "0",
+        **(env or {}),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=SERVER_DIR, env=server_env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                if httpx.get(f"{base_url}/health/ready", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("Server did not become ready")
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def save_report(report: dict, name: str, output: Optional[str] = None) -> Path:
+    """Write a report as JSON, by default to benchmarks/results/<name>-<timestamp>.json."""
+    if output:
+        path = Path(output)
+    else:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        path = RESULTS_DIR / f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    path.write_text(json.dumps(report, indent=2))
+    return path
+
+def _flatten(report: dict, prefix: str = "") -> Dict[str, float]:
+    values = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+def _higher_is_better(name: str) -> Optional[bool]:
+    leaf = name.rsplit(".", 1)[-1]
+    if leaf == "seconds" or leaf.endswith(("_ms", "_seconds", "bytes_written", "amplification")):
+        return False
+    if leaf.endswith(("per_second", "_mbps", "rps", "ops")):
+        return True
+    return None  # Counts and settings aren't compared
+
+def compare_reports(current: dict, baseline: dict, threshold: float = 0.10) -> List[str]:
+    """Describe every metric that got worse than the baseline by more than ``threshold``."""
+    regressions = []
+    old = _flatten(baseline)
+    for name, value in _flatten(current).items():
+        direction = _higher_is_better(name)
+        if direction is None or not old.get(name):
+            continue
+        change = (value - old[name]) / old[name]
+        if (change < -threshold) if direction else (change > threshold):
+            regressions.append(f"{name}: {old[name]} -> {value} ({change:+.0%})")
+    return regressions
+
+def report_regressions(report: dict, baseline_path: Optional[str], threshold: float) -> int:
+    """Print the comparison against a stored baseline; returns the number of regressions."""
+    if not baseline_path:
+        return 0
+    regressions = compare_reports(report, json.loads(Path(baseline_path).read_text()), threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) against {baseline_path}:")
+        for line in regressions:
+            print(f"  {line}")
+    else:
+        print(f"\nNo regressions against {baseline_path}")
+    return len(regressions)
@@ -0,0 +1,174 @@
+"""Benchmark the download write path on a FAT32/exFAT filesystem.
+
+Syncs a synthetic library from a stand-in server (in a child process, so
+its socket writes don't count) into a loopback-mounted vfat or exFAT image
+and compares write modes:
+
+  chunked  every 64 KiB network chunk written as it arrives, no preallocation
+  blocks   SYNC_WRITE_BLOCK_KB block-aligned writes, no preallocation
+  flash    block-aligned writes into a file preallocated to the song's size
+
+Each mode fsyncs once per file. Reports MB/s and, on Linux, write syscalls
+per file. Creating the image needs root and mkfs.vfat / mkfs.exfat; pass
+--target to write to an already mounted drive (e.g. a real USB stick).
+
+    sudo python benchmarks/bench_flash_write.py --tracks 50 --track-mb 8 --fs vfat
+    python benchmarks/bench_flash_write.py --target /Volumes/USB --rounds 5
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from bench_common import ROOT_DIR, save_report, report_regressions
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, str(ROOT_DIR / "usb_app"))
+
+from sync_client import SyncClient, SYNC_WRITE_BLOCK_KB  # noqa: E402
+from sync_engine import SyncEngine  # noqa: E402
+from catalogue_client import fetch_songs  # noqa: E402
+
+# mode -> (write block bytes, preallocate)
+MODES = {
+    "chunked": (0, False),
+    "blocks": (SYNC_WRITE_BLOCK_KB * 1024, False),
+    "flash": (SYNC_WRITE_BLOCK_KB * 1024, True),
+}
+MKFS = {"vfat": ["mkfs.vfat", "-F", "32"], "exfat": ["mkfs.exfat"]}
+
+def _serve(tracks: int, track_bytes: int, ready) -> None:
+    from standin_server import StandinServer, make_library
+    with StandinServer(make_library(tracks, os.urandom(track_bytes))) as server:
+        ready.put(server.url)
+        while True:
+            time.sleep(3600)
+
+@contextmanager
+def standin_process(tracks: int, track_bytes: int) -> Iterator[str]:
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    process = context.Process(target=_serve, args=(tracks, track_bytes, ready), daemon=True)
+    process.start()
+    try:
+        yield ready.get(timeout=60)
+    finally:
+        process.terminate()
+        process.join(10)
+
+@contextmanager
+def loopback_image(fs: str, size_mb: int) -> Iterator[Path]:
+    """Mount a fresh ``fs`` image; needs root and the mkfs tool."""
+    if shutil.which(MKFS[fs][0]) is None:
+        sys.exit(f"{MKFS[fs][0]} not found; install it or pass --target")
+    if os.geteuid() != 0:
+        sys.exit("Mounting a loopback image needs root; run with sudo or pass --target")
+    with tempfile.TemporaryDirectory() as tmp:
+        image, mount_point = Path(tmp) / f"drive.{fs}", Path(tmp) / "mnt"
+        mount_point.mkdir()
+        with open(image, "wb") as f:
+            f.truncate(size_mb * 1024 * 1024)
+        subprocess.run(MKFS[fs] + [str(image)], check=True, capture_output=True)
+        subprocess.run(["mount", "-o", "loop", str(image), str(mount_point)], check=True)
+        try:
+            yield mount_point
+        finally:
+            subprocess.run(["umount", str(mount_point)], check=False)
+
+@contextmanager
+def target_dir(target: Optional[str], fs: str, size_mb: int) -> Iterator[Path]:
+    if not target:
+        with loopback_image(fs, size_mb) as mount_point:
+            yield mount_point
+        return
+    path = Path(target) / "bench_flash_write"
+    path.mkdir(exist_ok=True)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def write_syscalls() -> Optional[int]:
+    try:
+        with open("/proc/self/io") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("syscw:"))
+    except OSError:
+        return None
+
+def drop_caches() -> None:
+    os.sync()
+    try:
+        Path("/proc/sys/vm/drop_caches").write_text("3\n")
+    except OSError:
+        pass  # Not root or not Linux; results include warm caches
+
+def bench_mode(url: str, songs: list, target: Path, mode: str, concurrency: int) -> Dict[str, float]:
+    block_size, preallocate = MODES[mode]
+    music_dir, staging_dir = target / "Music", target / ".cache"
+    with SyncClient(url, write_block_size=block_size, preallocate=preallocate) as client:
+        engine = SyncEngine(client, music_dir, staging_dir, staging_dir / "sync_journal.jsonl",
+                            concurrency=concurrency)
+        plan = engine.plan(songs)
+        drop_caches()
+        calls = write_syscalls()
+        start = time.perf_counter()
+        result = engine.run(plan)
+        elapsed = time.perf_counter() - start
+        calls = write_syscalls() - calls if calls is not None else None
+    if result.failed:
+        sys.exit(f"{mode}: {len(result.failed)} downloads failed, e.g. {next(iter(result.failed.items()))}")
+    shutil.rmtree(music_dir)
+    shutil.rmtree(staging_dir)
+    drop_caches()
+    return {
+        "seconds": elapsed,
+        "write_mbps": plan.download_bytes / elapsed / 1e6,
+        "write_calls_per_file": calls / len(songs) if calls is not None else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=50)
+    parser.add_argument("--track-mb", type=float, default=8, help="size of each synthetic track")
+    parser.add_argument("--fs", choices=sorted(MKFS), default="vfat", help="loopback image filesystem")
+    parser.add_argument("--target", help="write to this mounted drive instead of a loopback image")
+    parser.add_argument("--rounds", type=int, default=3, help="runs per mode; the median is reported")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated subset of " + ",".join(MODES))
+    parser.add_argument("--output", help="results file (default: benchmarks/results/bench_flash_write-<time>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    modes = [mode for mode in args.modes.split(",") if mode]
+    track_bytes = int(args.track_mb * 1e6)
+    report = {"settings": vars(args).copy()}
+    image_mb = int(args.tracks * args.track_mb * 1.2) + 64
+    samples = {mode: [] for mode in modes}
+    with standin_process(args.tracks, track_bytes) as url, target_dir(args.target, args.fs, image_mb) as target:
+        songs = fetch_songs(url)
+        for _ in range(args.rounds):
+            for mode in modes:  # Interleaved so drift hits every mode alike
+                samples[mode].append(bench_mode(url, songs, target, mode, args.concurrency))
+
+    for mode, runs in samples.items():
+        report[mode] = {
+            key: statistics.median(run[key] for run in runs) if runs[0][key] is not None else None
+            for key in runs[0]
+        }
+    print(json.dumps(report, indent=2))
+    print(f"Results written to {save_report(report, 'bench_flash_write', args.output)}")
+    if report_regressions(report, args.baseline, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Benchmark the FUSE filesystem (usb_app/usb_filesystem.py) against a stand-in server.
+
+Mounts USBFileSystem in a child process, backed by standin_server.py with
+a chosen link profile, and measures through the kernel:
+
+  * getattr (stat) and readdir (listdir) operations per second
+  * first-byte latency when opening uncached files
+  * sequential and random (4 KiB) read throughput on cached files
+  * aggregate read throughput as reader threads are added
+
+--direct calls the Operations methods in-process instead of mounting, to
+separate the Python layer from kernel and context-switch overhead.
+Needs fusepy and libfuse (macFUSE on macOS).
+
+    python benchmarks/bench_fuse.py --tracks 200 --link lan
+    python benchmarks/bench_fuse.py --threads --concurrency 1,2,4,8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+from bench_common import ROOT_DIR, summarize, synth_mp3, save_report, report_regressions
+from standin_server import LINK_PROFILES, Link, StandinServer, make_library
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, str(ROOT_DIR / "usb_app"))
+
+SEQUENTIAL_CHUNK = 128 * 1024
+RANDOM_CHUNK = 4 * 1024
+
+def _mount(mount_point: str, server_url: str, cache_dir: str, threads: bool) -> None:
+    """Child process: mount like mount_usb_drive, minus allow_other (needs fuse.conf)."""
+    sys.path.insert(0, str(ROOT_DIR / "usb_app"))
+    from fuse import FUSE
+    from log_setup import setup_logging
+    from usb_filesystem import USBFileSystem
+
+    setup_logging()
+    FUSE(USBFileSystem(server_url, cache_dir), mount_point, nothreads=not threads, foreground=True,
+         volname="DJ USB Bench")
+
+class MountedTarget:
+    """File operations through a real mount."""
+
+    def __init__(self, server_url: str, workdir: Path, threads: bool):
+        self.mount_point = workdir / "mnt"
+        self.mount_point.mkdir()
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(
+            target=_mount, args=(str(self.mount_point), server_url, str(workdir / "cache"), threads), daemon=True)
+
+    def __enter__(self) -> "MountedTarget":
+        self.process.start()
+        deadline = time.monotonic() + 30
+        while not os.path.ismount(self.mount_point):
+            if not self.process.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("Filesystem did not mount; is libfuse installed?")
+            time.sleep(0.1)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        command = ["diskutil", "unmount"] if sys.platform == "darwin" else ["fusermount", "-u"]
+        subprocess.run(command + [str(self.mount_point)], check=False, capture_output=True)
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def stat(self, name: str) -> None:
+        os.stat(self.mount_point / name)
+
+    def listdir(self) -> List[str]:
+        return os.listdir(self.mount_point)
+
+    def open(self, name: str):
+        return open(self.mount_point / name, "rb", buffering=0)
+
+class _DirectFile:
+    def __init__(self, fs, path: str):
+        self.fs = fs
+        self.path = path
+        self.offset = 0
+        fs.open(path, os.O_RDONLY)
+
+    def read(self, size: int) -> bytes:
+        data = self.fs.read(self.path, size, self.offset, 0)
+        self.offset += len(data)
+        return data
+
+    def seek(self, offset: int) -> None:
+        self.offset = offset
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+class DirectTarget:
+    """Calls the Operations methods in-process, bypassing the kernel."""
+
+    def __init__(self, server_url: str, workdir: Path, threads: bool):
+        from usb_filesystem import USBFileSystem
+        self.fs = USBFileSystem(server_url, str(workdir / "cache"))
+
+    def __enter__(self) -> "DirectTarget":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def stat(self, name: str) -> None:
+        self.fs.getattr(f"/{name}")
+
+    def listdir(self) -> List[str]:
+        return self.fs.readdir("/", None)
+
+    def open(self, name: str) -> _DirectFile:
+        return _DirectFile(self.fs, f"/{name}")
+
+def ops_per_second(operation, seconds: float) -> float:
+    done = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        operation()
+        done += 1
+    return round(done / (time.perf_counter() - start), 1)
+
+def read_sequential(target, name: str) -> int:
+    total = 0
+    with target.open(name) as f:
+        while chunk := f.read(SEQUENTIAL_CHUNK):
+            total += len(chunk)
+    return total
+
+def run(target, names: List[str], args) -> dict:
+    rng = random.Random(0)
+    uncached = names[:args.first_byte]
+    warm = names[args.first_byte:]
+    report = {}
+
+    report["getattr_ops"] = ops_per_second(lambda: target.stat(rng.choice(names)), args.seconds)
+    report["readdir_ops"] = ops_per_second(target.listdir, args.seconds)
+
+    latencies = []
+    for name in uncached:
+        start = time.perf_counter()
+        with target.open(name) as f:
+            f.read(1)
+        latencies.append(time.perf_counter() - start)
+    report["first_byte"] = summarize(latencies)
+
+    # Everything below reads files that are already in the local cache
+    for name in warm:
+        read_sequential(target, name)
+
+    start = time.perf_counter()
+    total = sum(read_sequential(target, name) for name in warm)
+    report["sequential_read_mbps"] = round(total / (time.perf_counter() - start) / 1e6, 2)
+
+    size = len(next(iter(args.library.values())).data)
+    with target.open(warm[0]) as f:
+        def random_read():
+            f.seek(rng.randrange(0, max(1, size - RANDOM_CHUNK)))
+            f.read(RANDOM_CHUNK)
+        random_ops = ops_per_second(random_read, args.seconds)
+    report["random_read_ops"] = random_ops
+    report["random_read_mbps"] = round(random_ops * RANDOM_CHUNK / 1e6, 2)
+
+    report["concurrency"] = {}
+    for level in (int(c) for c in args.concurrency.split(",")):
+        read = [0] * level
+        deadline = time.perf_counter() + args.seconds
+
+        def reader(slot: int) -> None:
+            i = slot
+            while time.perf_counter() < deadline:
+                read[slot] += read_sequential(target, warm[i % len(warm)])
+                i += level
+
+        threads = [threading.Thread(target=reader, args=(slot,)) for slot in range(level)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report["concurrency"][f"c{level}"] = {
+            "read_mbps": round(sum(read) / (time.perf_counter() - start) / 1e6, 2)
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=100, help="library size")
+    parser.add_argument("--song-seconds", type=float, default=60, help="length of each synthetic track")
+    parser.add_argument("--first-byte", type=int, default=10, help="uncached files opened for first-byte latency")
+    parser.add_argument("--seconds", type=float, default=2, help="duration of each timed loop")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="reader thread counts")
+    parser.add_argument("--link", choices=sorted(LINK_PROFILES), default="lan")
+    parser.add_argument("--threads", action="store_true", help="mount multi-threaded (default mirrors nothreads=True)")
+    parser.add_argument("--direct", action="store_true", help="call the Operations methods without mounting")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/bench_fuse-<time>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+    if args.tracks <= args.first_byte:
+        parser.error("--tracks must exceed --first-byte")
+
+    settings = vars(args).copy()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        template = synth_mp3(tmp / "template.mp3", seconds=args.song_seconds).read_bytes()
+        args.library = make_library(args.tracks, template)
+        target_class = DirectTarget if args.direct else MountedTarget
+        with StandinServer(args.library, Link.from_profile(args.link)) as server:
+            with target_class(server.url, tmp, args.threads) as target:
+                report = {"settings": settings, **run(target, sorted(args.library), args)}
+
+    print(json.dumps(report, indent=2))
+    print(f"Results written to {save_report(report, 'bench_fuse', args.output)}")
+    if report_regressions(report, args.baseline, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
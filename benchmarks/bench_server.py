@@ -0,0 +1,253 @@
+"""Benchmark the server API against a local instance with a synthetic library.
+
+Starts the real app under uvicorn (SQLite, temporary songs directory) and
+measures:
+
+  * /songs latency (JSON stream and compressed msgpack) against library size
+  * upload throughput at several concurrency levels
+  * full and ranged song download throughput
+  * authenticated request rate on /auth/me, and login rate
+
+Results go to benchmarks/results/ (or --output); pass a previous results
+file as --baseline to flag regressions.
+
+    python benchmarks/bench_server.py --sizes 100,1000,10000
+    python benchmarks/bench_server.py --baseline benchmarks/results/bench_server-20240101-120000.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from bench_common import SERVER_DIR, summarize, synth_mp3, run_server, save_report, report_regressions
+
+sys.path.insert(0, str(SERVER_DIR))
+
+RANGE_SIZE = 256 * 1024
+
+def seed_library(workdir: Path, count: int, template: Path) -> None:
+    """Fill the catalogue with ``count`` ingested songs, hard-linked to one template file.
+
+    Rows are bulk inserted instead of uploaded, so large libraries take
+    seconds to build; the links match the recorded size and mtime, so the
+    server's startup reconcile leaves them alone.
+    """
+    from sqlalchemy import insert, update
+
+    from database import build_engine
+    from migrations import run_migrations
+    from metadata_index import songs_table, state_table, STATUS_READY
+
+    songs_dir = workdir / "songs"
+    songs_dir.mkdir(parents=True, exist_ok=True)
+    stat = template.stat()
+    keys = [("C major", "8B"), ("A minor", "8A"), ("G major", "9B"), ("E minor", "9A")]
+    rng = random.Random(count)
+
+    rows = []
+    for i in range(count):
+        filename = f"track_{i:06d}.mp3"
+        os.link(template, songs_dir / filename)
+        key, camelot = keys[i % len(keys)]
+        record = {
+            "filename": filename,
+            "title": f"Track {i} {rng.choice(['Deep', 'Acid', 'Vocal', 'Dub'])} Mix",
+            "artist": f"Artist {i % 500}",
+            "album": f"Album {i % 2000}",
+            "duration": 180 + i % 240,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "status": STATUS_READY,
+            "bpm": round(rng.uniform(80, 170), 1),
+            "key": key,
+            "camelot": camelot,
+            "waveform": False,
+            "queued_at": time.time(),
+            "ingested_at": time.time(),
+        }
+        rows.append({
+            "filename": filename, "status": STATUS_READY, "record": json.dumps(record),
+            "version": i + 1, "deleted": False, "updated_at": time.time()
+        })
+
+    engine = build_engine(f"sqlite:///{workdir / 'bench.db'}")
+    run_migrations(engine)
+    with engine.begin() as conn:
+        if rows:
+            conn.execute(insert(songs_table), rows)
+        conn.execute(update(state_table).where(state_table.c.id == 1).values(generation=count))
+    engine.dispose()
+
+async def bench_listing(client: httpx.AsyncClient, requests: int) -> dict:
+    results = {}
+    variants = {
+        "json": {"Accept": "application/json", "Accept-Encoding": "identity"},
+        "json_gzip": {"Accept": "application/json", "Accept-Encoding": "gzip"},
+        "msgpack_br": {"Accept": "application/x-msgpack", "Accept-Encoding": "br, gzip"},
+    }
+    for name, headers in variants.items():
+        latencies = []
+        size = 0
+        for _ in range(requests):
+            start = time.perf_counter()
+            async with client.stream("GET", "/songs", headers=headers) as response:
+                response.raise_for_status()
+                size = sum([len(chunk) async for chunk in response.aiter_raw()])
+            latencies.append(time.perf_counter() - start)
+        results[name] = {**summarize(latencies), "wire_bytes": size}
+    return results
+
+async def bench_uploads(client: httpx.AsyncClient, song: Path, uploads: int, concurrency: int) -> dict:
+    token = (await client.post("/auth/token")).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    data = song.read_bytes()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def upload(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/upload", headers=headers,
+                files={"file": (f"upload_{concurrency}_{i}.mp3", data, "audio/mpeg")}
+            )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(upload(i) for i in range(uploads)))
+    wall = time.perf_counter() - start
+
+    # Stay under the free tier song limit for the next round
+    for i in range(uploads):
+        await client.delete(f"/songs/upload_{concurrency}_{i}.mp3", headers=headers)
+
+    return {
+        **summarize(latencies),
+        "uploads_per_second": round(uploads / wall, 2),
+        "upload_mbps": round(len(data) * uploads / wall / 1e6, 2),
+    }
+
+async def bench_downloads(client: httpx.AsyncClient, filename: str, size: int, requests: int,
+                          concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def random_range() -> dict:
+        offset = random.randrange(0, max(1, size - RANGE_SIZE))
+        return {"Range": f"bytes={offset}-{offset + RANGE_SIZE - 1}"}
+
+    async def fetch(headers: dict, latencies: list) -> int:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(f"/songs/{filename}", headers=headers)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+            return len(response.content)
+
+    results = {}
+    for name, make_headers in (("full", dict), ("range", random_range)):
+        latencies = []
+        start = time.perf_counter()
+        received = sum(await asyncio.gather(*(fetch(make_headers(), latencies) for _ in range(requests))))
+        wall = time.perf_counter() - start
+        results[name] = {**summarize(latencies), "download_mbps": round(received / wall / 1e6, 2)}
+    return results
+
+async def bench_auth(client: httpx.AsyncClient, seconds: float, concurrency: int, logins: int) -> dict:
+    email = f"bench-{time.time_ns()}@example.com"
+    response = await client.post("/auth/signup", json={"email": email, "password": "benchmark", "name": "Bench"})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    done = 0
+    deadline = time.perf_counter() + seconds
+
+    async def hammer() -> None:
+        nonlocal done
+        while time.perf_counter() < deadline:
+            (await client.get("/auth/me", headers=headers)).raise_for_status()
+            done += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(hammer() for _ in range(concurrency)))
+    me_rps = done / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client.post("/auth/login", data={"username": email, "password": "benchmark"}) for _ in range(logins)
+    ))
+    login_rps = logins / (time.perf_counter() - start)
+    return {"me_rps": round(me_rps, 1), "login_rps": round(login_rps, 2)}
+
+def client_for(base_url: str, concurrency: int) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    return httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits)
+
+async def run(args) -> dict:
+    report = {"settings": vars(args).copy(), "songs_latency": {}, "uploads": {}, "downloads": {}, "auth": {}}
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as tmp:
+        tmp = Path(tmp)
+        upload_song = synth_mp3(tmp / "upload.mp3", seconds=args.song_seconds, title="Upload")
+        range_song = synth_mp3(tmp / "range.mp3", seconds=args.song_seconds * 2, title="Range")
+        template = synth_mp3(tmp / "template.mp3", seconds=5, title="Template")
+
+        # Uploads, downloads and auth against an otherwise empty library
+        workdir = tmp / "empty"
+        (workdir / "songs").mkdir(parents=True)
+        os.link(range_song, workdir / "songs" / "range_test.mp3")
+        with run_server(workdir) as base_url:
+            for concurrency in levels:
+                async with client_for(base_url, concurrency) as client:
+                    report["uploads"][f"c{concurrency}"] = await bench_uploads(
+                        client, upload_song, args.uploads, concurrency)
+                    report["downloads"][f"c{concurrency}"] = await bench_downloads(
+                        client, "range_test.mp3", range_song.stat().st_size, args.requests, concurrency)
+                    report["auth"][f"c{concurrency}"] = await bench_auth(
+                        client, args.auth_seconds, concurrency, args.logins)
+                print(f"concurrency {concurrency}: done", file=sys.stderr)
+
+        # Catalogue listing against growing libraries
+        for size in (int(s) for s in args.sizes.split(",")):
+            workdir = tmp / f"library_{size}"
+            seed_library(workdir, size, template)
+            with run_server(workdir) as base_url:
+                async with client_for(base_url, 1) as client:
+                    report["songs_latency"][str(size)] = await bench_listing(client, args.requests)
+            print(f"library {size}: done", file=sys.stderr)
+
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000", help="library sizes for /songs latency")
+    parser.add_argument("--requests", type=int, default=20, help="requests per measurement")
+    parser.add_argument("--uploads", type=int, default=20, help="uploads per concurrency level (max 24)")
+    parser.add_argument("--concurrency", default="1,4,16", help="client concurrency levels")
+    parser.add_argument("--song-seconds", type=float, default=180, help="length of uploaded test songs")
+    parser.add_argument("--auth-seconds", type=float, default=3, help="duration of each /auth/me run")
+    parser.add_argument("--logins", type=int, default=8, help="logins per concurrency level")
+    parser.add_argument("--workdir", help="parent directory for temporary libraries")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/bench_server-<time>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+    if args.uploads > 24:
+        parser.error("--uploads must stay below the free tier song limit")
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    print(f"Results written to {save_report(report, 'bench_server', args.output)}")
+    if report_regressions(report, args.baseline, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""Benchmark client-side sync against a local stand-in server.
+
+Runs USBManager.sync (full, no-op and incremental), VirtualDrive cold and
+warm reads and, when a display is available, the GUI's sync loop against
+standin_server.py with a chosen link profile. The target "USB drive" is a
+temporary directory whose writes are throttled to a drive profile and
+counted, so write amplification (e.g. metadata rewritten per song) shows
+up next to tracks/s and MB/s.
+
+    python benchmarks/bench_sync.py --tracks 200 --link broadband --drive usb2
+    python benchmarks/bench_sync.py --baseline benchmarks/results/bench_sync-20240101-120000.json
+"""
+import argparse
+import builtins
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+
+from bench_common import ROOT_DIR, synth_mp3, save_report, report_regressions
+from standin_server import LINK_PROFILES, Link, StandinServer, make_library
+
+# Per-song INFO logs would dominate small-file timings
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, str(ROOT_DIR / "usb_app"))
+
+# name -> (write MB/s, latency per file open in ms, latency per fsync in ms); 0 is unthrottled
+DRIVE_PROFILES = {
+    "none": (0, 0, 0),
+    "usb3": (60, 0.5, 5),
+    "usb2": (10, 2, 20),
+    "sdcard": (5, 5, 30),
+}
+
+class ThrottledDrive:
+    """Counts and throttles writes to files under ``root``.
+
+    While active, builtins.open hands out wrappers for files opened for
+    writing below ``root`` and os.fsync on their descriptors is delayed.
+    shutil's sendfile fast path is disabled so copies go through write().
+    """
+
+    def __init__(self, root: Path, profile: str = "none"):
+        self.root = str(Path(root).resolve())
+        mbps, open_ms, fsync_ms = DRIVE_PROFILES[profile]
+        self.bandwidth = mbps * 1e6
+        self.open_latency = open_ms / 1000
+        self.fsync_latency = fsync_ms / 1000
+        self.bytes_written = 0
+        self.files_opened = 0
+        self.fsyncs = 0
+        self._fds = set()
+        self._lock = threading.Lock()
+        self._next_free = time.monotonic()
+
+    def _throttle(self, size: int) -> None:
+        with self._lock:
+            self.bytes_written += size
+            if not self.bandwidth:
+                return
+            now = time.monotonic()
+            self._next_free = max(self._next_free, now) + size / self.bandwidth
+            wait = self._next_free - now
+        if wait > 0:
+            time.sleep(wait)
+
+    def _on_drive(self, file) -> bool:
+        if not isinstance(file, (str, os.PathLike)):
+            return False
+        return os.path.abspath(os.fspath(file)).startswith(self.root + os.sep)
+
+    @contextmanager
+    def active(self) -> Iterator["ThrottledDrive"]:
+        real_open, real_fsync = builtins.open, os.fsync
+        drive = self
+
+        class DriveFile:
+            def __init__(self, raw):
+                self._raw = raw
+
+            def write(self, data):
+                drive._throttle(len(data))
+                return self._raw.write(data)
+
+            def writelines(self, lines):
+                for line in lines:
+                    self.write(line)
+
+            def __getattr__(self, name):
+                return getattr(self._raw, name)
+
+            def __iter__(self):
+                return iter(self._raw)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                drive._fds.discard(self._raw.fileno())
+                self._raw.__exit__(*exc)
+
+        def drive_open(file, mode="r", *args, **kwargs):
+            raw = real_open(file, mode, *args, **kwargs)
+            if any(flag in mode for flag in "wax+") and self._on_drive(file):
+                with self._lock:
+                    self.files_opened += 1
+                    self._fds.add(raw.fileno())
+                if self.open_latency:
+                    time.sleep(self.open_latency)
+                return DriveFile(raw)
+            return raw
+
+        def drive_fsync(fd):
+            real_fsync(fd)
+            if fd in self._fds:
+                with self._lock:
+                    self.fsyncs += 1
+                if self.fsync_latency:
+                    time.sleep(self.fsync_latency)
+
+        use_sendfile = shutil._USE_CP_SENDFILE
+        builtins.open, os.fsync, shutil._USE_CP_SENDFILE = drive_open, drive_fsync, False
+        try:
+            yield self
+        finally:
+            builtins.open, os.fsync, shutil._USE_CP_SENDFILE = real_open, real_fsync, use_sendfile
+
+    def snapshot(self) -> tuple:
+        return self.bytes_written, self.files_opened, self.fsyncs
+
+def measure(name: str, server: StandinServer, drive: ThrottledDrive, tracks: int,
+            library_bytes: int, run: Callable[[], None]) -> dict:
+    sent_before = server.bytes_sent
+    written_before, opened_before, fsyncs_before = drive.snapshot()
+    start = time.perf_counter()
+    with drive.active():
+        run()
+    seconds = time.perf_counter() - start
+    written = drive.bytes_written - written_before
+    downloaded = server.bytes_sent - sent_before
+
+    result = {
+        "tracks": tracks,
+        "seconds": round(seconds, 3),
+        "tracks_per_second": round(tracks / seconds, 2) if tracks else None,
+        "download_mbps": round(downloaded / seconds / 1e6, 2),
+        "bytes_downloaded": downloaded,
+        "drive_bytes_written": written,
+        "drive_files_opened": drive.files_opened - opened_before,
+        "drive_fsyncs": drive.fsyncs - fsyncs_before,
+        "write_amplification": round(written / library_bytes, 3) if library_bytes else None,
+    }
+    print(f"{name}: {result['seconds']}s, {result['tracks_per_second']} tracks/s, "
+          f"{result['download_mbps']} MB/s, {written} bytes written", file=sys.stderr)
+    return result
+
+def bench_usb_manager(server: StandinServer, workdir: Path, drive_profile: str, extra: int) -> dict:
+    from usb_manager import USBManager
+
+    usb_path = workdir / "usb_manager"
+    usb_path.mkdir()
+    drive = ThrottledDrive(usb_path, drive_profile)
+    tracks = len(server.library)
+    library_bytes = sum(len(t.data) for t in server.library.values())
+    results = {}
+
+    with drive.active():
+        manager = USBManager(str(usb_path), server.url)
+    results["full_sync"] = measure("usb_manager full sync", server, drive, tracks, library_bytes, manager.sync)
+    results["noop_sync"] = measure("usb_manager no-op sync", server, drive, 0, 0, manager.sync)
+
+    template = next(iter(server.library.values())).data
+    server.library.update(make_library(extra, template, prefix="new"))
+    results["incremental_sync"] = measure(
+        "usb_manager incremental sync", server, drive, extra, extra * len(template), manager.sync)
+    for filename in [name for name in server.library if name.startswith("new_")]:
+        del server.library[filename]
+    return results
+
+def bench_virtual_drive(server: StandinServer, workdir: Path, drive_profile: str) -> dict:
+    from virtual_drive import VirtualDrive
+
+    cache_dir = workdir / "virtual_drive"
+    cache_dir.mkdir()
+    drive = ThrottledDrive(cache_dir, drive_profile)
+    tracks = len(server.library)
+    library_bytes = sum(len(t.data) for t in server.library.values())
+    results = {}
+
+    with drive.active():
+        vdrive = VirtualDrive(server.url, str(cache_dir))
+
+    def read_all():
+        for song in vdrive.list_songs():
+            vdrive.get_song_path(song.filename)
+
+    results["cold_reads"] = measure("virtual_drive cold reads", server, drive, tracks, library_bytes, read_all)
+    results["warm_reads"] = measure("virtual_drive warm reads", server, drive, tracks, 0, read_all)
+    results["refresh"] = measure("virtual_drive refresh", server, drive, tracks, 0, vdrive.refresh_song_list)
+    return results
+
+def bench_gui(server: StandinServer, workdir: Path, drive_profile: str) -> dict:
+    """The GUI's sync loop on a hidden Tk root; skipped without a display."""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print(f"Skipping GUI sync: {e}", file=sys.stderr)
+        return {}
+    root.withdraw()
+
+    import gui_sync_app
+
+    usb_path = workdir / "gui"
+    usb_path.mkdir()
+    drive = ThrottledDrive(usb_path, drive_profile)
+    tracks = len(server.library)
+    library_bytes = sum(len(t.data) for t in server.library.values())
+
+    gui_sync_app.SERVER_URL = server.url
+    gui_sync_app.messagebox.showinfo = lambda *args, **kwargs: None  # Modal dialog at the end
+    app = gui_sync_app.USBSyncApp(root)
+    app.usb_path = usb_path
+    try:
+        return {"full_sync": measure("gui full sync", server, drive, tracks, library_bytes, app.sync_usb)}
+    finally:
+        root.destroy()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=100, help="library size")
+    parser.add_argument("--song-seconds", type=float, default=60, help="length of each synthetic track")
+    parser.add_argument("--extra", type=int, default=10, help="tracks added before the incremental sync")
+    parser.add_argument("--link", choices=sorted(LINK_PROFILES), default="lan")
+    parser.add_argument("--latency-ms", type=float, help="override the link profile's latency")
+    parser.add_argument("--bandwidth-mbps", type=float, help="override the link profile's bandwidth (Mbit/s)")
+    parser.add_argument("--drive", choices=sorted(DRIVE_PROFILES), default="usb2")
+    parser.add_argument("--skip", default="", help="comma-separated: usb_manager,virtual_drive,gui")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/bench_sync-<time>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    link = Link.from_profile(args.link)
+    if args.latency_ms is not None:
+        link.latency = args.latency_ms / 1000
+    if args.bandwidth_mbps is not None:
+        link.bandwidth = args.bandwidth_mbps * 1e6 / 8
+    skip = set(filter(None, args.skip.split(",")))
+
+    report = {"settings": vars(args).copy()}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        template = synth_mp3(tmp / "template.mp3", seconds=args.song_seconds).read_bytes()
+        report["settings"]["track_bytes"] = len(template)
+        with StandinServer(make_library(args.tracks, template), link) as server:
+            if "usb_manager" not in skip:
+                report["usb_manager"] = bench_usb_manager(server, tmp, args.drive, args.extra)
+            if "virtual_drive" not in skip:
+                report["virtual_drive"] = bench_virtual_drive(server, tmp, args.drive)
+            if "gui" not in skip:
+                report["gui"] = bench_gui(server, tmp, args.drive)
+
+    print(json.dumps(report, indent=2))
+    print(f"Results written to {save_report(report, 'bench_sync', args.output)}")
+    if report_regressions(report, args.baseline, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
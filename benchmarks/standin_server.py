@@ -0,0 +1,205 @@
+"""Local stand-in for the server API with link latency and bandwidth shaping.
+
+Serves a synthetic library from memory: GET /songs (JSON, or the columnar
+msgpack catalogue when asked for) and GET /songs/{filename} with Range
+support. Every response waits ``latency`` seconds first, and all response
+bodies share one token bucket of ``bandwidth`` bytes per second, the way
+a single uplink would.
+
+    python benchmarks/standin_server.py --tracks 500 --profile broadband --port 8765
+"""
+import argparse
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from bench_common import SERVER_DIR, free_port
+
+sys.path.insert(0, str(SERVER_DIR))
+
+# name -> (one-way latency in ms, bandwidth in Mbit/s; 0 is unlimited)
+LINK_PROFILES = {
+    "local": (0, 0),
+    "lan": (1, 500),
+    "broadband": (20, 50),
+    "mobile": (80, 8),
+}
+
+CHUNK_SIZE = 16 * 1024
+
+@dataclass
+class Track:
+    filename: str
+    data: bytes
+    metadata: dict
+
+class Link:
+    """Shared token bucket: every response body competes for the same bandwidth."""
+
+    def __init__(self, latency: float = 0.0, bandwidth: float = 0.0):
+        self.latency = latency
+        self.bandwidth = bandwidth  # bytes per second, 0 for unlimited
+        self._lock = threading.Lock()
+        self._next_free = time.monotonic()
+
+    @classmethod
+    def from_profile(cls, name: str) -> "Link":
+        latency_ms, mbps = LINK_PROFILES[name]
+        return cls(latency_ms / 1000, mbps * 1e6 / 8)
+
+    def send(self, wfile, data: bytes) -> None:
+        for start in range(0, len(data), CHUNK_SIZE):
+            chunk = data[start:start + CHUNK_SIZE]
+            if self.bandwidth:
+                with self._lock:
+                    now = time.monotonic()
+                    self._next_free = max(self._next_free, now) + len(chunk) / self.bandwidth
+                    wait = self._next_free - now
+                if wait > 0:
+                    time.sleep(wait)
+            wfile.write(chunk)
+
+def make_library(count: int, template: bytes, prefix: str = "track") -> Dict[str, Track]:
+    """``count`` tracks sharing one audio payload, each with distinct metadata."""
+    library = {}
+    sha256 = hashlib.sha256(template).hexdigest()
+    for i in range(count):
+        filename = f"{prefix}_{i:06d}.mp3"
+        library[filename] = Track(filename, template, {
+            "filename": filename,
+            "title": f"Track {i}",
+            "artist": f"Artist {i % 200}",
+            "album": f"Album {i % 1000}",
+            "duration": 180 + i % 240,
+            "size": len(template),
+            "sha256": sha256,
+            "bpm": 80 + i % 90,
+        })
+    return library
+
+class StandinServer:
+    """Runs the stand-in on a background thread; use as a context manager."""
+
+    def __init__(self, library: Dict[str, Track], link: Optional[Link] = None, port: Optional[int] = None):
+        self.library = library
+        self.link = link or Link()
+        self.requests = 0
+        self.bytes_sent = 0
+        self._counter_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port or free_port()), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self) -> "StandinServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, sent: int) -> None:
+        with self._counter_lock:
+            self.requests += 1
+            self.bytes_sent += sent
+
+    def catalogue(self) -> List[dict]:
+        return [{**track.metadata, "url": f"{self.url}/songs/{name}"} for name, track in sorted(self.library.items())]
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+def _make_handler(server: StandinServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None) -> None:
+            if server.link.latency:
+                time.sleep(server.link.latency)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            if self.command != "HEAD":
+                server.link.send(self.wfile, body)
+            server.count(len(body))
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/songs":
+                return self._catalogue()
+            if path.startswith("/songs/"):
+                return self._song(path[len("/songs/"):])
+            if path in ("/health", "/health/live", "/health/ready"):
+                return self._reply(200, b'{"status":"healthy"}', "application/json")
+            self._reply(404, b'{"detail":"Not Found"}', "application/json")
+
+        def _catalogue(self):
+            songs = server.catalogue()
+            if "application/x-msgpack" in self.headers.get("Accept", ""):
+                try:
+                    from catalogue import encode_columnar
+                    body = encode_columnar(songs, f"{server.url}/songs/")
+                    return self._reply(200, body, "application/x-msgpack")
+                except ImportError:
+                    pass
+            self._reply(200, json.dumps({"songs": songs}).encode(), "application/json")
+
+        def _song(self, filename: str):
+            track = server.library.get(filename)
+            if track is None:
+                return self._reply(404, b'{"detail":"Song not found"}', "application/json")
+            data = track.data
+            match = _RANGE.fullmatch(self.headers.get("Range", "").strip())
+            if match and (match.group(1) or match.group(2)):
+                if match.group(1):
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+                else:
+                    start, end = max(0, len(data) - int(match.group(2))), len(data) - 1
+                if start >= len(data):
+                    return self._reply(416, b"", "audio/mpeg", {"Content-Range": f"bytes */{len(data)}"})
+                return self._reply(206, data[start:end + 1], "audio/mpeg", {
+                    "Content-Range": f"bytes {start}-{end}/{len(data)}", "Accept-Ranges": "bytes"
+                })
+            self._reply(200, data, "audio/mpeg", {"Accept-Ranges": "bytes"})
+
+    return Handler
+
+def main():
+    from bench_common import synth_mp3
+    import tempfile
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=100)
+    parser.add_argument("--song-seconds", type=float, default=180)
+    parser.add_argument("--profile", choices=sorted(LINK_PROFILES), default="local")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = synth_mp3(Path(tmp) / "template.mp3", seconds=args.song_seconds).read_bytes()
+    with StandinServer(make_library(args.tracks, template), Link.from_profile(args.profile), args.port) as server:
+        print(f"Serving {args.tracks} tracks at {server.url} ({args.profile} link); Ctrl+C to stop")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
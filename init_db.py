@@ -1,8 +1,14 @@
-from server.database import Base, engine
+import sys
+from pathlib import Path
+
+# Server modules import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).parent / "server"))
+
+from migrations import run_migrations
 
 def init_database():
-    Base.metadata.create_all(bind=engine)
-    print("Database initialized successfully!")
+    version = run_migrations()
+    print(f"Database initialized successfully (schema version {version})!")
 
 if __name__ == "__main__":
     init_database()
@@ -10,8 +10,22 @@ root_dir = Path(__file__).parent.absolute()
 packages_dir = root_dir / "server" / "static_web" / "downloads" / "packages"
 os.makedirs(packages_dir, exist_ok=True)
 
-# Source script
+# Source script and the sync modules it imports
 source_script = root_dir / "server" / "static_web" / "downloads" / "dj_usb_tool.py"
+sync_modules = [root_dir / "usb_app" / name for name in ("sync_client.py", "sync_engine.py", "catalogue_client.py", "progress.py")]
+# Modules the server shares with the USB client; usb_app holds the source
+server_modules = [root_dir / "usb_app" / "log_setup.py"]
+
+def copy_scripts(target_dir):
+    """Copy the tool and its sync modules into a package directory"""
+    shutil.copy(source_script, target_dir / "dj_usb_tool.py")
+    for module in sync_modules:
+        shutil.copy(module, target_dir / module.name)
+
+def copy_server_modules():
+    """Refresh the server's copies of the shared modules"""
+    for module in server_modules:
+        shutil.copy(module, root_dir / "server" / module.name)
 
 def create_windows_package():
     """Create Windows executable and installer"""
@@ -29,8 +43,8 @@ def create_windows_package():
         f.write("python \"%~dp0dj_usb_tool.py\" sync\n")
         f.write("pause\n")
     
-    # Copy Python script
-    shutil.copy(source_script, win_dir / "dj_usb_tool.py")
+    # Copy Python scripts
+    copy_scripts(win_dir)
     
     # Create README
     with open(win_dir / "README.txt", "w") as f:
@@ -40,8 +54,8 @@ def create_windows_package():
         f.write("1. Copy this entire folder to your USB drive\n")
         f.write("2. Double-click on DJ_USB_Tool.bat to start syncing\n\n")
         f.write("Requirements:\n")
-        f.write("- Python 3.6 or higher installed\n")
-        f.write("- Python 'requests' package (run 'pip install requests' if needed)\n")
+        f.write("- Python 3.9 or higher installed\n")
+        f.write("- Python 'httpx' package (run 'pip install httpx' if needed)\n")
     
     # Create ZIP file
     zip_file = packages_dir / "DJ_USB_Tool_Windows.zip"
@@ -73,8 +87,8 @@ def create_mac_package():
     # Make shell script executable
     os.chmod(shell_script, 0o755)
     
-    # Copy Python script
-    shutil.copy(source_script, mac_dir / "dj_usb_tool.py")
+    # Copy Python scripts
+    copy_scripts(mac_dir)
     
     # Create README
     with open(mac_dir / "README.txt", "w") as f:
@@ -85,8 +99,8 @@ def create_mac_package():
         f.write("2. Double-click on DJ_USB_Tool.command to start syncing\n"
                 "   (If it doesn't open, right-click and select Open)\n\n")
         f.write("Requirements:\n")
-        f.write("- Python 3.6 or higher installed\n")
-        f.write("- Python 'requests' package (run 'pip3 install requests' if needed)\n")
+        f.write("- Python 3.9 or higher installed\n")
+        f.write("- Python 'httpx' package (run 'pip3 install httpx' if needed)\n")
     
     # Create ZIP file
     zip_file = packages_dir / "DJ_USB_Tool_macOS.zip"
@@ -118,8 +132,8 @@ def create_linux_package():
     # Make shell script executable
     os.chmod(shell_script, 0o755)
     
-    # Copy Python script
-    shutil.copy(source_script, linux_dir / "dj_usb_tool.py")
+    # Copy Python scripts
+    copy_scripts(linux_dir)
     
     # Create README
     with open(linux_dir / "README.txt", "w") as f:
@@ -130,8 +144,8 @@ def create_linux_package():
         f.write("2. Right-click DJ_USB_Tool.sh and select 'Run as Program'\n")
         f.write("   or open terminal and run: ./DJ_USB_Tool.sh\n\n")
         f.write("Requirements:\n")
-        f.write("- Python 3.6 or higher installed\n")
-        f.write("- Python 'requests' package (run 'pip3 install requests' if needed)\n")
+        f.write("- Python 3.9 or higher installed\n")
+        f.write("- Python 'httpx' package (run 'pip3 install httpx' if needed)\n")
     
     # Create ZIP file
     zip_file = packages_dir / "DJ_USB_Tool_Linux.zip"
@@ -144,6 +158,7 @@ def create_linux_package():
 
 def main():
     print("Creating platform packages...")
+    copy_server_modules()
     
     # Create packages for all platforms
     win_path = create_windows_package()
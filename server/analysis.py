@@ -0,0 +1,129 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+# STFT settings shared by tempo and key detection
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+# Frames transformed per FFT batch; bounds memory on long mixes
+BLOCK_FRAMES = 1024
+
+MIN_BPM = 70.0
+MAX_BPM = 180.0
+
+# Chroma is taken from this band; below it the bins are too coarse to
+# separate semitones, above it harmonics blur the pitch classes
+CHROMA_MIN_HZ = 65.0
+CHROMA_MAX_HZ = 2100.0
+
+PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+# Krumhansl-Kessler key profiles, tonic first
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+# Camelot wheel positions indexed by tonic pitch class
+CAMELOT_MAJOR = ["8B", "3B", "10B", "5B", "12B", "7B", "2B", "9B", "4B", "11B", "6B", "1B"]
+CAMELOT_MINOR = ["5A", "12A", "7A", "2A", "9A", "4A", "11A", "6A", "1A", "8A", "3A", "10A"]
+
+def _key_templates() -> np.ndarray:
+    """24 z-scored key profiles: 12 major then 12 minor rotations."""
+    rows = [np.roll(MAJOR_PROFILE, tonic) for tonic in range(12)]
+    rows += [np.roll(MINOR_PROFILE, tonic) for tonic in range(12)]
+    templates = np.array(rows)
+    templates -= templates.mean(axis=1, keepdims=True)
+    return templates / templates.std(axis=1, keepdims=True)
+
+KEY_TEMPLATES = _key_templates()
+
+def spectral_features(samples: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the onset strength envelope and the summed chroma vector.
+
+    Both come from a single pass of STFT batches so the spectrum is never
+    held in memory for the whole track.
+    """
+    if samples.size < FRAME_SIZE:
+        samples = np.pad(samples, (0, FRAME_SIZE - samples.size))
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+
+    freqs = np.fft.rfftfreq(FRAME_SIZE, 1.0 / sample_rate)
+    band = (freqs >= CHROMA_MIN_HZ) & (freqs <= CHROMA_MAX_HZ)
+    pitch_class = np.round(12 * np.log2(freqs[band] / 440.0) + 69).astype(int) % 12
+
+    flux = np.empty(len(frames), dtype=np.float32)
+    chroma = np.zeros(12)
+    previous = None
+    for start in range(0, len(frames), BLOCK_FRAMES):
+        block = frames[start:start + BLOCK_FRAMES] * window
+        magnitude = np.abs(np.fft.rfft(block, axis=1)).astype(np.float32)
+
+        # Spectral flux on log magnitude: summed positive change per bin
+        log_mag = np.log1p(100.0 * magnitude)
+        if previous is None:
+            previous = log_mag[:1]
+        diff = np.diff(np.vstack([previous, log_mag]), axis=0)
+        flux[start:start + len(block)] = np.maximum(diff, 0.0).sum(axis=1)
+        previous = log_mag[-1:]
+
+        energy = (magnitude[:, band] ** 2).sum(axis=0)
+        chroma += np.bincount(pitch_class, weights=energy, minlength=12)
+
+    return flux, chroma
+
+def estimate_tempo(envelope: np.ndarray, sample_rate: int,
+                   min_bpm: float = MIN_BPM, max_bpm: float = MAX_BPM) -> Optional[float]:
+    """Estimate BPM from the autocorrelation of the onset envelope."""
+    envelope = envelope - envelope.mean()
+    if not envelope.any():
+        return None
+
+    # Autocorrelation via FFT, zero padded to avoid wrap-around
+    size = 1 << int(np.ceil(np.log2(2 * envelope.size)))
+    spectrum = np.fft.rfft(envelope, size)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum))[:envelope.size]
+
+    frame_rate = sample_rate / HOP_SIZE
+    min_lag = max(1, int(frame_rate * 60.0 / max_bpm))
+    max_lag = min(envelope.size - 2, int(np.ceil(frame_rate * 60.0 / min_bpm)))
+    if max_lag <= min_lag:
+        return None
+
+    # Score each lag together with its double so half-tempo ghosts lose out
+    lags = np.arange(min_lag, max_lag + 1)
+    doubled = np.minimum(lags * 2, autocorr.size - 1)
+    scores = autocorr[lags] + 0.5 * autocorr[doubled]
+    best = int(np.argmax(scores))
+    lag = float(lags[best])
+
+    # Parabolic interpolation between neighbouring lags for sub-frame precision
+    if 0 < best < len(scores) - 1:
+        left, centre, right = scores[best - 1], scores[best], scores[best + 1]
+        denominator = left - 2 * centre + right
+        if denominator:
+            lag += float(0.5 * (left - right) / denominator)
+
+    return round(60.0 * frame_rate / lag, 1)
+
+def estimate_key(chroma: np.ndarray) -> Optional[Tuple[str, str]]:
+    """Match a chroma vector against the key profiles; returns (key, camelot)."""
+    if not chroma.any() or chroma.std() == 0:
+        return None
+
+    normalized = (chroma - chroma.mean()) / chroma.std()
+    best = int(np.argmax(KEY_TEMPLATES @ normalized))
+    tonic = best % 12
+    if best < 12:
+        return f"{PITCH_CLASSES[tonic]} major", CAMELOT_MAJOR[tonic]
+    return f"{PITCH_CLASSES[tonic]} minor", CAMELOT_MINOR[tonic]
+
+def analyze(samples: np.ndarray, sample_rate: int) -> dict:
+    """BPM and musical key for decoded mono samples."""
+    envelope, chroma = spectral_features(samples, sample_rate)
+    result = {"bpm": estimate_tempo(envelope, sample_rate), "key": None, "camelot": None}
+
+    key = estimate_key(chroma)
+    if key:
+        result["key"], result["camelot"] = key
+    return result
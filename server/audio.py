@@ -0,0 +1,64 @@
+import os
+import shutil
+import subprocess
+from typing import Optional
+
+import numpy as np
+
+try:
+    import imageio_ffmpeg
+except ImportError:
+    imageio_ffmpeg = None
+
+def _find_ffmpeg() -> str:
+    """A system ffmpeg if there is one, else the static build shipped with imageio-ffmpeg."""
+    if os.environ.get("FFMPEG_BIN"):
+        return os.environ["FFMPEG_BIN"]
+    if shutil.which("ffmpeg") is None and imageio_ffmpeg is not None:
+        try:
+            return imageio_ffmpeg.get_ffmpeg_exe()
+        except RuntimeError:
+            pass
+    return "ffmpeg"
+
+# ffmpeg binary used to decode uploads to PCM
+FFMPEG_BIN = _find_ffmpeg()
+
+# Analysis runs on mono audio at this rate; plenty for peaks, tempo and key
+ANALYSIS_SAMPLE_RATE = 22050
+
+class DecodeError(Exception):
+    """Raised when a file cannot be decoded to PCM."""
+
+def decoder_error() -> Optional[str]:
+    """Why uploads can't be decoded, or None if the ffmpeg binary is usable."""
+    path = shutil.which(FFMPEG_BIN)
+    if path is None:
+        return f"{FFMPEG_BIN} not found"
+    if not os.access(path, os.X_OK):
+        return f"{path} is not executable"
+    return None
+
+def decode_mono(path: str, sample_rate: int = ANALYSIS_SAMPLE_RATE) -> np.ndarray:
+    """Decode an audio file to mono float32 samples in [-1, 1]."""
+    try:
+        result = subprocess.run(
+            [
+                FFMPEG_BIN, "-v", "error", "-nostdin",
+                "-i", path,
+                "-f", "s16le", "-acodec", "pcm_s16le",
+                "-ac", "1", "-ar", str(sample_rate),
+                "-"
+            ],
+            capture_output=True,
+            check=True
+        )
+    except FileNotFoundError:
+        raise DecodeError(f"{FFMPEG_BIN} not found")
+    except subprocess.CalledProcessError as e:
+        raise DecodeError(e.stderr.decode(errors="replace").strip() or "ffmpeg failed")
+
+    samples = np.frombuffer(result.stdout, dtype="<i2")
+    if not samples.size:
+        raise DecodeError("No audio decoded")
+    return samples.astype(np.float32) / 32768.0
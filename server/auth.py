@@ -3,20 +3,34 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2Pas
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from authlib.integrations.starlette_client import OAuth
 from starlette.config import Config
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
 import os
+import time
+import threading
 
-from .database import get_db, DBUser
-from .models import UserCreate, User, Token
+from tracing import span
+from database import get_async_db, AsyncSessionLocal, DBUser, DBUserChange
+from models import UserCreate, User, Token
 
 # Security settings
 SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key-for-development")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Verified tokens are remembered so repeat requests skip JWT decoding and the DB
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = int(os.environ.get("TOKEN_CACHE_TTL", "300"))
+# Put id/tier/name claims in tokens so even cold tokens need no DB lookup
+EMBED_USER_CLAIMS = os.environ.get("EMBED_USER_CLAIMS", "true").lower() == "true"
+# Accounts allowed to use admin endpoints; empty (the default) disables them
+ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get("ADMIN_EMAILS", "").split(",") if email.strip()}
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -36,80 +50,215 @@ oauth.register(
     client_kwargs={'scope': 'openid email profile'}
 )
 
+class TokenCache:
+    """Bounded LRU of verified token -> User (or its decoded claims) with a per-entry expiry."""
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, ttl: int = TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token: str, value: Any, token_expires_at: float) -> None:
+        with self._lock:
+            self._entries[token] = (min(time.time() + self.ttl, token_expires_at), value)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, email: str) -> None:
+        with self._lock:
+            for token in [t for t, (_, user) in self._entries.items() if getattr(user, "email", None) == email]:
+                del self._entries[token]
+
+token_cache = TokenCache()
+# Decoded claims of valid tokens, for routes that don't need the user record
+claims_cache = TokenCache()
+
+# email -> time of the last change to that user; embedded claims in tokens
+# issued before it are stale and must be re-read from the database
+_user_changed_at: Dict[str, float] = {}
+# Newest user_changes row applied by sync_user_changes()
+_user_changes_seen = 0.0
+
+def _claims_current(payload: dict, email: str) -> bool:
+    """Whether claims embedded in a token postdate the user's last change.
+
+    ``iat`` has whole-second precision, so a token issued in the same second
+    as a change may predate it and is treated as stale.
+    """
+    changed_at = _user_changed_at.get(email)
+    return changed_at is None or payload.get("iat", 0) > int(changed_at)
+
+def invalidate_user(email: str, changed_at: Optional[float] = None) -> None:
+    """Call after changing a user's tier, status or profile."""
+    _user_changed_at[email] = changed_at or time.time()
+    token_cache.invalidate_user(email)
+
+async def record_user_change(db: AsyncSession, email: str) -> float:
+    """Stage a user_changes row so other workers drop their cached tokens too."""
+    changed_at = time.time()
+    await db.execute(delete(DBUserChange).where(DBUserChange.email == email))
+    db.add(DBUserChange(email=email, changed_at=changed_at))
+    return changed_at
+
+async def sync_user_changes() -> int:
+    """Apply user changes committed by other workers; returns how many were new."""
+    global _user_changes_seen
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(DBUserChange.email, DBUserChange.changed_at)
+            .where(DBUserChange.changed_at > _user_changes_seen)
+        )
+        changes = result.all()
+    for email, changed_at in changes:
+        if changed_at > _user_changed_at.get(email, 0):
+            invalidate_user(email, changed_at)
+        _user_changes_seen = max(_user_changes_seen, changed_at)
+    return len(changes)
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def create_access_token(data: dict):
+def create_access_token(data: dict, user: Optional[DBUser] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": int(time.time())})
+    if user is not None and EMBED_USER_CLAIMS:
+        to_encode.update({
+            "uid": user.id,
+            "name": user.name,
+            "tier": user.subscription_tier,
+            "active": user.is_active
+        })
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: Optional[str] = Depends(oauth2_scheme),
-                    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-                    db: Session = Depends(get_db)) -> User:
-    if not token and not credentials:
+def decode_token(token: str) -> dict:
+    """Claims of a valid token, from the cache when it was seen recently."""
+    payload = claims_cache.get(token)
+    if payload is not None:
+        return payload
+    try:
+        with span("jwt"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated",
+            detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    try:
-        token_str = token if token else credentials.credentials
-        payload = jwt.decode(token_str, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=400, detail="Invalid token payload")
-    except JWTError:
+    claims_cache.put(token, payload, payload.get("exp", time.time() + claims_cache.ttl))
+    return payload
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[DBUser]:
+    result = await db.execute(select(DBUser).where(DBUser.email == email))
+    return result.scalar_one_or_none()
+
+async def get_current_user(token: Optional[str] = Depends(oauth2_scheme),
+                           credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+                           db: AsyncSession = Depends(get_async_db)) -> User:
+    if not token and not credentials:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
+            detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = db.query(DBUser).filter(DBUser.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    token_str = token if token else credentials.credentials
+    cached = token_cache.get(token_str)
+    if cached is not None:
+        return cached
     
-    return User(
-        id=user.id,
-        email=user.email,
-        name=user.name,
-        is_active=user.is_active,
-        subscription_tier=user.subscription_tier
-    )
+    payload = decode_token(token_str)
+    email: str = payload.get("sub")
+    if email is None:
+        raise HTTPException(status_code=400, detail="Invalid token payload")
+    
+    if "uid" in payload and _claims_current(payload, email):
+        # Claims embedded at login are still current; no DB round-trip needed
+        current_user = User(
+            id=payload["uid"],
+            email=email,
+            name=payload.get("name"),
+            is_active=payload.get("active", True),
+            subscription_tier=payload.get("tier", "free")
+        )
+    else:
+        user = await get_user_by_email(db, email)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        current_user = User(
+            id=user.id,
+            email=user.email,
+            name=user.name,
+            is_active=user.is_active,
+            subscription_tier=user.subscription_tier
+        )
+    
+    token_cache.put(token_str, current_user, payload["exp"])
+    return current_user
+
+async def require_admin(current_user: User = Depends(get_current_user)) -> User:
+    """Dependency for admin endpoints: a signed-in, active account listed in ADMIN_EMAILS."""
+    if not current_user.is_active or current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[DBUser]:
-    user = db.query(DBUser).filter(DBUser.email == email).first()
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[DBUser]:
+    user = await get_user_by_email(db, email)
+    # bcrypt is deliberately slow; keep it off the event loop
+    if not user or not user.hashed_password or not await run_in_threadpool(
+            verify_password, password, user.hashed_password):
         return None
     return user
 
-def create_user(db: Session, user: UserCreate) -> DBUser:
+async def create_user(db: AsyncSession, user: UserCreate) -> DBUser:
     db_user = DBUser(
         email=user.email,
         name=user.name,
-        hashed_password=get_password_hash(user.password) if user.password else None,
+        hashed_password=await run_in_threadpool(get_password_hash, user.password) if user.password else None,
         oauth_provider=user.oauth_provider,
         oauth_id=user.oauth_id
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    changed_at = await record_user_change(db, db_user.email)
+    await db.commit()
+    await db.refresh(db_user)
+    invalidate_user(db_user.email, changed_at)
     return db_user
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+async def update_subscription_tier(db: AsyncSession, db_user: DBUser, tier: str) -> DBUser:
+    db_user.subscription_tier = tier
+    changed_at = await record_user_change(db, db_user.email)
+    await db.commit()
+    await db.refresh(db_user)
+    invalidate_user(db_user.email, changed_at)
+    return db_user
+
+def verify_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
+    if credentials is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
+            detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return decode_token(credentials.credentials)
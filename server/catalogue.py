@@ -0,0 +1,127 @@
+import gzip
+import json
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import msgpack
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+MEDIA_JSON = "application/json"
+MEDIA_MSGPACK = "application/x-msgpack"
+
+# Columns in the compact catalogue, in order
+COLUMNS = ("filename", "title", "artist", "album", "duration", "size", "bpm", "key", "camelot", "waveform",
+           "sha256")
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+# Streamed JSON is flushed in chunks of roughly this many bytes
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def _parse_header(value: Optional[str]) -> List[Tuple[str, float]]:
+    """Split an Accept-style header into (token, q) pairs."""
+    items = []
+    for part in (value or "").split(","):
+        token, *params = [piece.strip() for piece in part.split(";")]
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        items.append((token.lower(), q))
+    return items
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """Pick msgpack only when the client prefers it at least as much as JSON."""
+    weights = dict(_parse_header(accept))
+    msgpack_q = weights.get(MEDIA_MSGPACK, 0.0)
+    json_q = max(weights.get(MEDIA_JSON, 0.0), weights.get("*/*", 0.0), 0.0 if weights else 1.0)
+    return MEDIA_MSGPACK if msgpack_q > 0 and msgpack_q >= json_q else MEDIA_JSON
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best supported content coding the client accepts, or None for identity."""
+    weights = dict(_parse_header(accept_encoding))
+    candidates = ["br", "gzip"] if brotli else ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def compress(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Compress a response body; returns the body and the coding actually applied."""
+    if not encoding or len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=5), "br"
+    return gzip.compress(body, compresslevel=6), "gzip"
+
+def encode_columnar(records: Iterable[dict], url_prefix: str) -> bytes:
+    """Pack songs column by column with the shared URL prefix factored out.
+
+    Clients rebuild ``url`` as ``url_prefix + filename`` and, when the
+    ``waveform`` column is true, ``waveform_url`` as ``url + "/waveform"``.
+    """
+    columns = {name: [] for name in COLUMNS}
+    count = 0
+    for record in records:
+        for name in COLUMNS:
+            columns[name].append(record.get(name))
+        count += 1
+    columns["title"] = [
+        title or filename for title, filename in zip(columns["title"], columns["filename"])
+    ]
+    columns["waveform"] = [bool(value) for value in columns["waveform"]]
+
+    return msgpack.packb({
+        "version": 1,
+        "count": count,
+        "url_prefix": url_prefix,
+        "columns": columns,
+    })
+
+def iter_json(songs: Iterable[dict], chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Encode ``{"songs": [...]}`` incrementally, one chunk at a time."""
+    encoder = json.JSONEncoder(separators=(",", ":"))
+    buffer = [b'{"songs":[']
+    buffered = 0
+    separator = b""
+    for song in songs:
+        encoded = separator + encoder.encode(song).encode()
+        separator = b","
+        buffer.append(encoded)
+        buffered += len(encoded)
+        if buffered >= chunk_size:
+            yield b"".join(buffer)
+            buffer, buffered = [], 0
+    buffer.append(b"]}")
+    yield b"".join(buffer)
+
+def compress_stream(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    """Compress a stream of chunks with brotli or gzip, or pass it through."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    elif encoding == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    else:
+        yield from chunks
@@ -1,15 +1,108 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, Float, Text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 import os
 
+from tracing import instrument_engine
+
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./songs.db")
+# Render and Heroku hand out postgres:// URLs, which SQLAlchemy no longer accepts
+if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
+    SQLALCHEMY_DATABASE_URL = "postgresql://" + SQLALCHEMY_DATABASE_URL[len("postgres://"):]
+
+# Connection pool sizing (per process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers run alongside the single writer instead of blocking on it."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")  # Durable in WAL mode, far fewer fsyncs
+    cursor.execute("PRAGMA busy_timeout=5000")   # Wait for the write lock instead of failing
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-16000")   # 16 MB page cache per connection
+    cursor.close()
+
+def build_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    """Create an engine with pooling suited to the backend."""
+    if url.startswith("sqlite"):
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # One shared connection, otherwise every checkout sees an empty database
+            engine = create_engine(
+                url, connect_args={"check_same_thread": False}, poolclass=StaticPool
+            )
+        else:
+            engine = create_engine(
+                url,
+                connect_args={"check_same_thread": False},
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT
+            )
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        return engine
+
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True,  # Drop connections the server closed while idle
+        pool_recycle=1800
+    )
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def async_database_url(url: str = SQLALCHEMY_DATABASE_URL) -> str:
+    """Map a sync database URL to its asyncio driver."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    if url.startswith("postgresql:"):
+        return "postgresql+asyncpg:" + url[len("postgresql:"):]
+    if url.startswith("postgresql+psycopg2:"):
+        return "postgresql+asyncpg:" + url[len("postgresql+psycopg2:"):]
+    return url
+
+def build_async_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    """Async counterpart of build_engine, with the same pooling and pragmas."""
+    url = async_database_url(url)
+    if url.startswith("sqlite"):
+        if url in ("sqlite+aiosqlite://", "sqlite+aiosqlite:///:memory:"):
+            engine = create_async_engine(url, poolclass=StaticPool)
+        else:
+            # aiosqlite defaults to no pooling; reuse connections like the sync engine
+            engine = create_async_engine(
+                url,
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT
+            )
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+        return engine
+
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        pool_recycle=1800
+    )
+
+engine = build_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Used by request handlers so queries don't block the event loop
+async_engine = build_async_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
 Base = declarative_base()
 
 class DBUser(Base):
@@ -24,8 +117,35 @@ class DBUser(Base):
     is_active = Column(Boolean, default=True)
     subscription_tier = Column(String, default="free")
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+class DBSong(Base):
+    """Shared copy of the metadata index, so every worker sees the same catalogue."""
+    __tablename__ = "songs"
+
+    filename = Column(String, primary_key=True)
+    status = Column(String, nullable=False, index=True)
+    record = Column(Text, nullable=False)  # JSON song record
+    # Catalogue generation of the last change; tombstones keep removals visible
+    version = Column(Integer, nullable=False, index=True)
+    deleted = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(Float, nullable=False)
+
+class DBCatalogueState(Base):
+    """Single row holding the catalogue generation, bumped on every change."""
+    __tablename__ = "catalogue_state"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+    # Boot id of the worker that reconciled the songs directory at startup
+    reconciled_by = Column(String, nullable=True)
+
+class DBUserChange(Base):
+    """Last change per user, so every worker can drop stale cached tokens."""
+    __tablename__ = "user_changes"
+
+    email = Column(String, primary_key=True)
+    changed_at = Column(Float, nullable=False, index=True)
+
+# Tables are created by migrations.run_migrations(), not at import time
 
 def get_db():
     db = SessionLocal()
@@ -33,3 +153,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
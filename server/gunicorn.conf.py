@@ -0,0 +1,38 @@
+"""Multi-worker deployment: gunicorn managing uvicorn workers.
+
+    cd server && gunicorn -c gunicorn.conf.py main:app
+
+Workers share the catalogue, quota counters and user changes through the
+database (use PostgreSQL, or SQLite on a local disk) and must all see the
+same SONGS_DIR.
+"""
+import os
+import uuid
+import multiprocessing
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Uploads are streamed to disk and can take a while on slow links
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Every worker runs its own ingest pool; split the cores between them
+if not os.environ.get("INGEST_WORKERS"):
+    os.environ["INGEST_WORKERS"] = str(max(1, multiprocessing.cpu_count() // workers))
+
+def on_starting(server):
+    """Migrate once in the master, before any worker imports the app."""
+    from database import build_engine
+    from migrations import run_migrations
+
+    # A throwaway engine, closed before forking: workers must not inherit its connections
+    engine = build_engine()
+    try:
+        version = run_migrations(engine)
+    finally:
+        engine.dispose()
+    server.log.info(f"Database at schema version {version}")
+    # Workers use this to elect a single one to rescan the songs directory
+    os.environ["DJ_BOOT_ID"] = uuid.uuid4().hex
@@ -0,0 +1,322 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import mutagen
+
+from analysis import analyze
+from audio import decode_mono, DecodeError, ANALYSIS_SAMPLE_RATE
+from metadata_index import MetadataIndex, STATUS_PENDING, STATUS_READY, STATUS_FAILED
+from metrics import ingest_stage_duration, ingest_results
+from tracing import log_job_timings
+from waveform import waveform_path, write_waveform
+
+logger = logging.getLogger(__name__)
+
+# Number of worker processes; defaults to one per core
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS") or 0) or os.cpu_count() or 1
+HASH_CHUNK_SIZE = 1024 * 1024
+# Times a job is resubmitted after its worker process died before it counts as failed
+MAX_WORKER_CRASHES = 2
+# Errors that mean the upload itself is bad; anything else is the server's fault
+REJECT_ERRORS = (ValueError, mutagen.MutagenError)
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def extract_metadata(path: str) -> dict:
+    """Parse tags and duration for a single file. Runs in a worker process."""
+    audio = mutagen.File(path)
+    if not audio:
+        raise ValueError("Invalid MP3 file")
+
+    metadata = {"duration": int(audio.info.length)}
+
+    # Extract ID3 tags if available
+    if hasattr(audio, "tags") and audio.tags:
+        tags = audio.tags
+        if "TIT2" in tags:  # Title
+            metadata["title"] = str(tags["TIT2"])
+        if "TPE1" in tags:  # Artist
+            metadata["artist"] = str(tags["TPE1"])
+        if "TALB" in tags:  # Album
+            metadata["album"] = str(tags["TALB"])
+
+    return metadata
+
+def process_file(path: str, waveform_dir: str, hash_file: bool = False) -> dict:
+    """Full ingest for one file. Runs in a worker process.
+
+    Tags come from mutagen; the audio is then decoded once and the PCM is
+    shared by every analysis stage. Per-stage timings are returned under
+    ``timings`` for the server's metrics, not stored with the song.
+    ``hash_file`` adds the SHA-256 for files that weren't hashed on upload.
+    """
+    timings = {}
+    start = time.perf_counter()
+    metadata = extract_metadata(path)
+    timings["tags"] = time.perf_counter() - start
+    metadata["timings"] = timings
+
+    if hash_file:
+        start = time.perf_counter()
+        metadata["sha256"] = file_sha256(path)
+        timings["hash"] = time.perf_counter() - start
+
+    try:
+        start = time.perf_counter()
+        samples = decode_mono(path)
+        timings["decode"] = time.perf_counter() - start
+    except DecodeError as e:
+        # Tags are still usable without the decoded audio
+        metadata["waveform"] = False
+        metadata["analysis_error"] = str(e)
+        return metadata
+
+    start = time.perf_counter()
+    write_waveform(samples, ANALYSIS_SAMPLE_RATE, waveform_path(waveform_dir, Path(path).name))
+    metadata["waveform"] = True
+    timings["waveform"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    metadata.update(analyze(samples, ANALYSIS_SAMPLE_RATE))
+    timings["analysis"] = time.perf_counter() - start
+    return metadata
+
+@dataclass
+class IngestJob:
+    file_path: Path
+    hash_file: bool
+    reanalyze: bool
+    future: Optional[Future] = None
+    executor: Optional[ProcessPoolExecutor] = None
+    crashes: int = 0
+
+class IngestQueue:
+    """Runs metadata extraction for uploaded songs on a pool of worker processes.
+
+    A worker dying (e.g. killed for running out of memory) breaks the whole
+    pool; it is then replaced and the jobs it held are resubmitted.
+    """
+
+    def __init__(self, index: MetadataIndex, songs_dir: Path, waveform_dir: Path,
+                 max_workers: int = INGEST_WORKERS):
+        self.index = index
+        self.songs_dir = Path(songs_dir)
+        self.waveform_dir = Path(waveform_dir)
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.RLock()
+
+    def start(self) -> None:
+        # Spawned workers avoid inheriting the event loop and server threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"Ingest pool started with {self.max_workers} workers")
+
+    def shutdown(self) -> None:
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _replace_pool(self, broken: ProcessPoolExecutor) -> None:
+        """Swap a broken pool for a new one, once, however many jobs report it."""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            logger.error("Ingest worker process died; restarting the pool")
+            self._executor = None
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.start()
+
+    def recover(self) -> None:
+        """Replace the pool if it broke while no job was there to notice."""
+        executor = self._executor
+        if executor is not None and getattr(executor, "_broken", False):
+            self._replace_pool(executor)
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    @property
+    def healthy(self) -> bool:
+        """The pool is running and can take jobs."""
+        executor = self._executor
+        return executor is not None and not getattr(executor, "_broken", False)
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs queued or running."""
+        with self._lock:
+            return len(self._jobs)
+
+    def submit(self, file_path: Path, reanalyze: bool = False, sha256: Optional[str] = None) -> dict:
+        """Record a song as pending and queue it for extraction.
+
+        With ``reanalyze`` an already ingested song keeps serving its current
+        metadata until the new results land. ``sha256`` is the hash computed
+        while the upload streamed in; without one the worker hashes the file.
+        """
+        record = self.index.get(file_path.name) if reanalyze else None
+        if record is None:
+            stat = file_path.stat()
+            record = self.index.put({
+                "filename": file_path.name,
+                "title": file_path.stem,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "sha256": sha256,
+                "status": STATUS_PENDING,
+                "queued_at": time.time(),
+            })
+
+        job = IngestJob(file_path, hash_file=not record.get("sha256"), reanalyze=reanalyze)
+        with self._lock:
+            previous = self._jobs.get(file_path.name)
+            self._jobs[file_path.name] = job
+            self._run(job)
+        if previous and previous.future:
+            previous.future.cancel()
+        return record
+
+    def _run(self, job: IngestJob) -> None:
+        """Hand a job to the pool, replacing the pool first if it has broken; call with the lock held."""
+        try:
+            future = self._executor.submit(process_file, str(job.file_path), str(self.waveform_dir), job.hash_file)
+        except BrokenProcessPool:
+            self._replace_pool(self._executor)
+            future = self._executor.submit(process_file, str(job.file_path), str(self.waveform_dir), job.hash_file)
+        job.future, job.executor = future, self._executor
+        future.add_done_callback(lambda f: self._on_done(job, f))
+
+    def _on_done(self, job: IngestJob, future: Future) -> None:
+        file_path = job.file_path
+        with self._lock:
+            if self._jobs.get(file_path.name) is not job or job.future is not future:
+                # Superseded by a newer upload of the same file
+                return
+            error = None if future.cancelled() else future.exception()
+            if isinstance(error, BrokenProcessPool):
+                self._replace_pool(job.executor)
+                if job.crashes < MAX_WORKER_CRASHES:
+                    # Not necessarily this file's fault: same job, new pool
+                    job.crashes += 1
+                    logger.error(f"Ingest worker died while processing {file_path.name}; resubmitting")
+                    try:
+                        self._run(job)
+                        return
+                    except BrokenProcessPool as e:
+                        error = e  # The new pool can't start either
+            del self._jobs[file_path.name]
+
+        if future.cancelled():
+            return
+
+        if error and job.reanalyze:
+            # The song was already ingested and is being served; keep it and its last good metadata
+            logger.warning(f"Re-analysis of {file_path.name} failed: {error}")
+            ingest_results.inc(1, STATUS_FAILED)
+            self.index.update(file_path.name, analysis_error=f"Re-analysis failed: {error}")
+            return
+        if error and not isinstance(error, REJECT_ERRORS):
+            # Not the file's fault: keep it; reconcile() queues it again on the next start
+            logger.error(f"Ingest of {file_path.name} failed: {error!r}")
+            ingest_results.inc(1, STATUS_FAILED)
+            self.index.update(
+                file_path.name,
+                status=STATUS_FAILED,
+                error=f"Ingest failed, will retry after a restart: {error}",
+                ingested_at=time.time()
+            )
+            return
+        if error:
+            logger.warning(f"Rejected {file_path.name}: {error}")
+            try:
+                file_path.unlink()  # Delete invalid file
+            except FileNotFoundError:
+                pass
+            self._discard_artifacts(file_path.name)
+            ingest_results.inc(1, STATUS_FAILED)
+            self.index.update(
+                file_path.name,
+                status=STATUS_FAILED,
+                error=f"Invalid MP3 file: {error}",
+                ingested_at=time.time()
+            )
+            return
+
+        result = future.result()
+        timings = result.pop("timings", {})
+        for stage, seconds in timings.items():
+            ingest_stage_duration.observe(seconds, stage)
+        log_job_timings(f"ingest {file_path.name}", timings)
+        if job.reanalyze:
+            result.setdefault("analysis_error", None)  # Clear an earlier failed attempt
+        ingest_results.inc(1, STATUS_READY)
+        self.index.update(
+            file_path.name,
+            status=STATUS_READY,
+            ingested_at=time.time(),
+            **result
+        )
+        logger.info(f"Ingested {file_path.name}")
+
+    def _discard_artifacts(self, filename: str) -> None:
+        """Delete derived files (waveforms) for a song."""
+        waveform_path(self.waveform_dir, filename).unlink(missing_ok=True)
+
+    def remove(self, filename: str) -> Optional[dict]:
+        """Delete a song, its derived files and any queued job for it."""
+        with self._lock:
+            job = self._jobs.pop(filename, None)
+        if job and job.future:
+            job.future.cancel()
+        (self.songs_dir / filename).unlink(missing_ok=True)
+        self._discard_artifacts(filename)
+        return self.index.remove(filename)
+
+    def reanalyze_all(self) -> int:
+        """Queue every ingested song for another pass, e.g. after analysis changes."""
+        records = self.index.records(statuses=(STATUS_READY,))
+        for record in records:
+            self.submit(self.songs_dir / record["filename"], reanalyze=True)
+        return len(records)
+
+    def reconcile(self) -> None:
+        """Bring the index in line with the songs directory after a restart."""
+        on_disk = {path.name: path for path in self.songs_dir.glob("*.mp3")}
+
+        for record in self.index.records(statuses=None):
+            if record["filename"] not in on_disk:
+                self.index.remove(record["filename"])
+                self._discard_artifacts(record["filename"])
+
+        queued = 0
+        for filename, path in on_disk.items():
+            record = self.index.get(filename)
+            stat = path.stat()
+            if (record and record["status"] == STATUS_READY
+                    and record.get("size") == stat.st_size
+                    and record.get("mtime") == stat.st_mtime):
+                continue
+            self.submit(path)
+            queued += 1
+
+        if queued:
+            logger.info(f"Queued {queued} songs for ingest")
@@ -0,0 +1,173 @@
+"""Shared logging setup: non-blocking queue handler, optional JSON output, rate limiting.
+
+Callers only ever hand a record to a queue; formatting and I/O happen on
+a listener thread, so logging never blocks the event loop or a sync
+loop. Bursts from a single log call site are capped per interval, and
+ItemLog turns per-item messages into periodic summaries.
+
+usb_app/log_setup.py is the source; package_tool.py copies it to
+server/log_setup.py for the server, so edit only the usb_app file.
+
+    LOG_LEVEL=DEBUG LOG_FORMAT=json python cli.py sync /Volumes/USB
+    LOG_FORMAT=json gunicorn -c gunicorn.conf.py main:app
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# "text" for humans, "json" for log collectors
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Per call site: at most this many records per interval, the rest are counted
+RATE_LIMIT_BURST = int(os.environ.get("LOG_RATE_LIMIT_BURST", "50"))
+RATE_LIMIT_INTERVAL = float(os.environ.get("LOG_RATE_LIMIT_INTERVAL", "10"))
+
+# Attributes every LogRecord has; anything else came from ``extra=``
+_RECORD_FIELDS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra=`` fields are included as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class RateLimitFilter(logging.Filter):
+    """Caps records per call site (logger, file, line) and reports what it dropped.
+
+    Warnings and errors pass through the cap, since those are rarely noise.
+    Attached to the queue handler, so dropped records never reach the queue.
+    """
+
+    def __init__(self, burst: int = RATE_LIMIT_BURST, interval: float = RATE_LIMIT_INTERVAL):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        # call site -> (window start, records in window, suppressed in window)
+        self._sites: Dict[Tuple[str, str, int], Tuple[float, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        site = (record.name, record.pathname, record.lineno)
+        now = record.created
+        with self._lock:
+            start, count, suppressed = self._sites.get(site, (now, 0, 0))
+            if now - start >= self.interval:
+                if suppressed:
+                    record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+                start, count, suppressed = now, 0, 0
+            if count >= self.burst:
+                self._sites[site] = (start, count, suppressed + 1)
+                return False
+            self._sites[site] = (start, count + 1, suppressed)
+        return True
+
+class ItemLog:
+    """Aggregates per-item events (one per song, file, ...) into periodic summaries.
+
+    Each item is logged at DEBUG, which costs nothing when DEBUG is off; a
+    summary goes out at INFO at most every ``interval`` seconds and once
+    more from ``done()``.
+    """
+
+    def __init__(self, logger: logging.Logger, action: str, interval: float = 5.0):
+        self.logger = logger
+        self.action = action
+        self.interval = interval
+        self.count = 0
+        self._debug = logger.isEnabledFor(logging.DEBUG)
+        self._started = self._last = time.monotonic()
+
+    def add(self, item: str = "", **fields) -> None:
+        self.count += 1
+        if self._debug:
+            self.logger.debug(f"{self.action}: {item}", extra=fields)
+        if self.count % 256 == 0:
+            now = time.monotonic()
+            if now - self._last >= self.interval:
+                self._last = now
+                self.logger.info(f"{self.action}: {self.count} so far", extra={"count": self.count})
+
+    def done(self) -> None:
+        elapsed = time.monotonic() - self._started
+        self.logger.info(
+            f"{self.action}: {self.count} in {elapsed:.2f}s",
+            extra={"count": self.count, "elapsed": round(elapsed, 3)}
+        )
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handlers: List[logging.Handler] = []
+_log_files: Set[str] = set()
+_lock = threading.Lock()
+
+def setup_logging(level: Optional[Union[str, int]] = None, json_output: Optional[bool] = None,
+                  log_file: Optional[Union[str, Path]] = None) -> None:
+    """Route the root logger through a queue to a background writer thread.
+
+    Safe to call more than once; later calls can add a log file.
+    """
+    global _listener, _handlers
+    with _lock:
+        if _listener is not None and level is None and json_output is None and (
+                log_file is None or str(log_file) in _log_files):
+            return
+        if log_file is not None:
+            _log_files.add(str(log_file))
+        _stop_listener()
+
+        formatter = JsonFormatter() if (json_output if json_output is not None else LOG_FORMAT == "json") \
+            else logging.Formatter(TEXT_FORMAT)
+        handlers = [logging.StreamHandler(sys.stdout)]
+        handlers.extend(logging.FileHandler(path) for path in sorted(_log_files))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(RateLimitFilter())
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level or LOG_LEVEL)
+
+        _handlers = handlers
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()  # Drains the queue first
+        _listener = None
+    for handler in _handlers:
+        handler.close()
+
+def shutdown_logging() -> None:
+    """Flush queued records; registered to run at exit."""
+    with _lock:
+        _stop_listener()
+
+atexit.register(shutdown_logging)
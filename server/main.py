@@ -1,30 +1,45 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Form, Request, Response, status
-from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
 from auth import (
-    verify_token, create_access_token, get_current_user, authenticate_user,
-    create_user, oauth
+    verify_token, create_access_token, get_current_user, get_user_by_email, authenticate_user,
+    create_user, require_admin, update_subscription_tier, sync_user_changes, token_cache, oauth
 )
-from models import UserCreate, User, Token
-from database import get_db, DBUser
-from sqlalchemy.orm import Session
+from models import UserCreate, User, Token, SubscriptionTier
+from database import engine, get_async_db
+from migrations import run_migrations
+from metadata_index import MetadataIndex, STATUS_PENDING
+from ingest import IngestQueue
+from audio import decoder_error
+from search_index import SearchIndex
+from catalogue import (
+    MEDIA_JSON, MEDIA_MSGPACK, negotiate_media_type, negotiate_encoding, compress, compress_stream,
+    encode_columnar, iter_json
+)
+from waveform import waveform_path, select_level
+from rate_limit import limit_downloads
+from log_setup import setup_logging
+from tracing import TracingMiddleware, span, configure as configure_tracing, settings as tracing_settings
+from metrics import (
+    registry, MetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE, upload_bytes, upload_duration,
+    cache_hits, cache_misses
+)
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from pathlib import Path
 import os
-import sys
+import uuid
+import shutil
+import hashlib
+import asyncio
 import logging
-import mutagen
 from typing import Optional
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -40,6 +55,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # Environment configuration
 PRODUCTION = os.environ.get("RENDER", "false").lower() == "true"
@@ -48,8 +65,10 @@ BASE_URL = "https://dj-usb-server-usb-mp3-app.onrender.com" if PRODUCTION else "
 logger.info(f"Starting server in {'production' if PRODUCTION else 'development'} mode")
 logger.info(f"Base URL: {BASE_URL}")
 
-# Directory where songs are stored
-if PRODUCTION:
+# Directory where songs are stored; every worker process must see the same one
+if os.environ.get("SONGS_DIR"):
+    SONGS_DIR = Path(os.environ["SONGS_DIR"])
+elif PRODUCTION:
     SONGS_DIR = Path("/tmp/songs")
 else:
     SONGS_DIR = Path(__file__).parent / "songs"
@@ -61,19 +80,83 @@ try:
 except Exception as e:
     logger.error(f"Failed to create songs directory: {e}")
 
+# Song catalogue (shared between workers through the database) and the
+# background pipeline that fills it
+song_index = MetadataIndex(engine)
+WAVEFORM_DIR = SONGS_DIR / ".waveforms"
+ingest_queue = IngestQueue(song_index, SONGS_DIR, WAVEFORM_DIR)
+search_index = SearchIndex()
+song_index.add_listener(search_index.on_change)
+
+# How often each worker picks up catalogue and user changes made by the others
+SHARED_STATE_POLL_INTERVAL = float(os.environ.get("SHARED_STATE_POLL_INTERVAL", "1"))
+# Set once per server boot by gunicorn.conf.py; a single process is its own boot
+BOOT_ID = os.environ.get("DJ_BOOT_ID") or uuid.uuid4().hex
+
+registry.gauge("library_songs", "Songs listed in the catalogue.", lambda: song_index.song_count)
+registry.gauge("library_bytes", "Total size of listed songs.", lambda: song_index.total_bytes)
+registry.gauge("catalogue_generation", "Catalogue generation held by this worker.", lambda: song_index.generation)
+registry.gauge("ingest_queue_depth", "Ingest jobs queued or running in this worker.", lambda: ingest_queue.depth)
+registry.gauge(
+    "token_cache_hit_ratio", "Share of authenticated requests answered from the token cache.",
+    lambda: token_cache.hits / (token_cache.hits + token_cache.misses) if token_cache.hits + token_cache.misses else None
+)
+
+ready = False
+_sync_task: Optional[asyncio.Task] = None
+
+async def sync_shared_state():
+    while True:
+        await asyncio.sleep(SHARED_STATE_POLL_INTERVAL)
+        try:
+            await run_in_threadpool(song_index.refresh)
+            await sync_user_changes()
+            await run_in_threadpool(ingest_queue.recover)
+        except Exception as e:
+            logger.error(f"Failed to sync shared state: {e}")
+
+@app.on_event("startup")
+async def migrate_database():
+    # Under gunicorn the master has already migrated; this is then a no-op
+    run_migrations()
+
+@app.on_event("startup")
+async def start_ingest():
+    global ready, _sync_task
+    song_index.load()
+    search_index.rebuild(song_index.records())
+    error = decoder_error()
+    if error:
+        logger.error(f"Audio decoder unavailable ({error}); waveforms and BPM/key analysis will fail until it is fixed")
+    ingest_queue.start()
+    # One worker per boot rescans the songs directory; the rest see its results via refresh
+    if song_index.claim_reconcile(BOOT_ID):
+        ingest_queue.reconcile()
+    _sync_task = asyncio.create_task(sync_shared_state())
+    configure_tracing()
+    ready = True
+
+@app.on_event("shutdown")
+async def stop_ingest():
+    global ready
+    ready = False
+    if _sync_task:
+        _sync_task.cancel()
+    ingest_queue.shutdown()
+
 # Auth endpoints
 @app.post("/auth/signup", response_model=Token)
-async def signup(user: UserCreate, db: Session = Depends(get_db)):
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if user exists
-    db_user = db.query(DBUser).filter(DBUser.email == user.email).first()
+    db_user = await get_user_by_email(db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
-    db_user = create_user(db=db, user=user)
+    db_user = await create_user(db=db, user=user)
     
     # Create access token
-    access_token = create_access_token(data={"sub": db_user.email})
+    access_token = create_access_token(data={"sub": db_user.email}, user=db_user)
     
     return Token(
         access_token=access_token,
@@ -87,8 +170,8 @@ async def signup(user: UserCreate, db: Session = Depends(get_db)):
     )
 
 @app.post("/auth/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -96,7 +179,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token = create_access_token(data={"sub": user.email})
+    access_token = create_access_token(data={"sub": user.email}, user=user)
     
     return Token(
         access_token=access_token,
@@ -109,18 +192,39 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
         )
     )
 
+@app.get("/auth/me", response_model=User)
+async def read_current_user(current_user: User = Depends(get_current_user)):
+    """Profile of the authenticated user."""
+    return current_user
+
+@app.put("/admin/users/{email}/tier", response_model=User)
+async def set_subscription_tier(email: str, tier: SubscriptionTier, admin: User = Depends(require_admin),
+                                db: AsyncSession = Depends(get_async_db)):
+    """Change a user's subscription tier (admins only); their cached tokens pick it up at once."""
+    db_user = await get_user_by_email(db, email)
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    db_user = await update_subscription_tier(db, db_user, tier.value)
+    return User(
+        id=db_user.id,
+        email=db_user.email,
+        name=db_user.name,
+        is_active=db_user.is_active,
+        subscription_tier=db_user.subscription_tier
+    )
+
 @app.get("/auth/google")
 async def google_auth(request: Request):
     redirect_uri = request.url_for('google_auth_callback')
     return await oauth.google.authorize_redirect(request, redirect_uri)
 
 @app.get("/auth/google/callback")
-async def google_auth_callback(request: Request, db: Session = Depends(get_db)):
+async def google_auth_callback(request: Request, db: AsyncSession = Depends(get_async_db)):
     token = await oauth.google.authorize_access_token(request)
     user_info = await oauth.google.parse_id_token(request, token)
     
     # Check if user exists
-    db_user = db.query(DBUser).filter(DBUser.email == user_info['email']).first()
+    db_user = await get_user_by_email(db, user_info['email'])
     
     if not db_user:
         # Create new user
@@ -130,10 +234,10 @@ async def google_auth_callback(request: Request, db: Session = Depends(get_db)):
             oauth_provider='google',
             oauth_id=user_info['sub']
         )
-        db_user = create_user(db=db, user=user)
+        db_user = await create_user(db=db, user=user)
     
     # Create access token
-    access_token = create_access_token(data={"sub": db_user.email})
+    access_token = create_access_token(data={"sub": db_user.email}, user=db_user)
     
     # Redirect to frontend with token
     response = RedirectResponse(url=f"/web/#auth-callback?token={access_token}")
@@ -161,37 +265,133 @@ async def api_info():
         "base_url": BASE_URL
     }
 
+def _ping_database() -> None:
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint with system status."""
+    """Health check from in-memory counters; cheap enough for frequent probes."""
+    return {
+        "status": "healthy",
+        "songs_directory": str(SONGS_DIR),
+        **song_index.stats(),
+        "queue_depth": ingest_queue.depth,
+        "environment": "production" if PRODUCTION else "development",
+        "base_url": BASE_URL
+    }
+
+@app.get("/health/deep")
+async def deep_health_check():
+    """Slow check that touches the database and disk; not for load balancer probes."""
+    result = await run_in_threadpool(_deep_checks)
+    return JSONResponse(status_code=200 if result["status"] == "healthy" else 503, content=result)
+
+def _deep_checks() -> dict:
+    checks = {}
     try:
-        songs_count = len(list(SONGS_DIR.glob("*.mp3")))
-        return {
-            "status": "healthy",
-            "songs_directory": str(SONGS_DIR),
-            "songs_count": songs_count,
-            "environment": "production" if PRODUCTION else "development",
-            "base_url": BASE_URL
+        _ping_database()
+        checks["database"] = {"ok": True}
+    except Exception as e:
+        checks["database"] = {"ok": False, "error": str(e)}
+    
+    try:
+        on_disk = {path.name for path in SONGS_DIR.glob("*.mp3")}
+        indexed = {record["filename"] for record in song_index.records()}
+        checks["songs_directory"] = {
+            "ok": os.access(SONGS_DIR, os.W_OK),
+            "files": len(on_disk),
+            "unindexed": len(on_disk - indexed),
+            "missing": len(indexed - on_disk)
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        checks["songs_directory"] = {"ok": False, "error": str(e)}
+    
+    try:
+        usage = shutil.disk_usage(SONGS_DIR)
+        checks["disk"] = {"ok": usage.free > 0, "free_bytes": usage.free, "total_bytes": usage.total}
+    except Exception as e:
+        checks["disk"] = {"ok": False, "error": str(e)}
+    
+    checks["ingest"] = {"ok": ingest_queue.healthy, "queue_depth": ingest_queue.depth}
+    error = decoder_error()
+    checks["decoder"] = {"ok": True} if error is None else {"ok": False, "error": error}
+    return {
+        "status": "healthy" if all(check["ok"] for check in checks.values()) else "unhealthy",
+        "checks": checks,
+        **song_index.stats()
+    }
+
+@app.get("/health/live")
+async def liveness():
+    """The worker process is up and serving requests."""
+    return {"status": "alive", "pid": os.getpid()}
+
+@app.get("/health/ready")
+async def readiness():
+    """The worker can serve traffic: catalogue loaded, ingest pool and decoder usable, database reachable."""
+    checks = {"catalogue": ready, "ingest": ingest_queue.healthy}
+    error = decoder_error()
+    if error:
+        logger.error(f"Readiness decoder check failed, audio analysis can't run: {error}")
+    checks["decoder"] = error is None
+    try:
+        await run_in_threadpool(_ping_database)
+        checks["database"] = True
+    except Exception as e:
+        logger.error(f"Readiness database check failed: {e}")
+        checks["database"] = False
+    
+    healthy = all(checks.values())
+    return JSONResponse(
+        status_code=200 if healthy else 503,
+        content={
+            "status": "ready" if healthy else "unavailable",
+            "checks": checks,
+            "generation": song_index.generation,
+            "pid": os.getpid()
+        }
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for this worker process."""
+    return Response(content=registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/debug/tracing")
+async def get_tracing():
+    """Current tracing and profiling settings of this worker."""
+    return tracing_settings()
+
+@app.post("/debug/tracing")
+async def set_tracing(
+    enabled: Optional[bool] = None,
+    profile: Optional[bool] = None,
+    slow_ms: Optional[float] = None,
+    admin: User = Depends(require_admin)
+):
+    """Switch request tracing and the slow-request profiler on or off for this worker (admins only)."""
+    return configure_tracing(enabled=enabled, profile=profile, slow_ms=slow_ms)
 
 # Free tier limits
 FREE_TIER_SONG_LIMIT = 25
 
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 @app.post("/upload")
 async def upload_file(
     request: Request,
     file: UploadFile = File(...),
     token: HTTPAuthorizationCredentials = Depends(verify_token)
 ):
-    """Upload an MP3 file to the server."""
+    """Upload an MP3 file to the server and queue it for ingest."""
     if not file.filename.endswith(".mp3"):
         raise HTTPException(status_code=400, detail="Only MP3 files are allowed")
     
     try:
-        # Check for free tier limits
-        song_count = len(list(SONGS_DIR.glob("*.mp3")))
+        # Check for free tier limits across every worker, not just this one's copy
+        song_count = await run_in_threadpool(song_index.shared_count)
         if song_count >= FREE_TIER_SONG_LIMIT:
             # In a real system, we would check the user's subscription status
             # For now, we'll just enforce the limit for everyone
@@ -207,31 +407,70 @@ async def upload_file(
             )
         
         file_path = SONGS_DIR / file.filename
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        size = 0
+        # Hashed as it streams, so clients can verify their copies without another read
+        digest = hashlib.sha256()
+        with upload_duration.time(), span("disk write"), open(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                buffer.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        upload_bytes.inc(size)
         
-        # Verify it's a valid MP3
-        try:
-            audio = mutagen.File(file_path)
-            if not audio:
-                file_path.unlink()  # Delete invalid file
-                raise HTTPException(status_code=400, detail="Invalid MP3 file")
-        except Exception as e:
-            file_path.unlink()  # Delete invalid file
-            raise HTTPException(status_code=400, detail=f"Invalid MP3 file: {str(e)}")
+        # Validation and tag extraction happen on the ingest pool
+        await run_in_threadpool(ingest_queue.submit, file_path, sha256=digest.hexdigest())
         
         # Return song count information along with the upload result
-        return {
-            "filename": file.filename, 
-            "size": len(content),
-            "song_count": song_count + 1,
-            "limit": FREE_TIER_SONG_LIMIT,
-            "remaining": FREE_TIER_SONG_LIMIT - (song_count + 1)
-        }
+        return JSONResponse(
+            status_code=202,
+            content={
+                "filename": file.filename,
+                "size": size,
+                "sha256": digest.hexdigest(),
+                "status": STATUS_PENDING,
+                "status_url": f"/ingest/{file.filename}",
+                "song_count": song_count + 1,
+                "limit": FREE_TIER_SONG_LIMIT,
+                "remaining": FREE_TIER_SONG_LIMIT - (song_count + 1)
+            }
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/ingest")
+async def ingest_status():
+    """Summary of the ingest pipeline."""
+    pending = song_index.records(statuses=(STATUS_PENDING,))
+    return {
+        "queue_depth": ingest_queue.depth,
+        "workers": ingest_queue.max_workers,
+        "pending": [record["filename"] for record in pending]
+    }
+
+@app.post("/ingest/reanalyze")
+async def reanalyze_library(admin: User = Depends(require_admin)):
+    """Re-run tag extraction and audio analysis for the whole library; also fills in missing hashes (admins only)."""
+    error = decoder_error()
+    if error:
+        raise HTTPException(status_code=503, detail=f"Audio analysis unavailable: {error}")
+    queued = await run_in_threadpool(ingest_queue.reanalyze_all)
+    return {"queued": queued, "queue_depth": ingest_queue.depth}
+
+@app.get("/ingest/{filename}")
+async def ingest_job_status(filename: str):
+    """Ingest status for a single uploaded song."""
+    record = song_index.get(filename)
+    if not record:
+        raise HTTPException(status_code=404, detail="Song not found")
+    
+    return {
+        "filename": filename,
+        "status": record["status"],
+        "error": record.get("error"),
+        "queued_at": record.get("queued_at"),
+        "ingested_at": record.get("ingested_at")
+    }
+
 @app.post("/auth/token")
 async def get_upload_token():
     """Get a temporary token for file uploads."""
@@ -258,48 +497,97 @@ async def test_endpoint():
         }
     }
 
+def song_response(record: dict) -> dict:
+    """Public representation of a song record."""
+    metadata = {
+        "title": record.get("title", record["filename"]),
+        "filename": record["filename"],
+        "url": f"{BASE_URL}/songs/{record['filename']}",
+        "size": record["size"],
+        "duration": record.get("duration"),
+    }
+    for field in ("artist", "album", "bpm", "key", "camelot", "sha256"):
+        if record.get(field):
+            metadata[field] = record[field]
+    if record.get("waveform"):
+        metadata["waveform_url"] = f"{BASE_URL}/songs/{record['filename']}/waveform"
+    return metadata
+
 @app.get("/songs")
-async def list_songs():
-    """List all available songs with metadata."""
+async def list_songs(request: Request):
+    """List all available songs with metadata.
+
+    JSON is streamed record by record from the index, so memory use and
+    time to first byte don't grow with the library. Clients asking for
+    application/x-msgpack get a columnar catalogue with the URL prefix
+    factored out instead. Either is compressed with brotli or gzip when
+    accepted.
+    """
     try:
-        songs = []
-        for file_path in SONGS_DIR.glob("*.mp3"):
-            try:
-                audio = mutagen.File(file_path)
-                metadata = {
-                    "title": file_path.stem,
-                    "filename": file_path.name,
-                    "url": f"{BASE_URL}/songs/{file_path.name}",
-                    "size": file_path.stat().st_size,
-                    "duration": int(audio.info.length) if audio else None,
-                }
-                
-                # Extract ID3 tags if available
-                if hasattr(audio, "tags") and audio.tags:
-                    tags = audio.tags
-                    if "TIT2" in tags:  # Title
-                        metadata["title"] = str(tags["TIT2"])
-                    if "TPE1" in tags:  # Artist
-                        metadata["artist"] = str(tags["TPE1"])
-                    if "TALB" in tags:  # Album
-                        metadata["album"] = str(tags["TALB"])
-                
-                songs.append(metadata)
-            except Exception as e:
-                print(f"Error processing {file_path}: {e}")
-                # Include basic info even if metadata extraction fails
-                songs.append({
-                    "title": file_path.stem,
-                    "filename": file_path.name,
-                    "url": f"{BASE_URL}/songs/{file_path.name}",
-                    "size": file_path.stat().st_size,
-                })
+        media_type = negotiate_media_type(request.headers.get("accept"))
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        # The generation changes with every catalogue change on any worker
+        etag = f'W/"{song_index.generation}"'
+        headers = {"Vary": "Accept, Accept-Encoding", "ETag": etag}
+        if request.headers.get("if-none-match") == etag:
+            cache_hits.inc(1, "songs_etag")
+            return Response(status_code=304, headers=headers)
+        cache_misses.inc(1, "songs_etag")
         
-        return JSONResponse(content={"songs": songs})
+        if media_type == MEDIA_MSGPACK:
+            # Columns need every record, so this encoding is built in one go
+            with span("listing"):
+                body, encoding = compress(encode_columnar(song_index.records(), f"{BASE_URL}/songs/"), encoding)
+            if encoding:
+                headers["Content-Encoding"] = encoding
+            return Response(content=body, media_type=media_type, headers=headers)
+        
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        songs = (song_response(record) for record in song_index.iter_records())
+        return StreamingResponse(
+            _traced_stream(compress_stream(iter_json(songs), encoding), "listing"),
+            media_type=MEDIA_JSON,
+            headers=headers
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/songs/{filename}")
+def _traced_stream(chunks, name: str):
+    """Attribute the time spent producing a streamed body to one span."""
+    iterator = iter(chunks)
+    while True:
+        with span(name):
+            chunk = next(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+@app.get("/songs/search")
+async def search_songs(
+    q: str = "",
+    bpm_min: Optional[float] = None,
+    bpm_max: Optional[float] = None,
+    duration_min: Optional[float] = None,
+    duration_max: Optional[float] = None,
+    key: Optional[str] = None,
+    limit: int = 100,
+    offset: int = 0
+):
+    """Search titles, artists and albums (prefix and typo tolerant) with BPM, duration and key filters."""
+    filenames = search_index.search(
+        q,
+        ranges={"bpm": (bpm_min, bpm_max), "duration": (duration_min, duration_max)},
+        key=key
+    )
+    songs = []
+    for filename in filenames[offset:offset + limit]:
+        record = song_index.get(filename)
+        if record:
+            songs.append(song_response(record))
+    return {"total": len(filenames), "songs": songs}
+
+@app.get("/songs/{filename}", dependencies=[Depends(limit_downloads)])
 async def get_song(filename: str):
     """Stream a specific song file."""
     file_path = SONGS_DIR / filename
@@ -313,6 +601,44 @@ async def get_song(filename: str):
         headers={"Accept-Ranges": "bytes"}
     )
 
+@app.get("/songs/{filename}/waveform", dependencies=[Depends(limit_downloads)])
+async def get_waveform(request: Request, filename: str, level: Optional[int] = None):
+    """Serve precomputed waveform peaks for a song.
+
+    The binary format is documented in waveform.py; pass ``level`` to get a
+    single resolution (0 is finest) instead of all of them.
+    """
+    record = song_index.get(filename)
+    if not record or not record.get("waveform"):
+        raise HTTPException(status_code=404, detail="Waveform not available")
+    
+    # Peaks only change when the file is re-uploaded
+    etag = f'"{record["size"]}-{record["mtime"]}-{level if level is not None else "all"}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        cache_hits.inc(1, "waveform_etag")
+        return Response(status_code=304, headers=headers)
+    cache_misses.inc(1, "waveform_etag")
+    
+    try:
+        data = waveform_path(WAVEFORM_DIR, filename).read_bytes()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Waveform not available")
+    
+    if level is not None:
+        data = select_level(data, level)
+        if data is None:
+            raise HTTPException(status_code=400, detail="Invalid waveform level")
+    
+    return Response(content=data, media_type="application/octet-stream", headers=headers)
+
+@app.delete("/songs/{filename}")
+async def delete_song(filename: str, admin: User = Depends(require_admin)):
+    """Remove a song from the library (admins only)."""
+    if not await run_in_threadpool(ingest_queue.remove, filename):
+        raise HTTPException(status_code=404, detail="Song not found")
+    return {"filename": filename, "deleted": True}
+
 # Mount the static files
 try:
     static_dir = Path(__file__).parent / "static_web"
@@ -0,0 +1,264 @@
+import json
+import time
+import logging
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.engine import Engine
+
+from database import DBSong, DBCatalogueState
+
+logger = logging.getLogger(__name__)
+
+# Ingest states a song record moves through
+STATUS_PENDING = "pending"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+# Songs in these states count towards the library (and the free tier limit)
+LISTED_STATUSES = (STATUS_PENDING, STATUS_READY)
+
+# Removal markers only need to outlive the refresh interval of every worker
+TOMBSTONE_TTL = 3600
+
+songs_table = DBSong.__table__
+state_table = DBCatalogueState.__table__
+
+class MetadataIndex:
+    """In-memory song catalogue backed by the shared songs table.
+
+    Reads are served from memory. Every change is written through to the
+    database and bumps the catalogue generation; other worker processes
+    pick changes up with refresh(), which only fetches rows newer than the
+    generation they already hold.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.generation = 0
+        self._records: Dict[str, dict] = {}
+        # filename -> version of the newest change applied, including removals,
+        # so a refresh that read rows before this worker's own write can't undo it
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        # Running totals over listed songs, so health checks never scan anything
+        self.song_count = 0
+        self.total_bytes = 0
+        self.last_ingest_at: Optional[float] = None
+        self._listeners: List[Callable[[Optional[dict], Optional[dict]], None]] = []
+
+    def add_listener(self, listener: Callable[[Optional[dict], Optional[dict]], None]) -> None:
+        """Call ``listener(old, new)`` on every change; ``new`` is None on removal."""
+        self._listeners.append(listener)
+
+    def _account(self, old: Optional[dict], new: Optional[dict]) -> None:
+        """Update the running totals for one record change."""
+        for record, sign in ((old, -1), (new, 1)):
+            if record is not None and record.get("status") in LISTED_STATUSES:
+                self.song_count += sign
+                self.total_bytes += sign * (record.get("size") or 0)
+        if new is not None and new.get("ingested_at"):
+            self.last_ingest_at = max(self.last_ingest_at or 0, new["ingested_at"])
+
+    def _notify(self, old: Optional[dict], new: Optional[dict]) -> None:
+        self._account(old, new)
+        for listener in self._listeners:
+            try:
+                listener(old, new)
+            except Exception as e:
+                logger.error(f"Metadata index listener failed: {e}")
+
+    def load(self) -> None:
+        """Read the whole catalogue from the database."""
+        with self.engine.begin() as conn:
+            conn.execute(delete(songs_table).where(
+                songs_table.c.deleted.is_(True),
+                songs_table.c.updated_at < time.time() - TOMBSTONE_TTL
+            ))
+            generation = conn.execute(select(state_table.c.generation).where(state_table.c.id == 1)).scalar()
+            rows = conn.execute(
+                select(songs_table.c.filename, songs_table.c.record, songs_table.c.version, songs_table.c.deleted)
+            ).all()
+
+        with self._lock:
+            self._records = {row.filename: json.loads(row.record) for row in rows if not row.deleted}
+            self._versions = {row.filename: row.version for row in rows}
+            self.generation = generation or 0
+            self.song_count, self.total_bytes, self.last_ingest_at = 0, 0, None
+            for record in self._records.values():
+                self._account(None, record)
+        logger.info(f"Loaded metadata index with {len(self._records)} songs at generation {self.generation}")
+
+    def refresh(self) -> int:
+        """Apply changes made by other workers since the last load/refresh.
+
+        Returns the number of songs that changed.
+        """
+        changes = self._fetch_changes()
+        return self._apply_changes(*changes) if changes else 0
+
+    def _fetch_changes(self):
+        """(generation, rows changed since ours), or None if nothing changed."""
+        with self.engine.connect() as conn:
+            generation = conn.execute(select(state_table.c.generation).where(state_table.c.id == 1)).scalar()
+            if generation == self.generation:
+                return None
+            rows = conn.execute(
+                select(songs_table.c.filename, songs_table.c.record, songs_table.c.version, songs_table.c.deleted)
+                .where(songs_table.c.version > self.generation)
+            ).all()
+        return generation, rows
+
+    def _apply_changes(self, generation: int, rows) -> int:
+        """Apply fetched rows; anything older than what is already held is skipped.
+
+        The rows may have been read before this worker's own latest write,
+        so neither a record nor the generation ever moves backwards.
+        """
+        changed = 0
+        with self._lock:
+            for row in rows:
+                if row.version <= self._versions.get(row.filename, 0):
+                    continue
+                self._versions[row.filename] = row.version
+                old = self._records.get(row.filename)
+                if row.deleted:
+                    if old is not None:
+                        del self._records[row.filename]
+                        self._notify(old, None)
+                        changed += 1
+                    continue
+                record = json.loads(row.record)
+                if record != old:
+                    self._records[row.filename] = record
+                    self._notify(old, record)
+                    changed += 1
+            self.generation = max(self.generation, generation)
+        return changed
+
+    def _write(self, filename: str, record: Optional[dict]) -> int:
+        """Write one change through to the database; returns its new generation."""
+        with self.engine.begin() as conn:
+            generation = conn.execute(
+                update(state_table)
+                .where(state_table.c.id == 1)
+                .values(generation=state_table.c.generation + 1)
+                .returning(state_table.c.generation)
+            ).scalar()
+            conn.execute(delete(songs_table).where(songs_table.c.filename == filename))
+            conn.execute(insert(songs_table).values(
+                filename=filename,
+                status=record["status"] if record else "deleted",
+                record=json.dumps(record) if record else "{}",
+                version=generation,
+                deleted=record is None,
+                updated_at=time.time()
+            ))
+        return generation
+
+    def _advance(self, generation: int) -> None:
+        """Move to the generation of a change this worker just wrote; call with the lock held.
+
+        If other workers wrote in between, refresh first so their changes
+        aren't skipped by moving past them.
+        """
+        if generation == self.generation + 1:
+            self.generation = generation
+        elif generation > self.generation:
+            self.refresh()
+            self.generation = max(self.generation, generation)
+
+    def claim_reconcile(self, boot_id: str) -> bool:
+        """True for exactly one worker per server boot."""
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(state_table)
+                .where(state_table.c.id == 1, state_table.c.reconciled_by.is_distinct_from(boot_id))
+                .values(reconciled_by=boot_id)
+            )
+            return result.rowcount == 1
+
+    def get(self, filename: str) -> Optional[dict]:
+        """Return a copy of the record for a song, if indexed."""
+        with self._lock:
+            record = self._records.get(filename)
+            return dict(record) if record else None
+
+    def put(self, record: dict) -> dict:
+        """Insert or replace the record for ``record['filename']``."""
+        with self._lock:
+            generation = self._write(record["filename"], record)
+            self._versions[record["filename"]] = generation
+            old = self._records.get(record["filename"])
+            self._records[record["filename"]] = record
+            self._notify(old, record)
+            self._advance(generation)
+        return record
+
+    def update(self, filename: str, **fields) -> Optional[dict]:
+        """Merge fields into an existing record."""
+        with self._lock:
+            record = self._records.get(filename)
+            if record is None:
+                return None
+            record = {**record, **fields}
+            return self.put(record)
+
+    def remove(self, filename: str) -> Optional[dict]:
+        """Drop a song from the index."""
+        with self._lock:
+            record = self._records.get(filename)
+            if record is not None:
+                generation = self._write(filename, None)
+                self._versions[filename] = generation
+                del self._records[filename]
+                self._notify(record, None)
+                self._advance(generation)
+            return record
+
+    def records(self, statuses=LISTED_STATUSES) -> List[dict]:
+        """Snapshot of records in the given states, ordered by filename."""
+        with self._lock:
+            return [
+                record for _, record in sorted(self._records.items())
+                if statuses is None or record.get("status") in statuses
+            ]
+
+    def iter_records(self, statuses=LISTED_STATUSES) -> Iterator[dict]:
+        """Yield records one at a time, ordered by filename.
+
+        Only the filenames are snapshotted up front; each record is looked up
+        as it is consumed, so songs removed mid-iteration are skipped.
+        """
+        with self._lock:
+            filenames = sorted(self._records)
+        for filename in filenames:
+            record = self._records.get(filename)
+            if record is not None and (statuses is None or record.get("status") in statuses):
+                yield record
+
+    def count(self, statuses=LISTED_STATUSES) -> int:
+        """Number of songs in the given states, from this worker's copy."""
+        if statuses == LISTED_STATUSES:
+            return self.song_count
+        with self._lock:
+            return sum(1 for record in self._records.values() if record.get("status") in statuses)
+
+    def stats(self) -> dict:
+        """Library totals, maintained incrementally."""
+        return {
+            "songs_count": self.song_count,
+            "total_bytes": self.total_bytes,
+            "last_ingest_at": self.last_ingest_at,
+            "generation": self.generation
+        }
+
+    def shared_count(self, statuses=LISTED_STATUSES) -> int:
+        """Number of songs in the given states across all workers, from the database."""
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(func.count())
+                .select_from(songs_table)
+                .where(songs_table.c.deleted.is_(False), songs_table.c.status.in_(statuses))
+            ).scalar()
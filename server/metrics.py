@@ -0,0 +1,239 @@
+"""Prometheus-style metrics, rendered in the text exposition format at /metrics.
+
+Metrics live in the worker process that recorded them; under gunicorn
+each scrape sees one worker, identified by the ``worker`` label added to
+every sample.
+"""
+import os
+import time
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; spans cached catalogue hits up to slow uploads
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self, worker: str) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self, worker: str) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labels + ('worker',), values + (worker,))} {_format_value(value)}"
+            for values, value in items
+        ]
+
+class Gauge(Metric):
+    """Value read from a callback at scrape time, so nothing has to keep it updated."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], Optional[float]]):
+        super().__init__(name, help)
+        self.read = read
+
+    def samples(self, worker: str) -> List[str]:
+        value = self.read()
+        if value is None:
+            return []
+        return [f'{self.name}{{worker="{worker}"}} {_format_value(value)}']
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts incl. +Inf, sum)
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        """Context manager observing the elapsed time of its block."""
+        return _Timer(self, labels)
+
+    def samples(self, worker: str) -> List[str]:
+        with self._lock:
+            items = sorted((labels, (list(counts), total[0])) for labels, (counts, total) in self._series.items())
+        names = self.labels + ("worker",)
+        lines = []
+        for values, (counts, total) in items:
+            values = values + (worker,)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(names, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(names, values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(names, values)} {cumulative}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, read: Callable[[], Optional[float]]) -> Gauge:
+        return self.register(Gauge(name, help, read))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        worker = str(os.getpid())
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.samples(worker))
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# HTTP layer, recorded by MetricsMiddleware
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time from request start to the last response byte.",
+    ("method", "route", "status")
+)
+request_bytes = registry.counter("http_request_bytes_total", "Request body bytes received.", ("route",))
+response_bytes = registry.counter("http_response_bytes_total", "Response body bytes sent.", ("route",))
+
+# Uploads and ingest
+upload_bytes = registry.counter("upload_bytes_total", "Bytes of uploaded songs written to disk.")
+upload_duration = registry.histogram("upload_duration_seconds", "Time to receive and store one upload.")
+ingest_stage_duration = registry.histogram(
+    "ingest_stage_duration_seconds", "Time spent in each ingest stage, measured in the ingest worker.",
+    ("stage",)
+)
+ingest_results = registry.counter("ingest_results_total", "Finished ingest jobs by outcome.", ("status",))
+
+# Caches; hit ratio = hits / (hits + misses)
+cache_hits = registry.counter("cache_hits_total", "Requests answered from a cache.", ("cache",))
+cache_misses = registry.counter("cache_misses_total", "Requests that missed a cache.", ("cache",))
+
+# Rate limiting
+rate_limited = registry.counter("rate_limited_total", "Requests rejected with 429 by a rate limiter.", ("limiter",))
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request and counting body bytes.
+
+    Routes are labelled by their path template (``/songs/{filename}``) so
+    the number of series stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        received = 0
+        sent = 0
+        status_code = 500
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal sent, status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            route = _route_label(scope)
+            request_duration.observe(time.perf_counter() - start, scope["method"], route, str(status_code))
+            if received:
+                request_bytes.inc(received, route)
+            if sent:
+                response_bytes.inc(sent, route)
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    if scope.get("endpoint") is not None and scope.get("root_path"):
+        return scope["root_path"]  # Mounted app, e.g. /web
+    return "unmatched"
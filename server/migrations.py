@@ -0,0 +1,60 @@
+"""Versioned schema migrations.
+
+Each migration runs once, in order, inside its own transaction, and the
+applied version is recorded in the schema_version table. Add new
+migrations to the end of MIGRATIONS; never edit one that has shipped.
+
+    python migrations.py            # upgrade DATABASE_URL to the latest version
+"""
+import logging
+from typing import Callable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from database import Base, engine as default_engine
+from log_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+def _create_users(conn: Connection) -> None:
+    # checkfirst adopts databases created by the old import-time create_all
+    Base.metadata.tables["users"].create(conn, checkfirst=True)
+
+def _create_shared_state(conn: Connection) -> None:
+    for name in ("songs", "catalogue_state", "user_changes"):
+        Base.metadata.tables[name].create(conn, checkfirst=True)
+    conn.execute(text("INSERT INTO catalogue_state (id, generation) VALUES (1, 0)"))
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "create users table", _create_users),
+    (2, "create shared catalogue and user change tables", _create_shared_state),
+]
+
+def current_version(conn: Connection) -> int:
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+def run_migrations(engine: Engine = default_engine) -> int:
+    """Apply pending migrations; returns the resulting schema version."""
+    with engine.begin() as conn:
+        version = current_version(conn)
+
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as conn:
+            # Re-check inside the transaction in case another process got here first
+            if current_version(conn) >= number:
+                continue
+            logger.info(f"Applying migration {number}: {description}")
+            migrate(conn)
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": number})
+        version = number
+
+    return version
+
+if __name__ == "__main__":
+    setup_logging()
+    print(f"Database at schema version {run_migrations()}")
@@ -0,0 +1,97 @@
+"""Per-client token buckets for the song download endpoints.
+
+Each client (the signed-in user, else the remote address) has a bucket
+of DOWNLOAD_RATE_BURST requests refilled at DOWNLOAD_RATE_LIMIT requests
+per second. A request that finds the bucket empty gets 429 with
+Retry-After set to when the next token arrives, which the sync clients
+use to back off. Buckets are per worker process.
+
+Behind a reverse proxy (Render's router) every connection comes from the
+proxy, so with TRUSTED_PROXY_HOPS set the address is taken from
+X-Forwarded-For instead: the entry that many hops from the right, which
+is the one the outermost trusted proxy appended. Entries further left
+come from the client and can be forged.
+"""
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from auth import decode_token
+from metrics import rate_limited
+
+# Requests per second per client; 0 disables the limit
+DOWNLOAD_RATE_LIMIT = float(os.environ.get("DOWNLOAD_RATE_LIMIT", "20"))
+DOWNLOAD_RATE_BURST = int(os.environ.get("DOWNLOAD_RATE_BURST", "40"))
+RATE_LIMIT_CLIENTS = int(os.environ.get("RATE_LIMIT_CLIENTS", "10000"))
+# Reverse proxies in front of the server; Render has one
+TRUSTED_PROXY_HOPS = int(
+    os.environ.get("TRUSTED_PROXY_HOPS")
+    or ("1" if os.environ.get("RENDER", "false").lower() == "true" else "0")
+)
+
+class TokenBucketLimiter:
+    """Bounded LRU of client -> (tokens, last refill); idle clients are evicted first."""
+
+    def __init__(self, rate: float, burst: int, max_clients: int = RATE_LIMIT_CLIENTS):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, cost: float = 1) -> float:
+        """Take ``cost`` tokens; returns 0 if allowed, else seconds until enough have refilled."""
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+download_limiter = TokenBucketLimiter(DOWNLOAD_RATE_LIMIT, DOWNLOAD_RATE_BURST)
+
+def client_address(request: Request, hops: int = TRUSTED_PROXY_HOPS) -> str:
+    """The client's address as seen by the outermost of ``hops`` trusted proxies."""
+    if hops:
+        forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+        if forwarded:
+            return forwarded[-min(hops, len(forwarded))]
+    return request.client.host if request.client else "unknown"
+
+def client_key(request: Request) -> str:
+    """The bearer token's user when it verifies, otherwise the client address."""
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            subject: Optional[str] = decode_token(authorization[7:]).get("sub")
+            if subject:
+                return f"user:{subject}"
+        except HTTPException:
+            pass
+    return f"addr:{client_address(request)}"
+
+async def limit_downloads(request: Request) -> None:
+    """Dependency for download routes: 429 with Retry-After once a client's bucket is empty."""
+    wait = download_limiter.acquire(client_key(request))
+    if wait:
+        rate_limited.inc(1, "download")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many download requests",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
@@ -0,0 +1,170 @@
+import re
+import bisect
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from metadata_index import LISTED_STATUSES
+
+# Fields whose words are searchable
+TEXT_FIELDS = ("title", "artist", "album")
+# Numeric fields with range indexes
+RANGE_FIELDS = ("duration", "bpm")
+
+# Query terms shorter than this are matched exactly/by prefix only
+FUZZY_MIN_LENGTH = 4
+
+_WORD = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-folded word tokens."""
+    if text.isascii():
+        return _WORD.findall(text.lower())
+    folded = unicodedata.normalize("NFKD", text)
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return _WORD.findall(folded.lower())
+
+def _deletions(term: str) -> Set[str]:
+    """All strings one deletion away from ``term``, for edit-distance-1 lookup."""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+class SearchIndex:
+    """Inverted text index plus sorted range indexes over the song catalogue.
+
+    Kept current through MetadataIndex change notifications, so queries
+    never touch the disk or rescan the library.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Set[str]] = {}
+        self._doc_terms: Dict[str, Set[str]] = {}
+        # Sorted vocabulary for prefix scans
+        self._vocabulary: List[str] = []
+        # Single-deletion variant -> terms, for fuzzy matching
+        self._variants: Dict[str, Set[str]] = {}
+        # field -> sorted (value, filename) pairs
+        self._ranges: Dict[str, List[Tuple[float, str]]] = {field: [] for field in RANGE_FIELDS}
+        self._doc_values: Dict[str, Dict[str, float]] = {}
+        self._keys: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+
+    def rebuild(self, records: Iterable[dict]) -> None:
+        with self._lock:
+            self.__init__()
+            # Append unsorted, then sort once instead of paying for insort per record
+            for record in records:
+                self._add(record, bulk=True)
+            self._vocabulary.sort()
+            for pairs in self._ranges.values():
+                pairs.sort()
+
+    def on_change(self, old: Optional[dict], new: Optional[dict]) -> None:
+        """MetadataIndex listener: apply one record change."""
+        with self._lock:
+            if old is not None:
+                self._remove(old["filename"])
+            if new is not None and new.get("status") in LISTED_STATUSES:
+                self._add(new)
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def _add(self, record: dict, bulk: bool = False) -> None:
+        filename = record["filename"]
+        terms = set()
+        for field in TEXT_FIELDS:
+            if record.get(field):
+                terms.update(tokenize(str(record[field])))
+
+        self._doc_terms[filename] = terms
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = set()
+                if bulk:
+                    self._vocabulary.append(term)
+                else:
+                    bisect.insort(self._vocabulary, term)
+                for variant in _deletions(term) | {term}:
+                    self._variants.setdefault(variant, set()).add(term)
+            postings.add(filename)
+
+        values = {}
+        for field in RANGE_FIELDS:
+            value = record.get(field)
+            if value is not None:
+                values[field] = value
+                if bulk:
+                    self._ranges[field].append((value, filename))
+                else:
+                    bisect.insort(self._ranges[field], (value, filename))
+        self._doc_values[filename] = values
+        self._keys[filename] = (record.get("key"), record.get("camelot"))
+
+    def _remove(self, filename: str) -> None:
+        for term in self._doc_terms.pop(filename, ()):
+            postings = self._postings[term]
+            postings.discard(filename)
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+                for variant in _deletions(term) | {term}:
+                    terms = self._variants[variant]
+                    terms.discard(term)
+                    if not terms:
+                        del self._variants[variant]
+
+        for field, value in self._doc_values.pop(filename, {}).items():
+            pairs = self._ranges[field]
+            index = bisect.bisect_left(pairs, (value, filename))
+            if index < len(pairs) and pairs[index] == (value, filename):
+                del pairs[index]
+        self._keys.pop(filename, None)
+
+    def _match_term(self, term: str) -> Set[str]:
+        """Songs containing a word that starts with ``term``, else within one edit of it."""
+        matches: Set[str] = set()
+        start = bisect.bisect_left(self._vocabulary, term)
+        for candidate in self._vocabulary[start:]:
+            if not candidate.startswith(term):
+                break
+            matches |= self._postings[candidate]
+
+        if not matches and len(term) >= FUZZY_MIN_LENGTH:
+            candidates: Set[str] = set()
+            for variant in _deletions(term) | {term}:
+                candidates |= self._variants.get(variant, set())
+            for candidate in candidates:
+                matches |= self._postings[candidate]
+        return matches
+
+    def _match_range(self, field: str, low: Optional[float], high: Optional[float]) -> Set[str]:
+        pairs = self._ranges[field]
+        start = 0 if low is None else bisect.bisect_left(pairs, low, key=lambda pair: pair[0])
+        end = len(pairs) if high is None else bisect.bisect_right(pairs, high, key=lambda pair: pair[0])
+        return {filename for _, filename in pairs[start:end]}
+
+    def search(self, query: str = "", ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+               key: Optional[str] = None) -> List[str]:
+        """Filenames matching every query word, range and key filter, sorted by filename."""
+        with self._lock:
+            candidate_sets = [self._match_term(term) for term in tokenize(query)]
+            for field, (low, high) in (ranges or {}).items():
+                if low is not None or high is not None:
+                    candidate_sets.append(self._match_range(field, low, high))
+
+            if candidate_sets:
+                candidate_sets.sort(key=len)
+                result = set(candidate_sets[0])
+                for other in candidate_sets[1:]:
+                    result &= other
+            else:
+                result = set(self._doc_terms)
+
+            if key:
+                wanted = key.strip().lower()
+                result = {
+                    filename for filename in result
+                    if wanted in (str(k).lower() for k in self._keys.get(filename, ()) if k)
+                }
+            return sorted(result)
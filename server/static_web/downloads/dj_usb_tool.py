@@ -5,17 +5,31 @@
 import os
 import sys
 import json
-import shutil
-import requests
 from pathlib import Path
 import time
 
+# package_tool.py ships the sync modules next to this script; from a
+# checkout they are in usb_app/
+try:
+    import sync_engine
+except ImportError:
+    sys.path.append(str(Path(__file__).resolve().parent.parent.parent.parent / "usb_app"))
+from catalogue_client import fetch_songs
+from sync_client import get_client
+from sync_engine import (SyncEngine, SyncJournal, JOURNAL_FILE, EVENT_DOWNLOADED, EVENT_FAILED, EVENT_REMOVED,
+                         scan_music)
+from progress import describe
+
 # Configuration
 SERVER_URL = "https://dj-usb-server-usb-mp3-app.onrender.com"
 USB_CONFIG_FILE = ".dj_usb_config.json"
 MUSIC_DIR = "Music"
 CACHE_DIR = ".cache"
 
+# Redraw a progress line in place only when a terminal is watching
+SHOW_PROGRESS = sys.stdout.isatty()
+CLEAR_LINE = "\r\033[K" if SHOW_PROGRESS else ""
+
 # Utility functions
 def get_usb_root():
     """Get the USB drive root directory (current directory)."""
@@ -52,42 +66,24 @@ def is_initialized(usb_path):
 def get_songs_from_server():
     """Get the list of songs from the server."""
     try:
-        response = requests.get(f"{SERVER_URL}/songs")
-        response.raise_for_status()
-        return response.json().get("songs", [])
+        return fetch_songs(SERVER_URL)
     except Exception as e:
         print(f"Error fetching songs: {e}")
         return []
 
-def download_song(song, usb_path):
-    """Download a song to the USB drive."""
-    try:
-        # Create cache directory if it doesn't exist
-        cache_dir = usb_path / CACHE_DIR
-        cache_dir.mkdir(exist_ok=True)
-        
-        # Download to cache first
-        cache_path = cache_dir / song["filename"]
-        
-        # Download the song
-        response = requests.get(song["url"], stream=True)
-        response.raise_for_status()
-        
-        with open(cache_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        # Copy to music directory
-        music_dir = usb_path / MUSIC_DIR
-        music_dir.mkdir(exist_ok=True)
-        
-        shutil.copy2(cache_path, music_dir / song["filename"])
-        
-        print(f"Downloaded: {song['filename']}")
-        return True
-    except Exception as e:
-        print(f"Error downloading {song['filename']}: {e}")
-        return False
+def print_event(kind, filename, error):
+    """Print sync engine progress."""
+    if kind == EVENT_DOWNLOADED:
+        print(f"{CLEAR_LINE}Downloaded: {filename}")
+    elif kind == EVENT_REMOVED:
+        print(f"{CLEAR_LINE}Removed: {filename}")
+    elif kind == EVENT_FAILED:
+        print(f"{CLEAR_LINE}Error syncing {filename}: {error}")
+
+def print_progress(snapshot):
+    """Redraw the transfer progress line."""
+    line = f"{snapshot.files_done}/{snapshot.files_total} files  ·  {describe(snapshot)}"
+    print(f"{CLEAR_LINE}{line}", end="\n" if snapshot.finished else "", flush=True)
 
 def sync_usb(usb_path):
     """Sync the USB drive with the server."""
@@ -104,35 +100,17 @@ def sync_usb(usb_path):
     
     print(f"Found {len(songs)} songs on the server.")
     
-    # Get existing songs on USB
     music_dir = usb_path / MUSIC_DIR
-    existing_songs = set(file.name for file in music_dir.glob("*.mp3") if file.is_file())
-    
-    # Download new songs
-    new_songs = [song for song in songs if song["filename"] not in existing_songs]
-    removed_songs = [song for song in existing_songs if song not in set(s["filename"] for s in songs)]
+    engine = SyncEngine(get_client(SERVER_URL), music_dir, usb_path / CACHE_DIR,
+                        usb_path / CACHE_DIR / JOURNAL_FILE, on_event=print_event,
+                        on_progress=print_progress if SHOW_PROGRESS else None)
+    plan = engine.plan(songs)
     
     print(f"\nSyncing songs:")
-    print(f"- New songs to download: {len(new_songs)}")
-    print(f"- Songs to remove: {len(removed_songs)}")
+    print(f"- New songs to download: {len(plan.download)}")
+    print(f"- Songs to remove: {len(plan.remove)}")
     
-    # Download new songs
-    downloaded = 0
-    for song in new_songs:
-        success = download_song(song, usb_path)
-        if success:
-            downloaded += 1
-            # Add a small delay to avoid overwhelming the server
-            time.sleep(0.2)
-    
-    # Remove songs that are no longer on the server
-    removed = 0
-    for filename in removed_songs:
-        try:
-            (music_dir / filename).unlink()
-            removed += 1
-        except Exception as e:
-            print(f"Error removing {filename}: {e}")
+    result = engine.run(plan)
     
     # Update config with last sync time
     config_file = usb_path / USB_CONFIG_FILE
@@ -148,17 +126,17 @@ def sync_usb(usb_path):
         except Exception as e:
             print(f"Error updating config file: {e}")
     
-    print(f"\nSync complete. Added: {downloaded}, Removed: {removed}")
+    print(f"\nSync complete. Added: {len(result.added)}, Removed: {len(result.removed)}")
     
-    # List all songs
-    all_songs = list(music_dir.glob("*.mp3"))
+    # List all songs, from the manifest the engine just brought up to date
+    all_songs = sorted(engine.journal.tracks)
     print(f"Total songs on USB: {len(all_songs)}")
     
     # Show songs (max 10)
     if all_songs:
         print("\nSongs on USB:")
-        for song in sorted(all_songs)[:10]:
-            print(f"  {song.name}")
+        for song in all_songs[:10]:
+            print(f"  {song}")
         if len(all_songs) > 10:
             print(f"  ... and {len(all_songs) - 10} more")
 
@@ -197,16 +175,20 @@ def show_status(usb_path):
         else:
             print("Last sync: Never")
         
-        # Count songs
+        # Count songs in one directory scan; ✓ marks tracks unchanged since the last sync
         music_dir = usb_path / MUSIC_DIR
-        songs = list(music_dir.glob("*.mp3"))
+        present = scan_music(music_dir) if music_dir.exists() else {}
+        manifest = SyncJournal(usb_path / CACHE_DIR / JOURNAL_FILE).tracks
+        songs = sorted(present)
         print(f"\nTotal songs: {len(songs)}")
         
         # Show songs (max 10)
         if songs:
             print("\nSongs:")
-            for song in sorted(songs)[:10]:
-                print(f"  [✓] {song.name}")
+            for song in songs[:10]:
+                entry = manifest.get(song)
+                synced = entry is not None and (entry["size"], entry["mtime_ns"]) == present[song]
+                print(f"  [{'✓' if synced else ' '}] {song}")
             if len(songs) > 10:
                 print(f"  ... and {len(songs) - 10} more")
         
@@ -0,0 +1,337 @@
+"""Sync engine shared by USBManager (the CLI), the GUI and dj_usb_tool.py.
+
+Diffs the server catalogue against the drive's music folder in one
+directory scan, downloads missing tracks concurrently into a staging
+folder on the same drive, renames each finished file into place (so the
+music folder never holds a partial track) and removes tracks the server
+no longer has. Every placement and removal is appended to an on-drive
+manifest (size, mtime and SHA-256 per track), so an interrupted sync
+knows what it already did and the next one only has to compare stat
+results to trust a track. Only tracks the manifest (or an older client's
+records) knows about are ever removed; other MP3s in the folder are the
+user's own and are left alone.
+
+Downloads are hashed as they stream and checked against the server's
+SHA-256. With verification on (SYNC_VERIFY, the default) each placed
+track is also read back from the drive by a background worker while the
+next downloads run, and dropped if the copy doesn't match.
+
+    SYNC_CONCURRENCY=8 python cli.py sync /Volumes/USB
+"""
+import os
+import json
+import time
+import hashlib
+import asyncio
+import logging
+from pathlib import Path
+from urllib.parse import quote
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sync_client import SyncClient
+from progress import ProgressCallback, ProgressTracker
+
+logger = logging.getLogger(__name__)
+
+# Upper bound; the client's adaptive limit decides how many actually run
+SYNC_CONCURRENCY = int(os.environ.get("SYNC_CONCURRENCY", "8"))
+SYNC_VERIFY = os.environ.get("SYNC_VERIFY", "true").lower() == "true"
+# Read-back runs one file at a time; parallel reads only make a stick seek
+VERIFY_WORKERS = 1
+JOURNAL_FILE = "sync_journal.jsonl"
+PART_SUFFIX = ".part"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Events passed to ``on_event(kind, filename, error)``
+EVENT_DOWNLOADING = "downloading"
+EVENT_DOWNLOADED = "downloaded"
+EVENT_FAILED = "failed"
+EVENT_REMOVED = "removed"
+
+def _drop_cached_pages(f) -> None:
+    """Make the next reads of ``f`` come from the device rather than the page cache; best effort."""
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)  # Evicts the pages fsync left clean
+        else:
+            import fcntl
+            if hasattr(fcntl, "F_NOCACHE"):
+                fcntl.fcntl(f.fileno(), fcntl.F_NOCACHE, 1)
+    except (ImportError, OSError):
+        pass
+
+def file_sha256(path: Path, uncached: bool = False) -> str:
+    """SHA-256 of a file; ``uncached`` reads what is actually stored on the device where the OS allows."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        if uncached:
+            _drop_cached_pages(f)
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def scan_music(music_dir: Path) -> Dict[str, Tuple[int, int]]:
+    """(size, mtime_ns) of the MP3s in a folder, from a single directory scan."""
+    with os.scandir(music_dir) as entries:
+        stats = {}
+        for entry in entries:
+            if entry.name.lower().endswith(".mp3") and entry.is_file():
+                stat = entry.stat()
+                stats[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return stats
+
+class SyncJournal:
+    """Append-only manifest of the tracks placed on the drive, one JSON object per line.
+
+    Each track has its size, mtime_ns and sha256 (None when it was adopted
+    from an older client without hashing). Replayed on load; compact()
+    rewrites it as one line per track. A torn last line from an
+    interrupted write is ignored.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.tracks: Dict[str, dict] = {}
+        self._file = None
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("op") == "remove":
+                        self.tracks.pop(entry["filename"], None)
+                    else:
+                        self.tracks[entry["filename"]] = {
+                            key: entry.get(key) for key in ("size", "mtime_ns", "sha256", "synced_at")
+                        }
+
+    def _append(self, entry: dict) -> None:
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def record(self, filename: str, size: Optional[int], mtime_ns: Optional[int] = None,
+               sha256: Optional[str] = None) -> None:
+        self.tracks[filename] = {"size": size, "mtime_ns": mtime_ns, "sha256": sha256, "synced_at": time.time()}
+        self._append({"op": "add", "filename": filename, **self.tracks[filename]})
+
+    def forget(self, filename: str) -> None:
+        if self.tracks.pop(filename, None) is not None:
+            self._append({"op": "remove", "filename": filename})
+
+    def compact(self) -> None:
+        """Rewrite the journal as one line per track and replace it atomically."""
+        self.close()
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for filename, entry in self.tracks.items():
+                f.write(json.dumps({"op": "add", "filename": filename, **entry}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+@dataclass
+class SyncPlan:
+    download: List[Dict]
+    remove: List[str]
+    unchanged: int
+
+    @property
+    def download_bytes(self) -> int:
+        return sum(song.get("size") or 0 for song in self.download)
+
+@dataclass
+class SyncResult:
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    cancelled: bool = False
+
+class SyncEngine:
+    """Mirrors the server catalogue into ``music_dir``.
+
+    ``staging_dir`` must be on the same filesystem as ``music_dir`` so
+    finished downloads can be renamed into place. ``legacy`` names tracks
+    an older client recorded as synced (USBManager's config.json); they
+    may be removed like manifest tracks.
+    """
+
+    def __init__(self, client: SyncClient, music_dir: Path, staging_dir: Path, journal_path: Path,
+                 concurrency: int = SYNC_CONCURRENCY,
+                 on_event: Optional[Callable[[str, str, Optional[str]], None]] = None,
+                 on_progress: Optional[ProgressCallback] = None, verify: bool = SYNC_VERIFY,
+                 legacy: Iterable[str] = ()):
+        self.client = client
+        self.music_dir = Path(music_dir)
+        self.staging_dir = Path(staging_dir)
+        self.music_dir.mkdir(parents=True, exist_ok=True)
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        self.journal = SyncJournal(journal_path)
+        self.concurrency = max(1, concurrency)
+        self.on_event = on_event
+        self.on_progress = on_progress
+        self.verify = verify
+        self.legacy = set(legacy)
+
+    def _emit(self, kind: str, filename: str, error: Optional[str] = None) -> None:
+        if self.on_event:
+            try:
+                self.on_event(kind, filename, error)
+            except Exception as e:
+                logger.error(f"Sync event handler failed: {e}")
+
+    def scan(self) -> Dict[str, Tuple[int, int]]:
+        return scan_music(self.music_dir)
+
+    def is_current(self, filename: str, stat: Tuple[int, int], expected_size: Optional[int],
+                   expected_sha256: Optional[str] = None) -> bool:
+        """Whether the file on the drive can stay, updating the manifest if it was touched.
+
+        Unchanged size and mtime trust the manifest without reading the
+        file; only a track whose mtime moved is re-hashed.
+        """
+        size, mtime_ns = stat
+        if expected_size is not None and size != expected_size:
+            return False
+        entry = self.journal.tracks.get(filename)
+        if entry and entry["sha256"] and expected_sha256 and entry["sha256"] != expected_sha256:
+            return False  # Replaced on the server with a file of the same size
+        if entry and entry["size"] == size and entry["mtime_ns"] == mtime_ns:
+            return True
+        if entry and entry["sha256"]:
+            if file_sha256(self.music_dir / filename) != entry["sha256"]:
+                return False
+            self.journal.record(filename, size, mtime_ns, entry["sha256"])
+            return True
+        self.journal.record(filename, size, mtime_ns)  # Placed by an older client
+        return True
+
+    def plan(self, songs: List[Dict]) -> SyncPlan:
+        """Work out what to download and remove from one scan of the music folder."""
+        present = self.scan()
+        server_names = set()
+        download = []
+        for song in songs:
+            filename = song["filename"]
+            server_names.add(filename)
+            stat = present.get(filename)
+            if stat is None or not self.is_current(filename, stat, song.get("size"), song.get("sha256")):
+                download.append(song)
+        remove = sorted(
+            name for name in present
+            if name not in server_names and (name in self.journal.tracks or name in self.legacy)
+        )
+        for filename in [name for name in self.journal.tracks if name not in server_names and name not in present]:
+            self.journal.forget(filename)
+        return SyncPlan(download, remove, len(songs) - len(download))
+
+    def run(self, plan: SyncPlan, should_stop: Optional[Callable[[], bool]] = None) -> SyncResult:
+        """Carry out a plan; blocks until every download has finished or been cancelled."""
+        should_stop = should_stop or (lambda: False)
+        result = SyncResult()
+        tracker = ProgressTracker(self.on_progress)
+        for song in plan.download:
+            tracker.add_file(song["filename"], song.get("size"))
+        for leftover in self.staging_dir.glob(f"*{PART_SUFFIX}"):
+            leftover.unlink(missing_ok=True)
+        try:
+            self.client.run(self._download_all(plan.download, should_stop, result, tracker))
+            for filename in plan.remove:
+                if should_stop():
+                    break
+                try:
+                    (self.music_dir / filename).unlink(missing_ok=True)
+                    self.journal.forget(filename)
+                    result.removed.append(filename)
+                    self._emit(EVENT_REMOVED, filename)
+                except OSError as e:
+                    result.failed[filename] = str(e)
+                    self._emit(EVENT_FAILED, filename, str(e))
+        finally:
+            result.cancelled = should_stop()
+            self.journal.compact()
+            tracker.close()
+        logger.info(f"Sync finished: {len(result.added)} added, {len(result.removed)} removed, "
+                    f"{len(result.failed)} failed{' (cancelled)' if result.cancelled else ''}")
+        return result
+
+    def sync(self, songs: List[Dict], should_stop: Optional[Callable[[], bool]] = None) -> SyncResult:
+        return self.run(self.plan(songs), should_stop)
+
+    async def _download_all(self, songs: List[Dict], should_stop: Callable[[], bool], result: SyncResult,
+                            tracker: ProgressTracker) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        verifier = asyncio.Semaphore(VERIFY_WORKERS)
+
+        async def fetch(song: Dict) -> None:
+            async with semaphore:
+                if should_stop():
+                    return
+                sha256 = await self._download(song, should_stop, result, tracker)
+            if sha256 and self.verify:
+                # Outside the download slot, so reading this track back overlaps the next downloads
+                async with verifier:
+                    if not should_stop():
+                        await self._verify(song["filename"], sha256, result)
+
+        await asyncio.gather(*(fetch(song) for song in songs))
+
+    async def _verify(self, filename: str, sha256: str, result: SyncResult) -> None:
+        """Read a placed track back from the drive; drop it if the copy doesn't match."""
+        path = self.music_dir / filename
+        try:
+            on_drive = await asyncio.to_thread(file_sha256, path, True)
+            if on_drive == sha256:
+                return
+            error = "copy on the drive doesn't match the download; it will be fetched again next sync"
+        except OSError as e:
+            error = f"could not read back the copy on the drive: {e}"
+        path.unlink(missing_ok=True)
+        self.journal.forget(filename)
+        result.added.remove(filename)
+        result.failed[filename] = f"Verification failed: {error}"
+        logger.error(f"Verification of {filename} failed: {error}")
+        self._emit(EVENT_FAILED, filename, result.failed[filename])
+
+    async def _download(self, song: Dict, should_stop: Callable[[], bool], result: SyncResult,
+                        tracker: ProgressTracker) -> Optional[str]:
+        """Download and place one track; returns its SHA-256 once it is in the music folder."""
+        filename = song["filename"]
+        url = f"/songs/{quote(filename)}"  # Relative to the client, whatever BASE_URL the server advertises
+        part_path = self.staging_dir / (filename + PART_SUFFIX)
+        self._emit(EVENT_DOWNLOADING, filename)
+        tracker.start(filename)
+        digests = []
+        try:
+            size = await self.client.download_async(url, part_path, should_stop, fsync=True,
+                                                    on_chunk=lambda n: tracker.advance(filename, n),
+                                                    expected_size=song.get("size"), on_digest=digests.append)
+            if size is None:
+                tracker.finish(filename, ok=False)
+                return None
+            sha256 = digests[0]
+            if song.get("sha256") and sha256 != song["sha256"]:
+                raise ValueError(f"Checksum mismatch: received {sha256[:12]}, server has {song['sha256'][:12]}")
+            await asyncio.to_thread(os.replace, part_path, self.music_dir / filename)
+            stat = await asyncio.to_thread(os.stat, self.music_dir / filename)
+            self.journal.record(filename, stat.st_size, stat.st_mtime_ns, sha256)
+            result.added.append(filename)
+            tracker.finish(filename)
+            self._emit(EVENT_DOWNLOADED, filename)
+            return sha256
+        except Exception as e:
+            part_path.unlink(missing_ok=True)
+            result.failed[filename] = str(e)
+            tracker.finish(filename, ok=False)
+            logger.error(f"Failed to download {filename}: {e}")
+            self._emit(EVENT_FAILED, filename, str(e))
+            return None
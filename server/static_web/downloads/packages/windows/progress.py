@@ -0,0 +1,171 @@
+"""Byte-level transfer progress for the sync front-ends.
+
+Download code calls ProgressTracker.advance() for every chunk; that is a
+few additions under a lock. Listeners receive a ProgressSnapshot (bytes
+done and total, smoothed rate, ETA, the files in flight) at most every
+``interval`` seconds, plus on every file state change, so a callback that
+redraws a window or prints a line costs nothing per chunk. Callbacks run
+on whichever thread reported the progress.
+"""
+import time
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+FILE_QUEUED = "queued"
+FILE_ACTIVE = "active"
+FILE_DONE = "done"
+FILE_FAILED = "failed"
+
+@dataclass(frozen=True)
+class FileProgress:
+    filename: str
+    state: str
+    bytes_done: int
+    bytes_total: Optional[int]
+
+@dataclass(frozen=True)
+class ProgressSnapshot:
+    bytes_done: int
+    bytes_total: int
+    files_done: int
+    files_total: int
+    rate: float  # bytes per second, smoothed
+    eta: Optional[float]  # seconds, None until a rate is known
+    elapsed: float
+    active: Dict[str, FileProgress]  # files being transferred right now
+    changed: Optional[FileProgress] = None  # set when a file changed state
+    finished: bool = False
+
+    @property
+    def fraction(self) -> float:
+        if self.bytes_total:
+            return min(1.0, self.bytes_done / self.bytes_total)
+        return self.files_done / self.files_total if self.files_total else 1.0
+
+ProgressCallback = Callable[[ProgressSnapshot], None]
+
+def format_bytes(size: float) -> str:
+    """Human readable size, e.g. 12.3 MB"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1000 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1000
+
+def format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def describe(snapshot: ProgressSnapshot) -> str:
+    """One-line summary: 12.3 MB of 450.0 MB  ·  8.2 MB/s  ·  0:53 left"""
+    text = f"{format_bytes(snapshot.bytes_done)} of {format_bytes(snapshot.bytes_total)}"
+    if snapshot.rate > 0 and not snapshot.finished:
+        text += f"  ·  {format_bytes(snapshot.rate)}/s"
+        if snapshot.eta is not None:
+            text += f"  ·  {format_eta(snapshot.eta)} left"
+    return text
+
+class ProgressTracker:
+    """Aggregates per-chunk progress and hands coalesced snapshots to ``callback``."""
+
+    # Weight of the newest interval in the smoothed rate
+    RATE_SMOOTHING = 0.3
+
+    def __init__(self, callback: Optional[ProgressCallback] = None, interval: float = 0.25):
+        self.callback = callback
+        self.interval = interval
+        self._files: Dict[str, list] = {}  # filename -> [state, bytes_done, bytes_total]
+        self._active: Dict[str, list] = {}
+        self._bytes_done = 0
+        self._bytes_total = 0
+        self._files_done = 0
+        self._started = time.monotonic()
+        self._last_emit = 0.0
+        self._rate = 0.0
+        self._rate_sample = (self._started, 0)
+        self._lock = threading.Lock()
+
+    def add_file(self, filename: str, size: Optional[int]) -> None:
+        """Expect a file of ``size`` bytes (None when unknown)."""
+        with self._lock:
+            self._files[filename] = [FILE_QUEUED, 0, size]
+            self._bytes_total += size or 0
+
+    def start(self, filename: str) -> None:
+        self._set_state(filename, FILE_ACTIVE)
+
+    def advance(self, filename: str, size: int) -> None:
+        """Count ``size`` more bytes for ``filename``; negative when a restart discards data."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._files.get(filename)
+            if entry is None:
+                entry = self._files[filename] = self._active[filename] = [FILE_ACTIVE, 0, None]
+            entry[1] += size
+            self._bytes_done += size
+            if now - self._last_emit < self.interval:
+                return
+            snapshot = self._snapshot(now)
+        self._emit(snapshot)
+
+    def finish(self, filename: str, ok: bool = True) -> None:
+        """Mark a file done or failed; a failed file's bytes leave the totals."""
+        with self._lock:
+            entry = self._files.get(filename)
+            if entry is not None and not ok:
+                self._bytes_done -= entry[1]
+                self._bytes_total -= entry[2] or 0
+                entry[1] = 0
+        self._set_state(filename, FILE_DONE if ok else FILE_FAILED)
+
+    def close(self) -> ProgressSnapshot:
+        """Send and return the final snapshot."""
+        with self._lock:
+            snapshot = self._snapshot(time.monotonic(), finished=True)
+        self._emit(snapshot)
+        return snapshot
+
+    def snapshot(self) -> ProgressSnapshot:
+        with self._lock:
+            return self._snapshot(time.monotonic())
+
+    def _set_state(self, filename: str, state: str) -> None:
+        with self._lock:
+            entry = self._files.setdefault(filename, [FILE_QUEUED, 0, None])
+            if state in (FILE_DONE, FILE_FAILED) and entry[0] not in (FILE_DONE, FILE_FAILED):
+                self._files_done += 1
+            entry[0] = state
+            if state == FILE_ACTIVE:
+                self._active[filename] = entry
+            else:
+                self._active.pop(filename, None)
+            snapshot = self._snapshot(time.monotonic(), changed=FileProgress(filename, *entry))
+        self._emit(snapshot)
+
+    def _snapshot(self, now: float, changed: Optional[FileProgress] = None,
+                  finished: bool = False) -> ProgressSnapshot:
+        sampled_at, sampled_bytes = self._rate_sample
+        if now - sampled_at >= self.interval:
+            instant = max(0.0, (self._bytes_done - sampled_bytes) / (now - sampled_at))
+            self._rate = instant if not self._rate else self._rate + self.RATE_SMOOTHING * (instant - self._rate)
+            self._rate_sample = (now, self._bytes_done)
+        self._last_emit = now
+        remaining = max(0, self._bytes_total - self._bytes_done)
+        return ProgressSnapshot(
+            bytes_done=self._bytes_done,
+            bytes_total=self._bytes_total,
+            files_done=self._files_done,
+            files_total=len(self._files),
+            rate=self._rate,
+            eta=remaining / self._rate if self._rate > 0 else None,
+            elapsed=now - self._started,
+            active={name: FileProgress(name, *entry) for name, entry in self._active.items()},
+            changed=changed,
+            finished=finished,
+        )
+
+    def _emit(self, snapshot: ProgressSnapshot) -> None:
+        if self.callback:
+            self.callback(snapshot)
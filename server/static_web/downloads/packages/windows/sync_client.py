@@ -0,0 +1,415 @@
+"""Shared HTTP client for the sync front-ends (USBManager, VirtualDrive, the GUI, dj_usb_tool.py).
+
+One pooled httpx.AsyncClient (HTTP/2 when the h2 package is installed)
+runs on a background event loop, so every front-end in a process reuses
+the same connections. Blocking wrappers let synchronous code call it
+from any thread. Requests get timeouts and retry transient failures with
+jittered exponential backoff; downloads resume with a Range request and
+can share a bandwidth limit. Downloads are written in large block-aligned
+writes to a file preallocated to its expected size, which suits the
+FAT32/exFAT flash drives the tracks usually land on.
+
+    SYNC_BANDWIDTH_KBPS=2000 SYNC_RETRIES=5 python cli.py sync /Volumes/USB
+"""
+import os
+import sys
+import time
+import errno
+import ctypes
+import ctypes.util
+import random
+import hashlib
+import asyncio
+import logging
+import threading
+import importlib.util
+from pathlib import Path
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Union
+
+import httpx
+
+logger = logging.getLogger(__name__)
+# httpx logs every request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+SYNC_TIMEOUT = float(os.environ.get("SYNC_TIMEOUT", "30"))
+SYNC_CONNECT_TIMEOUT = float(os.environ.get("SYNC_CONNECT_TIMEOUT", "10"))
+SYNC_RETRIES = int(os.environ.get("SYNC_RETRIES", "3"))
+SYNC_MAX_CONNECTIONS = int(os.environ.get("SYNC_MAX_CONNECTIONS", "8"))
+# Shared by all downloads of a client; 0 is unlimited
+SYNC_BANDWIDTH_KBPS = float(os.environ.get("SYNC_BANDWIDTH_KBPS", "0"))
+# Downloads reach the disk in multiples of this block; 0 writes each network chunk as it arrives
+SYNC_WRITE_BLOCK_KB = int(os.environ.get("SYNC_WRITE_BLOCK_KB", "1024"))
+SYNC_PREALLOCATE = os.environ.get("SYNC_PREALLOCATE", "true").lower() == "true"
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_AFTER_MAX = 300.0
+CHUNK_SIZE = 64 * 1024
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# The server asking us to slow down
+OVERLOAD_STATUSES = {429, 503}
+# A response this many times slower than the smoothed baseline counts as congestion
+LATENCY_FACTOR = 3.0
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Reserve blocks without changing the file size. Linux only: glibc's
+# posix_fallocate() falls back to writing every block on filesystems without
+# fallocate (exFAT), and vfat zero-fills when the size grows.
+FALLOC_FL_KEEP_SIZE = 0x01
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True) if sys.platform.startswith("linux") else None
+_fallocate = getattr(_libc, "fallocate", None)
+if _fallocate is not None:
+    _fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+
+class BandwidthLimiter:
+    """Token bucket in bytes per second, shared by concurrent downloads."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next_free = 0.0
+        self._lock = asyncio.Lock()
+
+    async def consume(self, size: int) -> None:
+        if not self.rate:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            self._next_free = max(self._next_free, now) + size / self.rate
+            wait = self._next_free - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+class AdaptiveConcurrency:
+    """AIMD limit on requests in flight, driven by the server's signals.
+
+    Each response that arrives close to the smoothed baseline latency
+    raises the limit by 1/limit (about one per round of requests). A 429
+    or 503, or a response LATENCY_FACTOR times slower than the baseline,
+    halves it, at most once per baseline period; Retry-After also holds
+    back every new request until it expires.
+    """
+
+    def __init__(self, maximum: int, initial: int = 2, minimum: int = 1):
+        self.maximum = max(minimum, maximum)
+        self.minimum = minimum
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        loop = asyncio.get_running_loop()
+        async with self._condition:
+            while True:
+                pause = self.paused_until - loop.time()
+                if pause > 0:
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), pause)
+                    except asyncio.TimeoutError:
+                        pass
+                elif self.in_flight < int(self.limit):
+                    break
+                else:
+                    await self._condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    async def observe(self, status: int, latency: float, retry_after: Optional[float] = None) -> None:
+        """Feed back one response: its status and time to headers."""
+        now = asyncio.get_running_loop().time()
+        async with self._condition:
+            congested = status in OVERLOAD_STATUSES or (
+                self.baseline is not None and latency > LATENCY_FACTOR * self.baseline)
+            if congested:
+                if now - self._last_decrease > (self.baseline or 0):
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+                    logger.info(f"Server signalled congestion (HTTP {status}, {latency * 1000:.0f} ms); "
+                                f"concurrency limit now {int(self.limit)}")
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            # Healthy samples move the baseline quickly, slow ones only drift it
+            if self.baseline is None:
+                self.baseline = latency
+            else:
+                weight = 0.05 if congested else 0.2
+                self.baseline += weight * (latency - self.baseline)
+            self._condition.notify_all()
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Retry-After as seconds (delta or HTTP date), capped at RETRY_AFTER_MAX."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(RETRY_AFTER_MAX, max(0.0, seconds))
+
+class BlockWriter:
+    """Collects downloaded chunks and writes them to ``f`` in whole blocks.
+
+    Every write except the final one starts and ends on a block boundary,
+    so flash media sees a few large aligned writes (and the FAT a few
+    cluster-chain updates) instead of one small write per network chunk.
+    With ``hash_name`` the data is hashed on the way out, in the same
+    worker thread as the write.
+    """
+
+    def __init__(self, f, block_size: int, hash_name: Optional[str] = None):
+        self.f = f
+        self.block_size = block_size
+        self.hash_name = hash_name
+        self.digest = hashlib.new(hash_name) if hash_name else None
+        self._buffer = bytearray()
+
+    def _write(self, data) -> None:
+        if self.digest is not None:
+            self.digest.update(data)
+        self.f.write(data)
+
+    async def write(self, chunk: bytes) -> None:
+        if not self.block_size:
+            await asyncio.to_thread(self._write, chunk)
+            return
+        self._buffer += chunk
+        if len(self._buffer) < self.block_size:
+            return
+        end = len(self._buffer) - len(self._buffer) % self.block_size
+        block, self._buffer = self._buffer, bytearray(self._buffer[end:])
+        del block[end:]
+        await asyncio.to_thread(self._write, block)
+
+    async def flush(self) -> None:
+        if self._buffer:
+            block, self._buffer = self._buffer, bytearray()
+            await asyncio.to_thread(self._write, block)
+
+    def discard(self) -> None:
+        """Forget the buffered data and the hash so far; the caller rewinds the file."""
+        self._buffer.clear()
+        if self.hash_name:
+            self.digest = hashlib.new(self.hash_name)
+
+def _preallocate(f, size: int) -> bool:
+    """Reserve ``size`` bytes for ``f`` so the filesystem allocates it in one go; best effort.
+
+    Skipped where the filesystem can't reserve space without writing it.
+    """
+    if not size or _fallocate is None:
+        return False
+    if _fallocate(f.fileno(), FALLOC_FL_KEEP_SIZE, 0, size) == 0:
+        return True
+    error = ctypes.get_errno()
+    if error not in (errno.EOPNOTSUPP, errno.ENOSYS):
+        logger.debug(f"Preallocating {size} bytes failed: {os.strerror(error)}")
+    return False
+
+def _flush_to_disk(f) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+
+def backoff_delay(attempt: int) -> float:
+    """Full jitter: uniform between 0 and the capped exponential delay."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+class SyncClient:
+    """Pooled async HTTP client on a private event loop thread.
+
+    The ``*_async`` methods are coroutines for that loop; the plain
+    methods block the calling thread until the request finishes.
+    """
+
+    def __init__(self, server_url: str, timeout: float = SYNC_TIMEOUT, retries: int = SYNC_RETRIES,
+                 max_connections: int = SYNC_MAX_CONNECTIONS, bandwidth_limit: Optional[float] = None,
+                 http2: Optional[bool] = None, write_block_size: int = SYNC_WRITE_BLOCK_KB * 1024,
+                 preallocate: bool = SYNC_PREALLOCATE):
+        self.server_url = server_url.rstrip('/')
+        self.retries = retries
+        self.write_block_size = write_block_size
+        self.preallocate = preallocate
+        if bandwidth_limit is None:
+            bandwidth_limit = SYNC_BANDWIDTH_KBPS * 1000
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="sync-client", daemon=True)
+        self._thread.start()
+
+        async def open_client() -> httpx.AsyncClient:
+            self.limiter = BandwidthLimiter(bandwidth_limit)
+            self.concurrency = AdaptiveConcurrency(max_connections)
+            return httpx.AsyncClient(
+                base_url=self.server_url,
+                http2=self.http2,
+                timeout=httpx.Timeout(timeout, connect=min(timeout, SYNC_CONNECT_TIMEOUT)),
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                follow_redirects=True,
+            )
+
+        self._client = self.run(open_client())
+        logger.debug(f"HTTP client for {self.server_url} (http2={self.http2}, {max_connections} connections)")
+
+    def run(self, coro):
+        """Run a coroutine on the client's loop and wait for its result."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("Blocking SyncClient call from its own event loop; await the *_async method")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def request_async(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request, retrying transport errors and retryable statuses."""
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            try:
+                async with self.concurrency.slot():
+                    start = time.monotonic()
+                    response = await self._client.request(method, url, **kwargs)
+                    retry_after = retry_after_seconds(response)
+                    await self.concurrency.observe(response.status_code, time.monotonic() - start, retry_after)
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+                reason = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise
+                reason = repr(e)
+            delay = max(backoff_delay(attempt), retry_after or 0)
+            logger.warning(f"{method} {url} failed ({reason}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def download_async(self, url: str, dest: Union[str, Path],
+                             should_stop: Optional[Callable[[], bool]] = None, fsync: bool = False,
+                             on_chunk: Optional[Callable[[int], None]] = None,
+                             expected_size: Optional[int] = None,
+                             on_digest: Optional[Callable[[str], None]] = None) -> Optional[int]:
+        """Stream ``url`` into ``dest``; returns the bytes written.
+
+        An interrupted transfer resumes from where it stopped when the
+        server answers the Range request with 206. Returns None, with the
+        partial file removed, when ``should_stop`` turns true. ``fsync``
+        flushes the file to disk (once) before returning. ``on_chunk`` gets
+        the size of every chunk received (negative when a restart discards
+        data). ``expected_size`` lets the file be preallocated. ``on_digest``
+        gets the SHA-256 of the body as received, before returning.
+        """
+        dest = Path(dest)
+        written = 0
+        f = await asyncio.to_thread(open, dest, 'wb')
+        writer = BlockWriter(f, self.write_block_size, "sha256" if on_digest else None)
+        try:
+            preallocated = self.preallocate and await asyncio.to_thread(_preallocate, f, expected_size)
+            for attempt in range(self.retries + 1):
+                headers = {"Range": f"bytes={written}-"} if written else {}
+                retry_after = None
+                try:
+                    async with self.concurrency.slot():
+                        start = time.monotonic()
+                        async with self._client.stream("GET", url, headers=headers) as response:
+                            retry_after = retry_after_seconds(response)
+                            await self.concurrency.observe(
+                                response.status_code, time.monotonic() - start, retry_after)
+                            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                                raise httpx.HTTPStatusError(
+                                    f"HTTP {response.status_code}", request=response.request, response=response)
+                            response.raise_for_status()
+                            if written and response.status_code != 206:
+                                # Server ignored the Range header: start over
+                                writer.discard()
+                                await asyncio.to_thread(f.seek, 0)
+                                await asyncio.to_thread(f.truncate)
+                                if on_chunk:
+                                    on_chunk(-written)
+                                written = 0
+                            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                                if should_stop and should_stop():
+                                    f.close()
+                                    dest.unlink(missing_ok=True)
+                                    return None
+                                await self.limiter.consume(len(chunk))
+                                await writer.write(chunk)
+                                written += len(chunk)
+                                if on_chunk:
+                                    on_chunk(len(chunk))
+                    await writer.flush()
+                    if preallocated and written != expected_size:
+                        # Release blocks reserved past the end
+                        await asyncio.to_thread(f.truncate)
+                    if fsync:
+                        await asyncio.to_thread(_flush_to_disk, f)
+                    if on_digest:
+                        on_digest(writer.digest.hexdigest())
+                    return written
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    retryable = isinstance(e, httpx.TransportError) or e.response.status_code in RETRY_STATUSES
+                    if not retryable or attempt == self.retries:
+                        raise
+                    delay = max(backoff_delay(attempt), retry_after or 0)
+                    logger.warning(f"Download of {url} interrupted at {written} bytes ({e!r}); "
+                                   f"retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+        except BaseException:
+            f.close()
+            dest.unlink(missing_ok=True)
+            raise
+        finally:
+            f.close()
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return self.run(self.request_async(method, url, **kwargs))
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def download(self, url: str, dest: Union[str, Path],
+                 should_stop: Optional[Callable[[], bool]] = None, fsync: bool = False,
+                 on_chunk: Optional[Callable[[int], None]] = None,
+                 expected_size: Optional[int] = None,
+                 on_digest: Optional[Callable[[str], None]] = None) -> Optional[int]:
+        return self.run(self.download_async(url, dest, should_stop, fsync, on_chunk, expected_size, on_digest))
+
+    def close(self) -> None:
+        if not self._loop.is_running():
+            return
+        self.run(self._client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def __enter__(self) -> "SyncClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+_clients: Dict[str, SyncClient] = {}
+_clients_lock = threading.Lock()
+
+def get_client(server_url: str, **options) -> SyncClient:
+    """The process-wide client for ``server_url``, created on first use.
+
+    ``options`` only apply when the client is created.
+    """
+    key = server_url.rstrip('/')
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = SyncClient(key, **options)
+        return _clients[key]
@@ -0,0 +1,10 @@
+"""Point the server at a scratch songs directory and database before main is imported."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+_workdir = tempfile.mkdtemp()
+os.environ["SONGS_DIR"] = str(Path(_workdir) / "songs")
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(_workdir) / 'test.db'}"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
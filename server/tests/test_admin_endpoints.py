@@ -0,0 +1,58 @@
+"""Admin endpoints refuse upload tokens and non-admin accounts."""
+import pytest
+from fastapi.testclient import TestClient
+
+import auth
+import main
+from migrations import run_migrations
+
+run_migrations(main.engine)
+client = TestClient(main.app)
+
+def signup(email: str) -> dict:
+    response = client.post("/auth/signup", json={"email": email, "password": "secret-password"})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.fixture(scope="module")
+def accounts():
+    return {
+        "upload": {"Authorization": f"Bearer {client.post('/auth/token').json()['access_token']}"},
+        "user": signup("user@example.com"),
+        "admin": signup("admin@example.com"),
+    }
+
+@pytest.fixture(autouse=True)
+def admins(monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_EMAILS", {"admin@example.com"})
+
+def test_tracing_switch_needs_an_admin(accounts):
+    assert client.post("/debug/tracing", params={"enabled": "false"}).status_code in (401, 403)
+    assert client.post("/debug/tracing", params={"enabled": "false"}, headers=accounts["upload"]).status_code in (403, 404)
+    assert client.post("/debug/tracing", params={"enabled": "false"}, headers=accounts["user"]).status_code == 403
+    assert client.post("/debug/tracing", params={"enabled": "false"}, headers=accounts["admin"]).status_code == 200
+
+def test_admin_endpoints_are_off_without_admin_emails(accounts, monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_EMAILS", set())
+    assert client.post("/debug/tracing", params={"enabled": "false"}, headers=accounts["admin"]).status_code == 403
+
+def test_deleting_a_song_needs_an_admin(accounts):
+    main.song_index.put({"filename": "keep.mp3", "title": "keep", "size": 1, "mtime": 0, "status": "ready"})
+    for account in ("upload", "user"):
+        assert client.delete("/songs/keep.mp3", headers=accounts[account]).status_code in (403, 404)
+    assert main.song_index.get("keep.mp3") is not None
+    assert client.delete("/songs/keep.mp3", headers=accounts["admin"]).status_code == 200
+    assert main.song_index.get("keep.mp3") is None
+
+def test_reanalysing_the_library_needs_an_admin(accounts):
+    for account in ("upload", "user"):
+        assert client.post("/ingest/reanalyze", headers=accounts[account]).status_code in (403, 404)
+
+def test_tier_change_reaches_cached_tokens(accounts):
+    headers = signup("tiered@example.com")
+    assert client.get("/auth/me", headers=headers).json()["subscription_tier"] == "free"
+    assert client.put("/admin/users/tiered@example.com/tier", params={"tier": "pro"},
+                      headers=accounts["user"]).status_code == 403
+    response = client.put("/admin/users/tiered@example.com/tier", params={"tier": "pro"}, headers=accounts["admin"])
+    assert response.status_code == 200
+    assert client.get("/auth/me", headers=headers).json()["subscription_tier"] == "pro"
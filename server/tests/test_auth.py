@@ -0,0 +1,16 @@
+"""Token checks: cached claims and the staleness test for embedded user claims."""
+import auth
+
+def test_claims_from_the_same_second_as_a_change_are_stale(monkeypatch):
+    monkeypatch.setitem(auth._user_changed_at, "dj@example.com", 1000.5)
+    assert not auth._claims_current({"iat": 1000}, "dj@example.com")
+    assert auth._claims_current({"iat": 1001}, "dj@example.com")
+    assert auth._claims_current({"iat": 1000}, "other@example.com")
+
+def test_verified_tokens_are_decoded_once():
+    # A subject no other test uses, so the token can't already be cached
+    token = auth.create_access_token({"sub": "decode_once_user"})
+    hits = auth.claims_cache.hits
+    assert auth.decode_token(token)["sub"] == "decode_once_user"
+    assert auth.decode_token(token)["sub"] == "decode_once_user"
+    assert auth.claims_cache.hits == hits + 1
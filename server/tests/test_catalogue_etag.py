@@ -0,0 +1,48 @@
+"""The /songs ETag must change as soon as this worker changes the catalogue."""
+from fastapi.testclient import TestClient
+
+import main
+from metadata_index import MetadataIndex, STATUS_READY
+from migrations import run_migrations
+
+run_migrations(main.engine)
+main.song_index.load()
+client = TestClient(main.app)
+
+def songs_etag() -> str:
+    response = client.get("/songs")
+    assert response.status_code == 200
+    return response.headers["etag"]
+
+def record(filename: str) -> dict:
+    return {"filename": filename, "title": filename, "size": 1, "mtime": 0, "status": STATUS_READY}
+
+def test_etag_changes_after_put_and_remove():
+    before = songs_etag()
+    main.song_index.put(record("put.mp3"))
+    after_put = songs_etag()
+    assert after_put != before
+    assert client.get("/songs", headers={"If-None-Match": before}).status_code == 200
+
+    main.song_index.remove("put.mp3")
+    assert songs_etag() not in (before, after_put)
+
+def test_write_after_another_workers_change_picks_it_up():
+    other = MetadataIndex(main.engine)
+    other.load()
+    other.put(record("other.mp3"))
+    main.song_index.put(record("mine.mp3"))
+    assert main.song_index.get("other.mp3") is not None
+    assert main.song_index.generation == other.generation + 1
+
+def test_refresh_read_before_own_write_does_not_go_back():
+    other = MetadataIndex(main.engine)
+    other.load()
+    other.put(record("race.mp3"))
+    stale = main.song_index._fetch_changes()  # The poll thread reads...
+    main.song_index.put({**record("race.mp3"), "title": "mine"})  # ...this worker writes...
+    generation, etag = main.song_index.generation, songs_etag()
+    main.song_index._apply_changes(*stale)  # ...then the poll thread applies what it read
+    assert main.song_index.generation == generation
+    assert main.song_index.get("race.mp3")["title"] == "mine"
+    assert songs_etag() == etag
@@ -0,0 +1,64 @@
+"""/songs content negotiation and the msgpack columnar catalogue."""
+import msgpack
+from fastapi.testclient import TestClient
+
+import main
+from catalogue import MEDIA_JSON, MEDIA_MSGPACK, negotiate_encoding, negotiate_media_type
+from metadata_index import STATUS_READY
+from migrations import run_migrations
+
+run_migrations(main.engine)
+main.song_index.load()
+client = TestClient(main.app)
+
+def test_media_type_follows_client_preference():
+    assert negotiate_media_type(None) == MEDIA_JSON
+    assert negotiate_media_type("*/*") == MEDIA_JSON
+    assert negotiate_media_type(MEDIA_MSGPACK) == MEDIA_MSGPACK
+    assert negotiate_media_type(f"{MEDIA_MSGPACK}, application/json;q=0.9") == MEDIA_MSGPACK
+    assert negotiate_media_type(f"{MEDIA_MSGPACK};q=0.5, application/json") == MEDIA_JSON
+    assert negotiate_media_type(f"{MEDIA_MSGPACK};q=0") == MEDIA_JSON
+
+def test_encoding_prefers_brotli_then_gzip():
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("gzip") == "gzip"
+    assert negotiate_encoding("gzip, br") == "br"
+    assert negotiate_encoding("br;q=0.1, gzip") == "gzip"
+    assert negotiate_encoding("identity") is None
+
+def expand(payload: dict) -> list:
+    """What the USB client does with a columnar catalogue (usb_app/catalogue_client.py)."""
+    columns = payload["columns"]
+    songs = []
+    for values in zip(*columns.values()):
+        song = {name: value for name, value in zip(columns, values) if value is not None}
+        song["url"] = payload["url_prefix"] + song["filename"]
+        if song.pop("waveform", False):
+            song["waveform_url"] = song["url"] + "/waveform"
+        songs.append(song)
+    return songs
+
+def test_msgpack_catalogue_round_trips_to_the_json_one():
+    for number in range(30):
+        main.song_index.put({
+            "filename": f"format-{number:02}.mp3", "title": f"Track {number}", "artist": "Someone",
+            "size": 1000 + number, "duration": 200 + number, "bpm": 120.5, "key": "A minor", "camelot": "8A",
+            "waveform": number % 2 == 0, "sha256": f"{number:064x}", "status": STATUS_READY,
+        })
+
+    as_json = client.get("/songs", headers={"Accept": MEDIA_JSON, "Accept-Encoding": "gzip"})
+    assert as_json.headers["content-type"].startswith(MEDIA_JSON)
+    assert as_json.headers["content-encoding"] == "gzip"
+
+    packed = client.get("/songs", headers={"Accept": MEDIA_MSGPACK, "Accept-Encoding": "identity"})
+    assert packed.headers["content-type"].startswith(MEDIA_MSGPACK)
+    assert "content-encoding" not in packed.headers
+    assert packed.headers["etag"] == as_json.headers["etag"]
+    assert "Accept" in packed.headers["vary"]
+
+    payload = msgpack.unpackb(packed.content)
+    assert payload["count"] == len(as_json.json()["songs"])
+    # JSON spells out a missing duration as null; the columns just leave it out
+    assert expand(payload) == [
+        {name: value for name, value in song.items() if value is not None} for song in as_json.json()["songs"]
+    ]
@@ -0,0 +1,46 @@
+"""Ingest failures: a bad upload is rejected, a crashed worker pool is not blamed on the file."""
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pytest
+
+from database import build_engine
+from ingest import IngestJob, IngestQueue, MAX_WORKER_CRASHES
+from metadata_index import MetadataIndex, STATUS_FAILED
+from migrations import run_migrations
+
+@pytest.fixture
+def queue(tmp_path: Path) -> IngestQueue:
+    engine = build_engine(f"sqlite:///{tmp_path / 'ingest.db'}")
+    run_migrations(engine)
+    index = MetadataIndex(engine)
+    index.load()
+    (tmp_path / "songs").mkdir()
+    return IngestQueue(index, tmp_path / "songs", tmp_path / "waveforms")
+
+def finish(queue: IngestQueue, filename: str, error: Exception) -> Path:
+    """Queue ``filename`` by hand and complete its job with ``error``."""
+    path = queue.songs_dir / filename
+    path.write_bytes(b"\xff\xfb" + bytes(1024))
+    queue.index.put({"filename": filename, "title": filename, "size": 1026, "mtime": 0, "status": "pending"})
+    job = IngestJob(path, hash_file=False, reanalyze=False, crashes=MAX_WORKER_CRASHES)
+    future = Future()
+    job.future, job.executor = future, object()  # A pool that has already been replaced
+    queue._jobs[filename] = job
+    future.set_exception(error)
+    queue._on_done(job, future)
+    return path
+
+def test_invalid_upload_is_deleted(queue):
+    path = finish(queue, "bad.mp3", ValueError("Invalid MP3 file"))
+    assert not path.exists()
+    assert queue.index.get("bad.mp3")["error"].startswith("Invalid MP3 file")
+
+def test_crashed_pool_keeps_the_upload(queue):
+    path = finish(queue, "good.mp3", BrokenProcessPool("A process in the process pool was terminated abruptly"))
+    assert path.exists()
+    record = queue.index.get("good.mp3")
+    assert record["status"] == STATUS_FAILED
+    assert "Invalid MP3" not in record["error"]
+    assert queue.depth == 0
@@ -0,0 +1,53 @@
+"""Download rate limiting: token buckets and the client address behind proxies."""
+import pytest
+from starlette.requests import Request
+
+import rate_limit
+from auth import create_access_token
+from rate_limit import TokenBucketLimiter, client_address, client_key
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+def test_bucket_allows_a_burst_then_waits_for_refill(clock):
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+    assert [limiter.acquire("a") for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("a") == pytest.approx(0.5)
+    assert limiter.acquire("b") == 0  # Buckets are per client
+    clock[0] += 0.5
+    assert limiter.acquire("a") == 0
+    clock[0] += 60
+    assert [limiter.acquire("a") for _ in range(4)][-1] > 0  # Refill stops at the burst size
+
+def test_zero_rate_disables_the_limit(clock):
+    limiter = TokenBucketLimiter(rate=0, burst=1)
+    assert all(limiter.acquire("a") == 0 for _ in range(100))
+
+def test_idle_clients_are_evicted_first(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=1, max_clients=2)
+    limiter.acquire("old")
+    limiter.acquire("busy")
+    limiter.acquire("new")
+    assert list(limiter._buckets) == ["busy", "new"]
+
+def request(forwarded=None, headers=(), host="10.0.0.1") -> Request:
+    raw = [(name.encode(), value.encode()) for name, value in headers]
+    if forwarded is not None:
+        raw.append((b"x-forwarded-for", forwarded.encode()))
+    return Request({"type": "http", "headers": raw, "client": (host, 1234)})
+
+def test_client_address_counts_trusted_hops_from_the_right():
+    assert client_address(request("6.6.6.6, 203.0.113.9"), hops=0) == "10.0.0.1"
+    assert client_address(request("6.6.6.6, 203.0.113.9"), hops=1) == "203.0.113.9"
+    assert client_address(request("203.0.113.9, 10.1.1.1"), hops=2) == "203.0.113.9"
+    assert client_address(request("203.0.113.9"), hops=3) == "203.0.113.9"
+    assert client_address(request(None), hops=1) == "10.0.0.1"
+    assert client_address(request(" , "), hops=1) == "10.0.0.1"
+
+def test_client_key_prefers_the_token_subject():
+    token = create_access_token({"sub": "dj@example.com"})
+    assert client_key(request(headers=[("authorization", f"Bearer {token}")])) == "user:dj@example.com"
+    assert client_key(request(headers=[("authorization", "Bearer not-a-token")])) == "addr:10.0.0.1"
@@ -0,0 +1,52 @@
+"""SearchIndex: word, prefix and typo matching, range filters and incremental updates."""
+import pytest
+
+from search_index import SearchIndex
+
+SONGS = [
+    {"filename": "a.mp3", "title": "Blue Monday", "artist": "New Order", "bpm": 130.0, "duration": 448,
+     "key": "D minor", "camelot": "7A", "status": "ready"},
+    {"filename": "b.mp3", "title": "Windowlicker", "artist": "Aphex Twin", "bpm": 125.0, "duration": 366,
+     "key": "A minor", "camelot": "8A", "status": "ready"},
+    {"filename": "c.mp3", "title": "Café del Mar", "artist": "Energy 52", "bpm": 133.5, "duration": 589,
+     "key": "A minor", "camelot": "8A", "status": "ready"},
+]
+
+@pytest.fixture
+def index() -> SearchIndex:
+    index = SearchIndex()
+    index.rebuild(SONGS)
+    return index
+
+def test_words_match_by_prefix_accents_and_one_typo(index):
+    assert index.search("blue monday") == ["a.mp3"]
+    assert index.search("wind") == ["b.mp3"]
+    assert index.search("cafe") == ["c.mp3"]
+    assert index.search("aphxe") == ["b.mp3"]  # Transposed letters share a deletion
+    assert index.search("aphqqx") == []  # Too far off
+    assert index.search("aphex twim") == ["b.mp3"]
+    assert index.search("order twin") == []
+
+def test_ranges_are_inclusive_and_combine_with_words(index):
+    assert index.search(ranges={"bpm": (125, 130)}) == ["a.mp3", "b.mp3"]
+    assert index.search(ranges={"bpm": (131, None)}) == ["c.mp3"]
+    assert index.search(ranges={"duration": (None, 400)}) == ["b.mp3"]
+    assert index.search("minor", ranges={"bpm": (None, None)}) == []
+    assert index.search(ranges={"bpm": (120, 140)}, key="8a") == ["b.mp3", "c.mp3"]
+    assert index.search(key="d minor") == ["a.mp3"]
+
+def test_changes_update_both_indexes(index):
+    old = SONGS[0]
+    new = {**old, "title": "True Faith", "bpm": 120.0}
+    index.on_change(old, new)
+    assert index.search("monday") == []
+    assert index.search("faith", ranges={"bpm": (119, 121)}) == ["a.mp3"]
+
+    index.on_change(new, None)
+    assert index.search("faith") == []
+    assert index.search(ranges={"bpm": (0, 200)}) == ["b.mp3", "c.mp3"]
+    assert len(index) == 2
+
+def test_unlisted_records_are_not_indexed(index):
+    index.on_change(None, {"filename": "d.mp3", "title": "Blue Lines", "status": "failed"})
+    assert index.search("blue") == ["a.mp3"]
@@ -0,0 +1,8 @@
+"""Modules shared with the USB client must match their source in usb_app."""
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+def test_log_setup_matches_usb_app():
+    # Run package_tool.py to refresh the copy after editing usb_app/log_setup.py
+    assert (ROOT_DIR / "server" / "log_setup.py").read_bytes() == (ROOT_DIR / "usb_app" / "log_setup.py").read_bytes()
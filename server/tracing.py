@@ -0,0 +1,235 @@
+"""Opt-in request tracing and slow-request profiling.
+
+With tracing on, every request collects timed spans (catalogue listing,
+disk writes, DB queries, JWT decoding, ...) that are returned in a
+Server-Timing header and logged when the request is slower than
+TRACE_SLOW_MS. With profiling on as well, a sampler thread records the
+stacks of every thread, and slow requests dump the samples taken while
+they ran to PROFILE_DIR in collapsed-stack format, ready for
+flamegraph.pl or speedscope.
+
+Both can be switched at runtime through POST /debug/tracing. Note that
+async handlers share the event loop thread, so a slow request's profile
+also contains whatever else the loop ran at the time.
+"""
+import os
+import sys
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACE_ENABLED = os.environ.get("TRACE_ENABLED", "false").lower() == "true"
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", "500"))
+PROFILE_ENABLED = os.environ.get("PROFILE_ENABLED", "false").lower() == "true"
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", "/tmp/dj-usb-profiles"))
+
+# Samples older than this can't belong to a request still in flight
+PROFILE_WINDOW_SECONDS = 120
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []  # (name, offset, duration)
+
+    def add(self, name: str, start: float, duration: float) -> None:
+        self.spans.append((name, start - self.start, duration))
+
+    def totals(self) -> Dict[str, Tuple[int, float]]:
+        """Span name -> (count, total seconds)."""
+        totals: Dict[str, Tuple[int, float]] = {}
+        for name, _, duration in self.spans:
+            count, total = totals.get(name, (0, 0.0))
+            totals[name] = (count + 1, total + duration)
+        return totals
+
+    def server_timing(self) -> str:
+        return ", ".join(
+            f"{name.replace(' ', '_')};dur={total * 1000:.2f}" + (f';desc="x{count}"' if count > 1 else "")
+            for name, (count, total) in self.totals().items()
+        )
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a block as part of the current request's trace; free when tracing is off."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter() - start)
+
+def log_job_timings(name: str, timings: Dict[str, float]) -> None:
+    """Log stage timings of background work (e.g. ingest) that has no request trace."""
+    total_ms = sum(timings.values()) * 1000
+    if TRACE_ENABLED and total_ms >= TRACE_SLOW_MS:
+        stages = ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in timings.items())
+        logger.warning(f"Slow job {name} took {total_ms:.1f}ms: {stages}")
+
+def instrument_engine(engine) -> None:
+    """Record a "db" span for every statement executed on a (sync) engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("trace_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("trace_start")
+        trace = _current.get()
+        if starts and trace is not None:
+            start = starts.pop()
+            trace.add("db", start, time.perf_counter() - start)
+
+class StackSampler:
+    """Background thread sampling every thread's stack at a fixed interval."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self._samples: Deque[Tuple[float, str]] = deque()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        logger.info(f"Stack sampler started at {self.interval * 1000:g} ms")
+
+    def stop(self) -> None:
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            with self._lock:
+                self._samples.clear()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            stacks = [_collapse(frame) for ident, frame in sys._current_frames().items() if ident != own]
+            with self._lock:
+                for stack in stacks:
+                    self._samples.append((now, stack))
+                while self._samples and self._samples[0][0] < now - PROFILE_WINDOW_SECONDS:
+                    self._samples.popleft()
+
+    def collapsed(self, start: float, end: float) -> Dict[str, int]:
+        """Collapsed stack -> sample count for samples taken between start and end."""
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for taken, stack in self._samples:
+                if start <= taken <= end:
+                    counts[stack] = counts.get(stack, 0) + 1
+        return counts
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+sampler = StackSampler()
+
+def configure(enabled: Optional[bool] = None, profile: Optional[bool] = None,
+              slow_ms: Optional[float] = None) -> dict:
+    """Change tracing settings at runtime; returns the current settings."""
+    global TRACE_ENABLED, PROFILE_ENABLED, TRACE_SLOW_MS
+    if enabled is not None:
+        TRACE_ENABLED = enabled
+    if profile is not None:
+        PROFILE_ENABLED = profile
+    if slow_ms is not None:
+        TRACE_SLOW_MS = slow_ms
+
+    if TRACE_ENABLED and PROFILE_ENABLED:
+        sampler.start()
+    else:
+        sampler.stop()
+    return settings()
+
+def settings() -> dict:
+    return {
+        "enabled": TRACE_ENABLED,
+        "profile": PROFILE_ENABLED,
+        "slow_ms": TRACE_SLOW_MS,
+        "profile_dir": str(PROFILE_DIR),
+        "pid": os.getpid()
+    }
+
+def _dump_profile(trace: Trace, end: float) -> Optional[Path]:
+    counts = sampler.collapsed(trace.start, end)
+    if not counts:
+        return None
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    label = trace.name.replace("/", "_").replace(" ", "").strip("_") or "root"
+    path = PROFILE_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{label}.folded"
+    path.write_text("".join(f"{stack} {count}\n" for stack, count in sorted(counts.items())))
+    return path
+
+class TracingMiddleware:
+    """ASGI middleware opening a trace per HTTP request while tracing is enabled."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACE_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope['method']} {scope['path']}")
+        token = _current.set(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and trace.spans:
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"server-timing", trace.server_timing().encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            end = time.perf_counter()
+            elapsed_ms = (end - trace.start) * 1000
+            if elapsed_ms >= TRACE_SLOW_MS:
+                spans = ", ".join(
+                    f"{name}={total * 1000:.1f}ms" + (f" (x{count})" if count > 1 else "")
+                    for name, (count, total) in trace.totals().items()
+                )
+                logger.warning(f"Slow request {trace.name} took {elapsed_ms:.1f}ms: {spans or 'no spans'}")
+                if sampler.running:
+                    path = _dump_profile(trace, end)
+                    if path:
+                        logger.warning(f"Profile for {trace.name} written to {path}")
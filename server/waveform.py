@@ -0,0 +1,87 @@
+import os
+import struct
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Waveform file layout (little-endian):
+#   header: magic "DJWF", version u8, level count u8, reserved u16,
+#           sample rate u32, total samples u32
+#   per level, finest first: samples per peak u32, peak count u32,
+#           then peak count (min, max) pairs of int8
+MAGIC = b"DJWF"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHII")
+LEVEL_HEADER = struct.Struct("<II")
+
+# Finest resolution and the zoom factor between successive levels
+BASE_SAMPLES_PER_PEAK = 256
+LEVEL_FACTOR = 4
+MAX_LEVELS = 4
+
+def compute_peaks(samples: np.ndarray, base: int = BASE_SAMPLES_PER_PEAK,
+                  factor: int = LEVEL_FACTOR, max_levels: int = MAX_LEVELS) -> List[Tuple[int, np.ndarray]]:
+    """Build (samples_per_peak, int8 min/max pairs) for each resolution level."""
+    # Pad to a whole number of buckets so every sample is covered
+    padded = -(-samples.size // base) * base
+    if padded != samples.size:
+        samples = np.pad(samples, (0, padded - samples.size))
+    buckets = samples.reshape(-1, base)
+    mins = buckets.min(axis=1)
+    maxs = buckets.max(axis=1)
+
+    levels = []
+    samples_per_peak = base
+    for _ in range(max_levels):
+        pairs = np.empty((mins.size, 2), dtype=np.int8)
+        pairs[:, 0] = np.clip(np.round(mins * 127), -127, 127)
+        pairs[:, 1] = np.clip(np.round(maxs * 127), -127, 127)
+        levels.append((samples_per_peak, pairs))
+
+        if mins.size < factor * 2:
+            break
+        # Coarser levels reduce the previous one rather than rescanning samples
+        usable = mins.size // factor * factor
+        mins = mins[:usable].reshape(-1, factor).min(axis=1)
+        maxs = maxs[:usable].reshape(-1, factor).max(axis=1)
+        samples_per_peak *= factor
+
+    return levels
+
+def encode(levels: List[Tuple[int, np.ndarray]], sample_rate: int, total_samples: int) -> bytes:
+    """Serialize peak levels into the waveform file format."""
+    parts = [HEADER.pack(MAGIC, VERSION, len(levels), 0, sample_rate, total_samples)]
+    for samples_per_peak, pairs in levels:
+        parts.append(LEVEL_HEADER.pack(samples_per_peak, len(pairs)))
+        parts.append(pairs.tobytes())
+    return b"".join(parts)
+
+def select_level(data: bytes, level: int) -> Optional[bytes]:
+    """Return a waveform file containing only one level, or None if out of range."""
+    magic, version, count, _, sample_rate, total_samples = HEADER.unpack_from(data)
+    if level < 0 or level >= count:
+        return None
+
+    offset = HEADER.size
+    for index in range(count):
+        samples_per_peak, peaks = LEVEL_HEADER.unpack_from(data, offset)
+        end = offset + LEVEL_HEADER.size + peaks * 2
+        if index == level:
+            header = HEADER.pack(magic, version, 1, 0, sample_rate, total_samples)
+            return header + data[offset:end]
+        offset = end
+    return None
+
+def waveform_path(waveform_dir: Path, filename: str) -> Path:
+    return Path(waveform_dir) / f"{filename}.wf"
+
+def write_waveform(samples: np.ndarray, sample_rate: int, dest: Path) -> int:
+    """Compute and atomically store the waveform for decoded samples."""
+    data = encode(compute_peaks(samples), sample_rate, samples.size)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, dest)
+    return len(data)
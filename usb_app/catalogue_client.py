@@ -0,0 +1,42 @@
+import logging
+from typing import Dict, List, Optional
+
+from sync_client import SyncClient, get_client
+
+try:
+    import msgpack
+except ImportError:  # Fall back to the JSON catalogue
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+MEDIA_MSGPACK = "application/x-msgpack"
+
+def expand_columnar(payload: Dict) -> List[Dict]:
+    """Turn the server's columnar catalogue back into per-song dicts."""
+    prefix = payload["url_prefix"]
+    columns = payload["columns"]
+    names = list(columns)
+
+    songs = []
+    for values in zip(*(columns[name] for name in names)):
+        song = {name: value for name, value in zip(names, values) if value is not None}
+        song["url"] = prefix + song["filename"]
+        if song.pop("waveform", False):
+            song["waveform_url"] = song["url"] + "/waveform"
+        songs.append(song)
+    return songs
+
+def fetch_songs(server_url: str, timeout: float = 10, client: Optional[SyncClient] = None) -> List[Dict]:
+    """Fetch the song catalogue, preferring the compact msgpack encoding.
+
+    httpx negotiates gzip (and brotli when installed) transparently.
+    """
+    client = client or get_client(server_url)
+    headers = {"Accept": f"{MEDIA_MSGPACK}, application/json;q=0.9" if msgpack else "application/json"}
+    response = client.get("/songs", headers=headers, timeout=timeout)
+    response.raise_for_status()
+
+    if response.headers.get("Content-Type", "").startswith(MEDIA_MSGPACK):
+        return expand_columnar(msgpack.unpackb(response.content))
+    return response.json()["songs"]
@@ -4,12 +4,11 @@ import click
 import logging
 from pathlib import Path
 from usb_manager import USBManager
+from progress import describe
+from log_setup import setup_logging
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 DEFAULT_SERVER = "https://dj-usb-server-usb-mp3-app.onrender.com"
@@ -37,6 +36,11 @@ def init(usb_path: str, server: str):
         logger.error(f"Failed to initialize drive: {e}")
         sys.exit(1)
 
+def print_progress(snapshot):
+    """Redraw a one-line progress display on stderr"""
+    line = f"{snapshot.files_done}/{snapshot.files_total} files  ·  {describe(snapshot)}"
+    click.echo(f"\r\033[K{line}", nl=snapshot.finished, err=True)
+
 @cli.command()
 @click.argument('usb_path', type=click.Path(exists=True))
 @click.option('--server', '-s', default=DEFAULT_SERVER,
@@ -45,7 +49,7 @@ def sync(usb_path: str, server: str):
     """Sync USB drive with server"""
     try:
         manager = USBManager(usb_path, server)
-        if manager.sync():
+        if manager.sync(on_progress=print_progress if sys.stderr.isatty() else None):
             songs = manager.get_song_list()
             click.echo(f"Successfully synced {len(songs)} songs")
             for song in songs:
@@ -1,13 +1,16 @@
 import sys
 import os
 import json
-import shutil
+import queue
 import threading
 import time
-import requests
 from pathlib import Path
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
+from catalogue_client import fetch_songs
+from sync_client import get_client
+from sync_engine import SyncEngine, JOURNAL_FILE, EVENT_DOWNLOADING, EVENT_DOWNLOADED, EVENT_FAILED, EVENT_REMOVED
+from progress import describe
 
 # Configuration
 SERVER_URL = "https://dj-usb-server-usb-mp3-app.onrender.com"
@@ -15,6 +18,10 @@ USB_CONFIG_FILE = ".dj_usb_config.json"
 MUSIC_DIR = "Music"
 CACHE_DIR = ".cache"
 
+# The sync thread only posts events; the Tk loop drains them this often, in batches
+UI_POLL_MS = 100
+UI_MAX_EVENTS = 1000
+
 class USBSyncApp:
     def __init__(self, root):
         self.root = root
@@ -39,8 +46,10 @@ class USBSyncApp:
         self.songs = []
         self.sync_thread = None
         self.stop_sync = False
+        self.events = queue.Queue()
         
         self.create_widgets()
+        self.root.after(UI_POLL_MS, self.drain_events)
         
         # Check for USB drives automatically
         self.refresh_drives()
@@ -87,7 +96,12 @@ class USBSyncApp:
         # Progress bar
         self.progress_var = tk.DoubleVar()
         self.progress_bar = ttk.Progressbar(main_frame, variable=self.progress_var, maximum=100)
-        self.progress_bar.pack(fill=tk.X, pady=10)
+        self.progress_bar.pack(fill=tk.X, pady=(10, 0))
+        
+        # Bytes transferred, throughput and ETA
+        self.rate_var = tk.StringVar()
+        rate_label = ttk.Label(main_frame, textvariable=self.rate_var, font=('Helvetica', 10))
+        rate_label.pack(anchor=tk.W, pady=(2, 10))
         
         # Action buttons frame
         button_frame = ttk.Frame(main_frame)
@@ -156,13 +170,52 @@ class USBSyncApp:
             self.drive_combo.current(0)
             self.log_status("No USB drives found. Please connect a USB drive and refresh.")
     
+    def post(self, kind, *args):
+        """Queue an event for the UI thread; safe to call from any thread"""
+        self.events.put((kind, args))
+    
     def log_status(self, message):
         """Add message to status text widget"""
+        self.post("log", message)
+    
+    def drain_events(self):
+        """Apply queued events in one batch: one text insert, one progress update"""
+        lines = []
+        snapshot = None
+        completed = None
+        for _ in range(UI_MAX_EVENTS):
+            try:
+                kind, args = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "log":
+                lines.append(args[0])
+            elif kind == "progress":
+                snapshot = args[0]  # Only the newest one matters
+            elif kind == "complete":
+                completed = args[0]
+                break
+        
+        if lines:
+            self.append_status(lines)
+        if snapshot is not None:
+            self.update_progress(snapshot)
+        if completed is not None:
+            self.on_sync_complete(completed)
+        
+        self.root.after(UI_POLL_MS, self.drain_events)
+    
+    def append_status(self, lines):
+        """Insert lines into the status text widget; UI thread only"""
         self.status_text.config(state=tk.NORMAL)
-        self.status_text.insert(tk.END, f"{message}\n")
+        self.status_text.insert(tk.END, "\n".join(lines) + "\n")
         self.status_text.see(tk.END)
         self.status_text.config(state=tk.DISABLED)
-        self.root.update_idletasks()
+    
+    def update_progress(self, snapshot):
+        """Progress bar, bytes transferred, rate and ETA from the latest snapshot"""
+        self.progress_var.set(snapshot.fraction * 100)
+        self.rate_var.set(describe(snapshot))
     
     def start_sync(self):
         """Start the sync process in a separate thread"""
@@ -180,6 +233,7 @@ class USBSyncApp:
         self.status_text.delete(1.0, tk.END)
         self.status_text.config(state=tk.DISABLED)
         self.progress_var.set(0)
+        self.rate_var.set("")
         
         # Disable sync button and enable stop button
         self.sync_button.config(state=tk.DISABLED)
@@ -217,98 +271,34 @@ class USBSyncApp:
             self.songs = songs
             self.log_status(f"Found {len(songs)} songs on the server.")
             
-            # Get existing songs on USB
             music_dir = self.usb_path / MUSIC_DIR
-            if not music_dir.exists():
-                music_dir.mkdir(parents=True, exist_ok=True)
-            
-            existing_songs = set(file.name for file in music_dir.glob("*.mp3") if file.is_file())
-            
-            # Find songs to download and remove
-            new_songs = [song for song in songs if song["filename"] not in existing_songs]
-            removed_songs = [song for song in existing_songs if song not in set(s["filename"] for s in songs)]
+            engine = SyncEngine(get_client(SERVER_URL), music_dir, self.usb_path / CACHE_DIR,
+                                self.usb_path / CACHE_DIR / JOURNAL_FILE, on_event=self.on_sync_event,
+                                on_progress=lambda snapshot: self.post("progress", snapshot))
+            plan = engine.plan(songs)
             
             self.log_status(f"\nSync summary:")
-            self.log_status(f"- New songs to download: {len(new_songs)}")
-            self.log_status(f"- Songs to remove: {len(removed_songs)}")
-            
-            # Download new songs
-            total_songs = len(new_songs) + len(removed_songs)
-            processed = 0
-            
-            # Create cache directory
-            cache_dir = self.usb_path / CACHE_DIR
-            cache_dir.mkdir(exist_ok=True)
+            self.log_status(f"- New songs to download: {len(plan.download)}")
+            self.log_status(f"- Songs to remove: {len(plan.remove)}")
             
-            # Download new songs
-            for i, song in enumerate(new_songs):
-                if self.stop_sync:
-                    self.log_status("Sync stopped by user.")
-                    self.sync_complete(False)
-                    return
-                
-                self.log_status(f"Downloading: {song['filename']} ({i+1}/{len(new_songs)})")
-                
-                try:
-                    # Download to cache first
-                    cache_path = cache_dir / song["filename"]
-                    
-                    # Download the song
-                    response = requests.get(song["url"], stream=True)
-                    response.raise_for_status()
-                    
-                    with open(cache_path, "wb") as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if self.stop_sync:
-                                break
-                            f.write(chunk)
-                    
-                    if self.stop_sync:
-                        continue
-                    
-                    # Copy to music directory
-                    shutil.copy2(cache_path, music_dir / song["filename"])
-                    
-                    self.log_status(f"✅ Downloaded: {song['filename']}")
-                except Exception as e:
-                    self.log_status(f"❌ Error downloading {song['filename']}: {e}")
-                
-                # Update progress
-                processed += 1
-                self.progress_var.set((processed / total_songs) * 100)
-                self.root.update_idletasks()
-                
-                # Add a small delay to avoid overwhelming the server
-                time.sleep(0.2)
-            
-            # Remove songs that are no longer on the server
-            for filename in removed_songs:
-                if self.stop_sync:
-                    break
-                
-                try:
-                    (music_dir / filename).unlink()
-                    self.log_status(f"Removed: {filename}")
-                except Exception as e:
-                    self.log_status(f"Error removing {filename}: {e}")
-                
-                # Update progress
-                processed += 1
-                self.progress_var.set((processed / total_songs) * 100)
-                self.root.update_idletasks()
+            result = engine.run(plan, should_stop=lambda: self.stop_sync)
+            if result.cancelled:
+                self.log_status("Sync stopped by user.")
+                self.sync_complete(False)
+                return
             
             # Update config with last sync time
             self.update_sync_time(self.usb_path)
             
-            # List all songs
-            all_songs = list(music_dir.glob("*.mp3"))
+            # List all songs, from the manifest the engine just brought up to date
+            all_songs = sorted(engine.journal.tracks)
             self.log_status(f"\nSync complete. Total songs on USB: {len(all_songs)}")
             
             # Show songs (max 10)
             if all_songs:
                 self.log_status("\nSongs on USB:")
-                for song in sorted(all_songs)[:10]:
-                    self.log_status(f"  {song.name}")
+                for song in all_songs[:10]:
+                    self.log_status(f"  {song}")
                 if len(all_songs) > 10:
                     self.log_status(f"  ... and {len(all_songs) - 10} more")
             
@@ -318,19 +308,34 @@ class USBSyncApp:
             self.log_status(f"Error during sync: {str(e)}")
             self.sync_complete(False)
     
+    def on_sync_event(self, kind, filename, error):
+        """Report sync engine progress"""
+        if kind == EVENT_DOWNLOADING:
+            self.log_status(f"Downloading: {filename}")
+        elif kind == EVENT_DOWNLOADED:
+            self.log_status(f"✅ Downloaded: {filename}")
+        elif kind == EVENT_REMOVED:
+            self.log_status(f"Removed: {filename}")
+        elif kind == EVENT_FAILED:
+            self.log_status(f"❌ Error syncing {filename}: {error}")
+    
     def sync_complete(self, success):
+        """Hand sync completion to the UI thread"""
+        self.post("complete", success)
+    
+    def on_sync_complete(self, success):
         """Handle sync completion"""
         # Re-enable sync button and disable stop button
         self.sync_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
         
         if success and not self.stop_sync:
-            self.log_status("\n✅ Sync completed successfully!")
+            self.append_status(["\n✅ Sync completed successfully!"])
             messagebox.showinfo("Sync Complete", "Your music has been synced to the USB drive successfully!")
         elif self.stop_sync:
-            self.log_status("\n⚠️ Sync was stopped by user.")
+            self.append_status(["\n⚠️ Sync was stopped by user."])
         else:
-            self.log_status("\n❌ Sync failed.")
+            self.append_status(["\n❌ Sync failed."])
     
     def is_initialized(self, usb_path):
         """Check if the USB drive is initialized"""
@@ -378,9 +383,7 @@ class USBSyncApp:
     def get_songs_from_server(self):
         """Get the list of songs from the server"""
         try:
-            response = requests.get(f"{SERVER_URL}/songs")
-            response.raise_for_status()
-            return response.json().get("songs", [])
+            return fetch_songs(SERVER_URL)
         except Exception as e:
             self.log_status(f"Error fetching songs: {e}")
             return []
@@ -0,0 +1,5 @@
+"""Make the usb_app modules importable the way the CLI runs them (from usb_app/)."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,153 @@
+"""SyncEngine planning, download verification and resuming from the journal."""
+import os
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import unquote
+
+import pytest
+
+from sync_engine import SyncEngine, SyncJournal, JOURNAL_FILE
+
+class FakeClient:
+    """Stands in for SyncClient: runs coroutines on a fresh loop and serves ``files`` by name."""
+
+    def __init__(self, files: Optional[Dict[str, bytes]] = None, corrupt: Iterable[str] = ()):
+        self.files = files or {}
+        # Hashed as sent but stored damaged, like a failing flash drive
+        self.corrupt = set(corrupt)
+        self.requested = []
+
+    def run(self, coro):
+        return asyncio.run(coro)
+
+    async def download_async(self, url, dest, should_stop=None, fsync=False, on_chunk=None,
+                             expected_size=None, on_digest=None):
+        filename = unquote(url.rsplit("/", 1)[-1])
+        self.requested.append(url)
+        data = self.files[filename]
+        Path(dest).write_bytes(data[:-1] + b"?" if filename in self.corrupt else data)
+        if on_chunk:
+            on_chunk(len(data))
+        if on_digest:
+            on_digest(hashlib.sha256(data).hexdigest())
+        return len(data)
+
+def song(filename: str, data: bytes = b"") -> dict:
+    return {"filename": filename, "size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+@pytest.fixture
+def drive(tmp_path: Path) -> Path:
+    (tmp_path / "Music").mkdir()
+    return tmp_path
+
+def make_engine(drive: Path, client=None, **kwargs) -> SyncEngine:
+    return SyncEngine(client or FakeClient(), drive / "Music", drive / ".cache", drive / ".cache" / JOURNAL_FILE, **kwargs)
+
+def put(drive: Path, filename: str, data: bytes) -> None:
+    (drive / "Music" / filename).write_bytes(data)
+
+def test_plan_downloads_missing_and_keeps_current_tracks(drive):
+    put(drive, "a.mp3", b"aaaa")
+    plan = make_engine(drive).plan([song("a.mp3", b"aaaa"), song("b.mp3", b"bb")])
+    assert [s["filename"] for s in plan.download] == ["b.mp3"]
+    assert plan.unchanged == 1
+    assert plan.remove == []
+
+def test_plan_only_removes_tracks_it_placed(drive):
+    put(drive, "synced.mp3", b"old")
+    put(drive, "legacy.mp3", b"old")
+    put(drive, "mine.mp3", b"users own")
+    engine = make_engine(drive, legacy=["legacy.mp3"])
+    engine.journal.record("synced.mp3", 3)
+    plan = engine.plan([])
+    assert plan.remove == ["legacy.mp3", "synced.mp3"]
+
+    engine.run(plan)
+    assert sorted(p.name for p in (drive / "Music").iterdir()) == ["mine.mp3"]
+
+def test_plan_replaces_tracks_whose_size_changed(drive):
+    put(drive, "a.mp3", b"short")
+    plan = make_engine(drive).plan([song("a.mp3", b"longer now")])
+    assert [s["filename"] for s in plan.download] == ["a.mp3"]
+
+def test_run_places_downloads_and_records_them(drive):
+    files = {"one.mp3": b"1" * 100, "two words.mp3": b"2" * 50}
+    client = FakeClient(files)
+    engine = make_engine(drive, client)
+    result = engine.sync([song(name, data) for name, data in files.items()])
+
+    assert sorted(result.added) == sorted(files) and not result.failed
+    assert "/songs/two%20words.mp3" in client.requested
+    for name, data in files.items():
+        assert (drive / "Music" / name).read_bytes() == data
+        assert engine.journal.tracks[name]["sha256"] == hashlib.sha256(data).hexdigest()
+    assert not list((drive / ".cache").glob("*.part"))
+
+def test_journal_replays_adds_and_removes_and_skips_a_torn_line(tmp_path):
+    path = tmp_path / JOURNAL_FILE
+    journal = SyncJournal(path)
+    journal.record("a.mp3", 4, 1, "aa")
+    journal.record("b.mp3", 5, 2, "bb")
+    journal.forget("a.mp3")
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "filename": "c.mp')  # Interrupted mid-write
+
+    resumed = SyncJournal(path)
+    assert list(resumed.tracks) == ["b.mp3"]
+    assert resumed.tracks["b.mp3"]["sha256"] == "bb"
+
+    resumed.compact()
+    assert len(path.read_text().splitlines()) == 1
+
+def test_resumed_sync_trusts_the_manifest_without_downloading_again(drive):
+    files = {"a.mp3": b"a" * 64, "b.mp3": b"b" * 64}
+    first = make_engine(drive, FakeClient({"a.mp3": files["a.mp3"]}))
+    first.sync([song("a.mp3", files["a.mp3"])])  # Interrupted before b.mp3
+    first.journal.close()
+
+    client = FakeClient(files)
+    engine = make_engine(drive, client)
+    plan = engine.plan([song(name, data) for name, data in files.items()])
+    assert [s["filename"] for s in plan.download] == ["b.mp3"]
+    engine.run(plan)
+    assert client.requested == ["/songs/b.mp3"]
+
+def test_touched_track_is_rehashed_and_replaced_if_it_changed(drive):
+    data = b"x" * 64
+    engine = make_engine(drive, FakeClient({"a.mp3": data}))
+    engine.sync([song("a.mp3", data)])
+
+    path = drive / "Music" / "a.mp3"
+    os.utime(path, ns=(0, 1))  # Same contents, new mtime: re-hashed and kept
+    assert engine.plan([song("a.mp3", data)]).download == []
+    assert engine.journal.tracks["a.mp3"]["mtime_ns"] == 1
+
+    path.write_bytes(b"y" * 64)  # Same size, different contents
+    os.utime(path, ns=(0, 2))
+    assert [s["filename"] for s in engine.plan([song("a.mp3", data)]).download] == ["a.mp3"]
+
+def test_verify_drops_a_copy_that_reads_back_wrong(drive):
+    files = {"good.mp3": b"g" * 64, "bad.mp3": b"b" * 64}
+    engine = make_engine(drive, FakeClient(files, corrupt=["bad.mp3"]), verify=True)
+    result = engine.sync([song(name, data) for name, data in files.items()])
+
+    assert result.added == ["good.mp3"]
+    assert result.failed["bad.mp3"].startswith("Verification failed")
+    assert not (drive / "Music" / "bad.mp3").exists()
+    assert "bad.mp3" not in engine.journal.tracks
+    assert [s["filename"] for s in engine.plan([song(n, d) for n, d in files.items()]).download] == ["bad.mp3"]
+
+def test_without_verify_a_damaged_copy_is_kept(drive):
+    data = b"b" * 64
+    engine = make_engine(drive, FakeClient({"bad.mp3": data}, corrupt=["bad.mp3"]), verify=False)
+    assert engine.sync([song("bad.mp3", data)]).added == ["bad.mp3"]
+
+def test_download_not_matching_the_server_hash_is_never_placed(drive):
+    engine = make_engine(drive, FakeClient({"a.mp3": b"what arrived"}))
+    result = engine.sync([{**song("a.mp3", b"what arrived"), "sha256": "0" * 64}])
+    assert "Checksum mismatch" in result.failed["a.mp3"]
+    assert not (drive / "Music" / "a.mp3").exists()
+    assert not list((drive / ".cache").glob("*.part"))
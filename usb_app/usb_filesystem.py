@@ -6,12 +6,8 @@ from pathlib import Path
 from typing import Dict, List, Optional
 from fuse import FUSE, FuseOSError, Operations
 from virtual_drive import VirtualDrive, SongMetadata
+from log_setup import setup_logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 class USBFileSystem(Operations):
@@ -140,6 +136,7 @@ def mount_usb_drive(mount_point: str, server_url: str, cache_dir: Optional[str]
     )
 
 if __name__ == "__main__":
+    setup_logging()
     if len(sys.argv) != 2:
         print(f"Usage: {sys.argv[0]} <mount_point>")
         sys.exit(1)
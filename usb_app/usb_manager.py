@@ -4,15 +4,20 @@ import shutil
 import logging
 from pathlib import Path
 from typing import List, Dict, Optional
-import requests
 from datetime import datetime
+from catalogue_client import fetch_songs
+from sync_client import SyncClient, get_client
+from sync_engine import SyncEngine, JOURNAL_FILE, EVENT_DOWNLOADED, EVENT_REMOVED
+from progress import ProgressCallback
+from log_setup import setup_logging
 
 class USBManager:
     """Manages a DJ USB drive with cloud sync capabilities."""
     
-    def __init__(self, usb_path: str, server_url: str):
+    def __init__(self, usb_path: str, server_url: str, client: Optional[SyncClient] = None):
         self.usb_path = Path(usb_path)
         self.server_url = server_url
+        self.client = client or get_client(server_url)
         self.music_dir = self.usb_path / "Music"
         self.app_dir = self.usb_path / ".dj-app"
         self.cache_dir = self.app_dir / "cache"
@@ -23,14 +28,7 @@ class USBManager:
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         
         # Initialize logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(self.app_dir / "sync.log"),
-                logging.StreamHandler()
-            ]
-        )
+        setup_logging(log_file=self.app_dir / "sync.log")
         self.logger = logging.getLogger("USBManager")
         
         # Load or create config
@@ -73,88 +71,47 @@ class USBManager:
             self.logger.error(f"Failed to initialize drive: {e}")
             return False
 
-    def sync(self) -> bool:
+    def sync(self, on_progress: Optional[ProgressCallback] = None) -> bool:
         """Synchronize with server, download new songs, remove deleted ones."""
         try:
             # Get server song list
-            response = requests.get(f"{self.server_url}/songs")
-            server_songs = response.json()['songs']
+            server_songs = fetch_songs(self.server_url, client=self.client)
             
-            # Track changes
-            new_songs = []
-            removed_songs = []
+            engine = SyncEngine(self.client, self.music_dir, self.cache_dir, self.app_dir / JOURNAL_FILE,
+                                on_event=self._log_event, on_progress=on_progress,
+                                legacy=self.config['songs'])
+            result = engine.sync(server_songs)
             
-            # Check for new or updated songs
+            # Mirror what is on the drive into the config, saved once per sync
+            on_drive = engine.journal.tracks
+            for filename in [name for name in self.config['songs'] if name not in on_drive]:
+                del self.config['songs'][filename]
             for song in server_songs:
-                if song['filename'] not in self.config['songs']:
-                    new_songs.append(song)
-                    
-            # Check for removed songs
-            local_songs = set(self.config['songs'].keys())
-            server_song_names = {s['filename'] for s in server_songs}
-            removed_songs = local_songs - server_song_names
-            
-            # Download new songs
-            for song in new_songs:
-                self._download_song(song)
-                
-            # Remove deleted songs
-            for filename in removed_songs:
-                self._remove_song(filename)
+                if song['filename'] in on_drive and song['filename'] not in self.config['songs']:
+                    self.config['songs'][song['filename']] = {
+                        'id': song.get('id'),
+                        'size': song.get('size'),
+                        'last_played': None,
+                        'cached': True
+                    }
             
             # Update last sync time
             self.config['last_sync'] = datetime.now().isoformat()
             self._save_config()
             
-            self.logger.info(f"Sync complete. Added: {len(new_songs)}, Removed: {len(removed_songs)}")
+            self.logger.info(f"Sync complete. Added: {len(result.added)}, Removed: {len(result.removed)}, "
+                             f"Failed: {len(result.failed)}")
             return True
             
         except Exception as e:
             self.logger.error(f"Sync failed: {e}")
             return False
 
-    def _download_song(self, song: Dict):
-        """Download a song from the server."""
-        try:
-            response = requests.get(
-                f"{self.server_url}/songs/{song['filename']}",
-                stream=True
-            )
-            response.raise_for_status()
-            
-            file_path = self.music_dir / song['filename']
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-                    
-            self.config['songs'][song['filename']] = {
-                'id': song.get('id'),
-                'size': song.get('size'),
-                'last_played': None,
-                'cached': True
-            }
-            self._save_config()
-            
-            self.logger.info(f"Downloaded: {song['filename']}")
-            
-        except Exception as e:
-            self.logger.error(f"Failed to download {song['filename']}: {e}")
-
-    def _remove_song(self, filename: str):
-        """Remove a song from the USB drive."""
-        try:
-            file_path = self.music_dir / filename
-            if file_path.exists():
-                file_path.unlink()
-            
-            if filename in self.config['songs']:
-                del self.config['songs'][filename]
-                self._save_config()
-                
+    def _log_event(self, kind: str, filename: str, error: Optional[str]):
+        if kind == EVENT_DOWNLOADED:
+            self.logger.info(f"Downloaded: {filename}")
+        elif kind == EVENT_REMOVED:
             self.logger.info(f"Removed: {filename}")
-            
-        except Exception as e:
-            self.logger.error(f"Failed to remove {filename}: {e}")
 
     def get_song_list(self) -> List[Dict]:
         """Get list of all songs on the drive."""
@@ -3,16 +3,16 @@ import sys
 import logging
 import tempfile
 from pathlib import Path
+from urllib.parse import quote
 from typing import Dict, List, Optional
-import requests
+import httpx
 import mutagen
 from dataclasses import dataclass
+from catalogue_client import fetch_songs
+from sync_client import SyncClient, get_client
+from progress import ProgressCallback, ProgressTracker
+from log_setup import setup_logging, ItemLog
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -25,13 +25,19 @@ class SongMetadata:
     duration: Optional[int] = None
     artist: Optional[str] = None
     album: Optional[str] = None
+    bpm: Optional[float] = None
+    key: Optional[str] = None
+    camelot: Optional[str] = None
     local_path: Optional[str] = None
 
 class VirtualDrive:
     """Manages a virtual USB drive that caches songs from the server."""
     
-    def __init__(self, server_url: str, cache_dir: Optional[str] = None):
+    def __init__(self, server_url: str, cache_dir: Optional[str] = None, client: Optional[SyncClient] = None,
+                 on_progress: Optional[ProgressCallback] = None):
         self.server_url = server_url.rstrip('/')
+        self.client = client or get_client(self.server_url)
+        self.on_progress = on_progress
         
         # Set up cache directory
         if cache_dir:
@@ -48,17 +54,13 @@ class VirtualDrive:
         """Fetch the current list of songs from the server."""
         try:
             logger.info(f"Fetching songs from {self.server_url}/songs")
-            response = requests.get(
-                f"{self.server_url}/songs",
-                timeout=10  # Add timeout
-            )
-            response.raise_for_status()
-            
-            songs_data = response.json()["songs"]
+            songs_data = fetch_songs(self.server_url, timeout=10, client=self.client)
             logger.info(f"Found {len(songs_data)} songs on server")
             
+            added = ItemLog(logger, "Added songs")
             for song_data in songs_data:
                 filename = song_data["filename"]
+                local_path = self._get_cached_path(filename)
                 self.songs[filename] = SongMetadata(
                     title=song_data.get("title", filename),
                     filename=filename,
@@ -67,12 +69,16 @@ class VirtualDrive:
                     duration=song_data.get("duration"),
                     artist=song_data.get("artist"),
                     album=song_data.get("album"),
-                    local_path=self._get_cached_path(filename)
+                    bpm=song_data.get("bpm"),
+                    key=song_data.get("key"),
+                    camelot=song_data.get("camelot"),
+                    local_path=local_path
                 )
-                logger.info(f"Added song: {filename} (cached: {bool(self._get_cached_path(filename))})")
-        except requests.Timeout:
+                added.add(filename, cached=bool(local_path))
+            added.done()
+        except httpx.TimeoutException:
             logger.error("Server connection timed out. Is the server running?")
-        except requests.ConnectionError:
+        except httpx.TransportError:
             logger.error("Could not connect to server. Check your internet connection.")
         except Exception as e:
             logger.error(f"Failed to refresh song list: {e}")
@@ -82,7 +88,7 @@ class VirtualDrive:
         cached_file = self.cache_dir / filename
         return str(cached_file) if cached_file.exists() else None
     
-    def download_song(self, filename: str) -> Optional[str]:
+    def download_song(self, filename: str, on_progress: Optional[ProgressCallback] = None) -> Optional[str]:
         """Download a song from the server and cache it locally."""
         if filename not in self.songs:
             logger.error(f"Song not found: {filename}")
@@ -95,14 +101,15 @@ class VirtualDrive:
             logger.info(f"Song already cached: {filename}")
             return str(cached_path)
             
+        tracker = ProgressTracker(on_progress or self.on_progress)
+        tracker.add_file(filename, song.size)
+        tracker.start(filename)
         try:
-            response = requests.get(song.url, stream=True)
-            response.raise_for_status()
-            
-            with open(cached_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            # Relative to the client, whatever BASE_URL the server advertises in song.url
+            self.client.download(f"/songs/{quote(filename)}", cached_path,
+                                 on_chunk=lambda n: tracker.advance(filename, n), expected_size=song.size)
+            tracker.finish(filename)
+            tracker.close()
             
             song.local_path = str(cached_path)
             logger.info(f"Downloaded and cached: {filename}")
@@ -110,6 +117,8 @@ class VirtualDrive:
             
         except Exception as e:
             logger.error(f"Failed to download {filename}: {e}")
+            tracker.finish(filename, ok=False)
+            tracker.close()
             if cached_path.exists():
                 cached_path.unlink()
             return None
@@ -139,6 +148,7 @@ class VirtualDrive:
             logger.error(f"Failed to clear cache: {e}")
 
 if __name__ == "__main__":
+    setup_logging()
     # Test the virtual drive
     drive = VirtualDrive("https://dj-usb-server-usb-mp3-app.onrender.com")
     print("\nAvailable songs:")